@@ -0,0 +1,103 @@
+"""
+Agent Approvals Module for PocketBizz
+Approves or rejects many pending agent orders in one database
+transaction: one conditional UPDATE ... RETURNING flips the status, the
+agent counter and monthly sales deltas are aggregated per agent, and the
+income transactions of approved orders go in with one bulk insert
+"""
+
+import logging
+from datetime import datetime
+
+from sqlalchemy import insert, select, update
+
+from app import db
+from models import Agent, AgentOrder, Transaction
+from agent_sales import apply_agent_sales_deltas, deltas_for_orders
+from rollups import apply_rollup_deltas, deltas_for_rows
+
+# Largest number of orders reviewed in one request
+MAX_BULK_ORDERS = 500
+
+REVIEW_ACTIONS = {'approve': 'approved', 'reject': 'rejected'}
+
+
+def _income_rows(orders):
+    """Transaction rows for approved orders, as approve_order creates them one at a time (in the order's tenant)"""
+    agent_ids = {order['agent_id'] for order in orders}
+    names = dict(db.session.execute(select(Agent.id, Agent.name).where(Agent.id.in_(agent_ids))).all())
+    return [
+        {
+            'tenant_id': order['tenant_id'],
+            'type': 'income',
+            'amount': order['total_amount'],
+            'description': f"Order dari {names.get(order['agent_id'], '')} - {order['customer_name']}"[:200],
+            'channel': 'agent',
+            'category': 'agent_sales',
+            'date': order['order_date'],
+        }
+        for order in orders
+    ]
+
+
+def review_agent_orders(order_ids, action, reviewer='Admin'):
+    """Approve or reject pending orders by id in one transaction.
+
+    Orders that are missing, belong to another business or are no longer
+    pending are skipped, so a repeated request never approves an order twice.
+    Returns {'action', 'processed': [ids], 'skipped': [ids], 'total_amount'}.
+    """
+    if action not in REVIEW_ACTIONS:
+        raise ValueError(f"action must be one of {', '.join(REVIEW_ACTIONS)}")
+    try:
+        order_ids = sorted({int(order_id) for order_id in order_ids})
+    except (TypeError, ValueError):
+        raise ValueError('order_ids must be a list of integers')
+    if not order_ids:
+        raise ValueError('order_ids is required')
+    if len(order_ids) > MAX_BULK_ORDERS:
+        raise ValueError(f'at most {MAX_BULK_ORDERS} orders per request')
+
+    # Set-based status change; the status condition makes concurrent reviews of the same order a no-op
+    result = db.session.execute(
+        update(AgentOrder).where(
+            AgentOrder.id.in_(order_ids),
+            AgentOrder.status == 'pending'
+        ).values(
+            status=REVIEW_ACTIONS[action],
+            approved_at=datetime.utcnow(),
+            approved_by=reviewer,
+            updated_at=datetime.utcnow()
+        ).returning(
+            AgentOrder.id,
+            AgentOrder.tenant_id,
+            AgentOrder.agent_id,
+            AgentOrder.order_date,
+            AgentOrder.total_amount,
+            AgentOrder.commission_amount,
+            AgentOrder.customer_name
+        ),
+        execution_options={'synchronize_session': False}
+    )
+    orders = [dict(row._mapping) for row in result]
+
+    if action == 'approve' and orders:
+        # Bulk writes skip the flush hooks: apply their aggregate deltas directly
+        connection = db.session.connection()
+        apply_agent_sales_deltas(connection, deltas_for_orders(orders))
+        rows = _income_rows(orders)
+        db.session.execute(insert(Transaction), rows)
+        apply_rollup_deltas(connection, deltas_for_rows(rows))
+    db.session.commit()
+
+    processed = sorted(order['id'] for order in orders)
+    processed_ids = set(processed)
+    skipped = [order_id for order_id in order_ids if order_id not in processed_ids]
+    total_amount = sum(order['total_amount'] or 0 for order in orders)
+    logging.info(f"✅ Bulk {action}: {len(processed)} agent orders (RM{total_amount:.2f}), {len(skipped)} skipped")
+    return {
+        'action': action,
+        'processed': processed,
+        'skipped': skipped,
+        'total_amount': total_amount,
+    }
@@ -0,0 +1,240 @@
+"""
+Agent Sales Module for PocketBizz
+Keeps AgentMonthlySales and the Agent.total_sales/total_commission counters
+in step with AgentOrder approvals: every flush that approves, rejects,
+edits or deletes an approved order applies its delta with SQL increments in
+the same transaction, and /api/agent_stats reads the monthly rows with one
+indexed query
+"""
+
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import event, func, inspect, select, update, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app import db
+from models import Agent, AgentOrder, AgentMonthlySales
+
+monthly_table = AgentMonthlySales.__table__
+order_table = AgentOrder.__table__
+agent_table = Agent.__table__
+
+# Key columns shared by the unique constraint and the upsert
+MONTHLY_KEY = ('tenant_id', 'agent_id', 'month')
+
+# Only approved orders count as agent sales
+COUNTED_STATUS = 'approved'
+
+
+def month_start(value):
+    """First day of the month of a date or datetime"""
+    return date(value.year, value.month, 1)
+
+
+def _new_deltas():
+    # (tenant, agent, month) -> [sales, commission, orders]
+    return defaultdict(lambda: [0.0, 0.0, 0])
+
+
+def _add_order(deltas, tenant_id, agent_id, order_date, total_amount, commission_amount, sign):
+    entry = deltas[(tenant_id or '', agent_id, month_start(order_date))]
+    entry[0] += sign * (total_amount or 0.0)
+    entry[1] += sign * (commission_amount or 0.0)
+    entry[2] += sign
+
+
+def deltas_for_orders(rows, sign=1):
+    """Build deltas from plain agent order rows/dicts (used by bulk writers that skip the flush hooks)"""
+    deltas = _new_deltas()
+    for row in rows:
+        _add_order(deltas, row['tenant_id'], row['agent_id'], row['order_date'],
+                   row['total_amount'], row['commission_amount'], sign)
+    return deltas
+
+
+def _upsert_statement(dialect_name):
+    """Dialect-specific INSERT ... ON CONFLICT that adds to existing totals"""
+    if dialect_name == 'postgresql':
+        stmt = postgresql.insert(monthly_table)
+    elif dialect_name == 'sqlite':
+        stmt = sqlite.insert(monthly_table)
+    else:
+        return None
+
+    return stmt.on_conflict_do_update(
+        index_elements=[monthly_table.c[name] for name in MONTHLY_KEY],
+        set_={
+            'total_sales': monthly_table.c.total_sales + stmt.excluded.total_sales,
+            'total_commission': monthly_table.c.total_commission + stmt.excluded.total_commission,
+            'order_count': monthly_table.c.order_count + stmt.excluded.order_count,
+            'updated_at': stmt.excluded.updated_at,
+        }
+    )
+
+
+def apply_agent_sales_deltas(connection, deltas):
+    """Add accumulated deltas to the monthly rows and the Agent counters (SQL-side, no read-modify-write)"""
+    deltas = {key: values for key, values in deltas.items() if any(values)}
+    if not deltas:
+        return
+
+    now = datetime.utcnow()
+    params = [
+        {
+            'tenant_id': key[0],
+            'agent_id': key[1],
+            'month': key[2],
+            'total_sales': sales,
+            'total_commission': commission,
+            'order_count': count,
+            'updated_at': now,
+        }
+        for key, (sales, commission, count) in deltas.items()
+    ]
+
+    stmt = _upsert_statement(connection.dialect.name)
+    if stmt is not None:
+        connection.execute(stmt, params)
+    else:
+        # Generic fallback: UPDATE first, INSERT the keys that did not exist yet
+        for values in params:
+            result = connection.execute(
+                update(monthly_table).where(
+                    *[monthly_table.c[name] == values[name] for name in MONTHLY_KEY]
+                ).values(
+                    total_sales=monthly_table.c.total_sales + values['total_sales'],
+                    total_commission=monthly_table.c.total_commission + values['total_commission'],
+                    order_count=monthly_table.c.order_count + values['order_count'],
+                    updated_at=now
+                )
+            )
+            if result.rowcount == 0:
+                connection.execute(insert(monthly_table), values)
+
+    per_agent = defaultdict(lambda: [0.0, 0.0])
+    for (_, agent_id, _), (sales, commission, _) in deltas.items():
+        per_agent[agent_id][0] += sales
+        per_agent[agent_id][1] += commission
+    for agent_id, (sales, commission) in per_agent.items():
+        connection.execute(
+            update(agent_table).where(agent_table.c.id == agent_id).values(
+                total_sales=func.coalesce(agent_table.c.total_sales, 0) + sales,
+                total_commission=func.coalesce(agent_table.c.total_commission, 0) + commission
+            )
+        )
+
+
+# === SESSION HOOKS ===
+
+@event.listens_for(Session, 'before_flush')
+def _capture_previous_orders(session, flush_context, instances):
+    """Remember committed values of agent orders about to change or go away"""
+    ids = []
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, AgentOrder):
+            identity = inspect(obj).identity
+            if identity:
+                ids.append(identity[0])
+
+    if not ids:
+        return
+
+    rows = session.connection().execute(
+        select(
+            order_table.c.id,
+            order_table.c.tenant_id,
+            order_table.c.agent_id,
+            order_table.c.order_date,
+            order_table.c.status,
+            order_table.c.total_amount,
+            order_table.c.commission_amount
+        ).where(order_table.c.id.in_(ids))
+    )
+    previous = session.info.setdefault('agent_sales_previous', {})
+    for row in rows:
+        previous[row.id] = row
+
+
+@event.listens_for(Session, 'after_flush')
+def _maintain_agent_sales(session, flush_context):
+    """Turn flushed AgentOrder approvals, reversals and deletes into aggregate deltas"""
+    previous = session.info.pop('agent_sales_previous', {})
+    deltas = _new_deltas()
+
+    for obj in session.new:
+        if isinstance(obj, AgentOrder) and obj.status == COUNTED_STATUS:
+            _add_order(deltas, obj.tenant_id, obj.agent_id, obj.order_date, obj.total_amount, obj.commission_amount, 1)
+
+    for obj in list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, AgentOrder):
+            continue
+        old = previous.get(inspect(obj).identity[0]) if inspect(obj).identity else None
+        if old is not None and old.status == COUNTED_STATUS:
+            _add_order(deltas, old.tenant_id, old.agent_id, old.order_date, old.total_amount, old.commission_amount, -1)
+        if obj not in session.deleted and obj.status == COUNTED_STATUS:
+            _add_order(deltas, obj.tenant_id, obj.agent_id, obj.order_date, obj.total_amount, obj.commission_amount, 1)
+
+    if deltas:
+        apply_agent_sales_deltas(session.connection(), deltas)
+
+
+# === READ HELPERS ===
+
+def agent_monthly_sales(agent_id, start_month, end_month):
+    """{month: (sales, commission, orders)} for months start_month..end_month inclusive"""
+    rows = db.session.execute(
+        select(
+            AgentMonthlySales.month,
+            AgentMonthlySales.total_sales,
+            AgentMonthlySales.total_commission,
+            AgentMonthlySales.order_count
+        ).where(
+            AgentMonthlySales.agent_id == agent_id,
+            AgentMonthlySales.month >= month_start(start_month),
+            AgentMonthlySales.month <= month_start(end_month)
+        )
+    ).all()
+    return {month: (float(sales or 0), float(commission or 0), int(count or 0))
+            for month, sales, commission, count in rows}
+
+
+# === REBUILD / BACKFILL ===
+
+def rebuild_agent_sales():
+    """Recompute the monthly rows and the Agent counters from approved orders"""
+    connection = db.session.connection()
+    connection.execute(monthly_table.delete())
+
+    deltas = _new_deltas()
+    rows = connection.execute(
+        select(
+            order_table.c.tenant_id,
+            order_table.c.agent_id,
+            order_table.c.order_date,
+            order_table.c.total_amount,
+            order_table.c.commission_amount
+        ).where(order_table.c.status == COUNTED_STATUS)
+    )
+    for row in rows:
+        _add_order(deltas, row.tenant_id, row.agent_id, row.order_date, row.total_amount, row.commission_amount, 1)
+
+    # Counters restart from zero and are then set from the same deltas
+    connection.execute(update(agent_table).values(total_sales=0.0, total_commission=0.0))
+    apply_agent_sales_deltas(connection, deltas)
+    db.session.commit()
+
+    logging.info(f"✅ Rebuilt {len(deltas)} agent monthly sales rows")
+    return len(deltas)
+
+
+@click.command('rebuild-agent-sales')
+@with_appcontext
+def rebuild_agent_sales_command():
+    """Rebuild agent monthly sales and agent totals from approved orders."""
+    count = rebuild_agent_sales()
+    click.echo(f'Rebuilt {count} agent monthly sales rows')
@@ -0,0 +1,201 @@
+"""
+Analytics Module for PocketBizz
+Channel performance, daily trends and the forecast behind
+/api/analytics, built from one grouped scan of the daily ledger rollup
+(at most days x types x channels rows) instead of loading every
+Transaction in the window. Includes a benchmark against the previous
+per-transaction implementation.
+"""
+
+import random
+from datetime import date, datetime, timedelta
+from time import perf_counter
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import case, func, insert, select
+
+from app import db
+from forecasting import revenue_forecast
+from models import Transaction, Product
+from rollups import apply_rollup_deltas, daily_channel_totals, deltas_for_rows
+from tenancy import stamp_rows, tenant_scope
+
+# Days covered by /api/analytics (growth compares with the same number of days before)
+ANALYTICS_DAYS = 30
+
+
+def _growth(current, previous):
+    if not previous:
+        return 0
+    return round((current - previous) * 100 / previous, 1)
+
+
+def analytics_summary(today=None, days=ANALYTICS_DAYS):
+    """Channel performance and daily trends for the last `days` days (today included), plus the forecast"""
+    today = today or date.today()
+    start = today - timedelta(days=days - 1)
+    previous_start = start - timedelta(days=days)
+
+    revenue = [0.0] * days
+    expenses = [0.0] * days
+    orders = [0] * days
+    channels = {}
+    previous_revenue = {}
+
+    for day, transaction_type, channel, total, count in daily_channel_totals(previous_start, today + timedelta(days=1)):
+        if day < start:
+            if transaction_type == 'income':
+                previous_revenue[channel] = previous_revenue.get(channel, 0.0) + total
+            continue
+
+        index = (day - start).days
+        if transaction_type == 'income':
+            revenue[index] += total
+            orders[index] += count
+            stats = channels.setdefault(channel, {'revenue': 0.0, 'orders': 0})
+            stats['revenue'] += total
+            stats['orders'] += count
+        elif transaction_type == 'expense':
+            expenses[index] += total
+
+    channel_performance = {
+        channel: {
+            'revenue': stats['revenue'],
+            'orders': stats['orders'],
+            'avgOrder': stats['revenue'] / stats['orders'] if stats['orders'] else 0,
+            'growth': _growth(stats['revenue'], previous_revenue.get(channel, 0.0)),
+        }
+        for channel, stats in channels.items()
+    }
+
+    daily_trends = [
+        {
+            'date': (start + timedelta(days=i)).strftime('%Y-%m-%d'),
+            'revenue': revenue[i],
+            'expenses': expenses[i],
+            'orders': orders[i],
+        }
+        for i in range(days)
+    ]
+
+    return {
+        'channelPerformance': channel_performance,
+        'dailyTrends': daily_trends,
+        'forecast': revenue_forecast(today),
+    }
+
+
+def top_products(limit=5):
+    """Products with the highest stock value at selling price"""
+    units = case((Product.current_stock > 0, Product.current_stock), else_=0)
+    value = func.coalesce(Product.selling_price, 0) * units
+    rows = db.session.execute(
+        select(Product.name, value, Product.current_stock).order_by(value.desc(), Product.id).limit(limit)
+    ).all()
+    return [{'name': name, 'revenue': float(revenue or 0), 'units': stock} for name, revenue, stock in rows]
+
+
+# === BENCHMARK ===
+
+def _previous_analytics():
+    """The per-transaction implementation /api/analytics used before, for comparison"""
+    thirty_days_ago = datetime.now() - timedelta(days=30)
+    transactions = Transaction.query.filter(Transaction.date >= thirty_days_ago).all()
+
+    channel_performance = {}
+    for transaction in transactions:
+        if transaction.type == 'income':
+            stats = channel_performance.setdefault(transaction.channel, {'revenue': 0, 'orders': 0})
+            stats['revenue'] += transaction.amount
+            stats['orders'] += 1
+
+    daily_trends = []
+    for i in range(30):
+        day = thirty_days_ago + timedelta(days=i)
+        daily_transactions = [t for t in transactions if t.date.date() == day.date()]
+        daily_trends.append({
+            'revenue': sum(t.amount for t in daily_transactions if t.type == 'income'),
+            'expenses': sum(t.amount for t in daily_transactions if t.type == 'expense'),
+            'orders': len([t for t in daily_transactions if t.type == 'income']),
+        })
+
+    revenue = sum(t.amount for t in transactions if t.type == 'income')
+    expenses = sum(t.amount for t in transactions if t.type == 'expense')
+    return {'channelPerformance': channel_performance, 'revenue': revenue, 'expenses': expenses}
+
+
+def _insert_sample_transactions(count, days=ANALYTICS_DAYS, batch_size=10000):
+    """Bulk insert `count` random transactions spread over the last `days` days"""
+    rng = random.Random(count)
+    noon = datetime.combine(date.today(), datetime.min.time()) + timedelta(hours=12)
+    channels = ('shopee', 'tiktok', 'walkin', 'agent')
+    for offset in range(0, count, batch_size):
+        rows = stamp_rows([
+            {
+                'type': 'income' if rng.random() < 0.8 else 'expense',
+                'amount': round(rng.uniform(5, 500), 2),
+                'description': 'bench',
+                'channel': channels[i % len(channels)],
+                'category': 'Online Sales',
+                'date': noon - timedelta(days=i % days),
+            }
+            for i in range(offset, min(offset + batch_size, count))
+        ])
+        db.session.execute(insert(Transaction), rows)
+        apply_rollup_deltas(db.session.connection(), deltas_for_rows(rows))
+    db.session.flush()
+
+
+def benchmark_analytics(row_counts, previous_max_rows=None):
+    """Time analytics_summary against the previous implementation at each row count.
+
+    Sample rows are written under a throwaway tenant inside a transaction that
+    is rolled back, so the database is left unchanged.
+    """
+    results = []
+    for count in row_counts:
+        with tenant_scope(f'bench-analytics-{count}'):
+            try:
+                _insert_sample_transactions(count)
+
+                started = perf_counter()
+                summary = analytics_summary()
+                rollup_seconds = perf_counter() - started
+
+                previous_seconds, matches = None, None
+                if previous_max_rows is None or count <= previous_max_rows:
+                    started = perf_counter()
+                    previous = _previous_analytics()
+                    previous_seconds = perf_counter() - started
+                    matches = all(
+                        abs(stats['revenue'] - previous['channelPerformance'].get(channel, {}).get('revenue', 0)) < 0.01
+                        and stats['orders'] == previous['channelPerformance'].get(channel, {}).get('orders')
+                        for channel, stats in summary['channelPerformance'].items()
+                    )
+            finally:
+                db.session.rollback()
+
+        results.append({
+            'rows': count,
+            'rollup_seconds': rollup_seconds,
+            'previous_seconds': previous_seconds,
+            'matches': matches,
+        })
+    return results
+
+
+@click.command('bench-analytics')
+@click.option('--rows', default='10000,100000,1000000', show_default=True, help='Comma-separated sample sizes.')
+@click.option('--previous-max-rows', default=None, type=int, help='Skip the previous implementation above this size.')
+@with_appcontext
+def bench_analytics_command(rows, previous_max_rows):
+    """Benchmark /api/analytics against the previous per-transaction implementation."""
+    row_counts = [int(value) for value in rows.split(',') if value.strip()]
+    for result in benchmark_analytics(row_counts, previous_max_rows):
+        line = f"{result['rows']:>9} rows  rollup {result['rollup_seconds'] * 1000:9.1f} ms"
+        if result['previous_seconds'] is not None:
+            speedup = result['previous_seconds'] / result['rollup_seconds'] if result['rollup_seconds'] else 0
+            line += (f"  previous {result['previous_seconds'] * 1000:10.1f} ms  x{speedup:,.0f}"
+                     f"  {'match' if result['matches'] else 'MISMATCH'}")
+        click.echo(line)
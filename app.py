@@ -35,19 +35,52 @@ def get_database_uri():
     return database_url or "sqlite:///accounting.db"
 
 app.config["SQLALCHEMY_DATABASE_URI"] = get_database_uri()
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+
+# Pool sizing and Supabase pooler mode from DB_POOL_* environment variables
+from db_pool import engine_options
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
+
+# Background PDF reports: 'pool' runs jobs in a process pool inside each web
+# worker, 'worker' leaves them for a separate `flask report-worker` process
+app.config["REPORT_JOB_MODE"] = os.environ.get("REPORT_JOB_MODE", "pool")
+app.config["REPORT_WORKER_PROCESSES"] = int(os.environ.get("REPORT_WORKER_PROCESSES", 2))
 
 # Initialize the app with the extension
 db.init_app(app)
 
+# Per-route latency / SQL instrumentation, exported on /metrics
+from perf_metrics import init_metrics
+init_metrics(app)
+
 with app.app_context():
     # Import models and views
     import models
+    import tenancy  # tenant scoping hooks, before any view queries
     import views
     
+    # Register maintenance commands
+    from rollups import rebuild_rollups_command
+    from query_plans import create_indexes_command, explain_reports_command
+    from stock_snapshots import snapshot_stock_command
+    from csv_import import backfill_order_ids_command
+    from report_jobs import report_worker_command
+    from tenancy import assign_tenant_command
+    from analytics import bench_analytics_command
+    from db_pool import loadtest_db_command
+    from agent_sales import rebuild_agent_sales_command
+    from receipt_parser import bench_receipts_command
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(create_indexes_command)
+    app.cli.add_command(explain_reports_command)
+    app.cli.add_command(snapshot_stock_command)
+    app.cli.add_command(backfill_order_ids_command)
+    app.cli.add_command(report_worker_command)
+    app.cli.add_command(assign_tenant_command)
+    app.cli.add_command(bench_analytics_command)
+    app.cli.add_command(loadtest_db_command)
+    app.cli.add_command(rebuild_agent_sales_command)
+    app.cli.add_command(bench_receipts_command)
+    
     # Import and register authentication routes
     from auth_routes import auth_bp
     app.register_blueprint(auth_bp)
@@ -5,7 +5,6 @@ REST API for dashboard data and analytics
 
 from flask import Blueprint, request, jsonify
 from datetime import datetime, timedelta
-from sqlalchemy import func
 import logging
 
 # Import from parent directory
@@ -14,11 +13,15 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from models import Transaction, BusinessSettings, Product
-from app import db
 from supabase_auth import get_current_user
+from rollups import daily_category_totals
+from breakdown_cache import period_breakdown
 
 dashboard_api_bp = Blueprint('dashboard_api', __name__)
 
+# Longest trend window served by /analytics
+MAX_ANALYTICS_DAYS = 365
+
 @dashboard_api_bp.route('/summary', methods=['GET'])
 def api_dashboard_summary():
     """API endpoint for dashboard summary data"""
@@ -30,31 +33,20 @@ def api_dashboard_summary():
         # Get today's date
         today = datetime.now().date()
         
-        # Calculate today's income and expenses
-        today_income = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.type == 'income',
-            func.date(Transaction.date) == today
-        ).scalar() or 0
-        
-        today_expenses = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.type == 'expense',
-            func.date(Transaction.date) == today
-        ).scalar() or 0
+        # Today's income and expenses (cached breakdown of the daily rollup)
+        today_totals = period_breakdown(today, today + timedelta(days=1))
+        today_income = today_totals['income']
+        today_expenses = today_totals['expense']
         
         today_profit = today_income - today_expenses
         
         # Get monthly data
         start_of_month = today.replace(day=1)
+        start_of_next_month = (start_of_month + timedelta(days=32)).replace(day=1)
         
-        monthly_income = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.type == 'income',
-            func.date(Transaction.date) >= start_of_month
-        ).scalar() or 0
-        
-        monthly_expenses = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.type == 'expense',
-            func.date(Transaction.date) >= start_of_month
-        ).scalar() or 0
+        monthly_totals = period_breakdown(start_of_month, start_of_next_month)
+        monthly_income = monthly_totals['income']
+        monthly_expenses = monthly_totals['expense']
         
         monthly_profit = monthly_income - monthly_expenses
         
@@ -73,13 +65,10 @@ def api_dashboard_summary():
         # Channel performance
         channels = ['shopee', 'tiktok', 'walkin', 'agent']
         channel_data = {}
+        channel_totals = monthly_totals['channels']
         
         for channel in channels:
-            channel_income = db.session.query(func.sum(Transaction.amount)).filter(
-                Transaction.type == 'income',
-                Transaction.channel == channel,
-                func.date(Transaction.date) >= start_of_month
-            ).scalar() or 0
+            channel_income = channel_totals.get(channel, 0)
             
             channel_data[channel] = {
                 'income': float(channel_income),
@@ -126,23 +115,29 @@ def api_dashboard_analytics():
         
         # Get date range from query params
         days = request.args.get('days', 7, type=int)
+        days = max(1, min(days, MAX_ANALYTICS_DAYS))
         end_date = datetime.now().date()
         start_date = end_date - timedelta(days=days-1)
         
-        # Daily income/expense trends
+        # One grouped scan covers both the daily trends and the top categories
+        rows = daily_category_totals(start_date, end_date + timedelta(days=1))
+        
+        daily_totals = {}
+        category_totals = {'income': {}, 'expense': {}}
+        for day, transaction_type, category, total in rows:
+            day_totals = daily_totals.setdefault(day, {'income': 0.0, 'expense': 0.0})
+            day_totals[transaction_type] = day_totals.get(transaction_type, 0.0) + total
+            
+            type_categories = category_totals.setdefault(transaction_type, {})
+            type_categories[category] = type_categories.get(category, 0.0) + total
+        
+        # Daily income/expense trends, zero-filled for days without transactions
         daily_data = []
         for i in range(days):
             current_date = start_date + timedelta(days=i)
-            
-            daily_income = db.session.query(func.sum(Transaction.amount)).filter(
-                Transaction.type == 'income',
-                func.date(Transaction.date) == current_date
-            ).scalar() or 0
-            
-            daily_expenses = db.session.query(func.sum(Transaction.amount)).filter(
-                Transaction.type == 'expense',
-                func.date(Transaction.date) == current_date
-            ).scalar() or 0
+            day_totals = daily_totals.get(current_date, {})
+            daily_income = day_totals.get('income', 0.0)
+            daily_expenses = day_totals.get('expense', 0.0)
             
             daily_data.append({
                 'date': current_date.isoformat(),
@@ -152,25 +147,12 @@ def api_dashboard_analytics():
             })
         
         # Top categories
-        top_income_categories = db.session.query(
-            Transaction.category,
-            func.sum(Transaction.amount).label('total')
-        ).filter(
-            Transaction.type == 'income',
-            func.date(Transaction.date) >= start_date
-        ).group_by(Transaction.category).order_by(
-            func.sum(Transaction.amount).desc()
-        ).limit(5).all()
-        
-        top_expense_categories = db.session.query(
-            Transaction.category,
-            func.sum(Transaction.amount).label('total')
-        ).filter(
-            Transaction.type == 'expense',
-            func.date(Transaction.date) >= start_date
-        ).group_by(Transaction.category).order_by(
-            func.sum(Transaction.amount).desc()
-        ).limit(5).all()
+        top_income_categories = sorted(
+            category_totals['income'].items(), key=lambda item: item[1], reverse=True
+        )[:5]
+        top_expense_categories = sorted(
+            category_totals['expense'].items(), key=lambda item: item[1], reverse=True
+        )[:5]
         
         return jsonify({
             'period': {
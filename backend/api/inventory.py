@@ -4,6 +4,7 @@ REST API for inventory and product management
 """
 
 from flask import Blueprint, request, jsonify
+from datetime import datetime
 import logging
 
 # Import from parent directory
@@ -14,6 +15,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from models import Product, StockMovement
 from app import db
 from supabase_auth import get_current_user
+from inventory_queries import product_summary_query, low_stock_products, stock_alert_settings
+from stock_snapshots import stock_value_at
 
 inventory_api_bp = Blueprint('inventory_api', __name__)
 
@@ -25,7 +28,8 @@ def api_get_products():
         if not user:
             return jsonify({'error': 'Authentication required'}), 401
         
-        products = Product.query.filter_by(is_active=True).all()
+        # Variant stock, low-stock flags and supplier names come back in the same query
+        products = db.session.execute(product_summary_query(Product.is_active == True)).all()
         
         return jsonify({
             'products': [
@@ -38,11 +42,13 @@ def api_get_products():
                     'selling_price': float(p.selling_price or 0),
                     'current_stock': p.current_stock,
                     'minimum_stock': p.minimum_stock,
+                    'total_stock': int(total_stock or 0),
                     'category': p.category,
                     'brand': p.brand,
-                    'is_low_stock': p.is_low_stock(),
+                    'supplier_name': supplier_name,
+                    'is_low_stock': bool(is_low_stock),
                     'created_at': p.created_at.isoformat()
-                } for p in products
+                } for p, supplier_name, is_low_stock, total_stock, _ in products
             ]
         }), 200
         
@@ -72,7 +78,7 @@ def api_create_product():
             cost_price=float(data.get('cost_price', 0)),
             selling_price=float(data.get('selling_price', 0)),
             current_stock=int(data.get('current_stock', 0)),
-            minimum_stock=int(data.get('minimum_stock', 10)),
+            minimum_stock=int(data['minimum_stock']) if data.get('minimum_stock') is not None else None,
             category=data.get('category'),
             brand=data.get('brand')
         )
@@ -104,25 +110,47 @@ def api_low_stock_alerts():
         if not user:
             return jsonify({'error': 'Authentication required'}), 401
         
-        low_stock_products = Product.query.filter(
-            Product.current_stock <= Product.minimum_stock,
-            Product.is_active == True
-        ).all()
+        # Shared low-stock rule: covers variant products and the business-wide threshold
+        alerts = low_stock_products()
+        threshold = stock_alert_settings()[1]
         
         return jsonify({
             'low_stock_products': [
                 {
-                    'id': p.id,
-                    'name': p.name,
-                    'sku': p.sku,
-                    'current_stock': p.current_stock,
-                    'minimum_stock': p.minimum_stock,
-                    'shortage': p.minimum_stock - p.current_stock
-                } for p in low_stock_products
+                    'id': p['id'],
+                    'name': p['name'],
+                    'sku': p['sku'],
+                    'has_variants': p['has_variants'],
+                    'current_stock': p['current_stock'],
+                    'total_stock': p['total_stock'],
+                    'minimum_stock': p['minimum_stock'],
+                    'shortage': (p['minimum_stock'] if p['minimum_stock'] is not None else threshold) - p['total_stock']
+                } for p in alerts
             ],
-            'total_alerts': len(low_stock_products)
+            'total_alerts': len(alerts)
         }), 200
         
     except Exception as e:
         logging.error(f"Low stock alerts API error: {str(e)}")
-        return jsonify({'error': 'Internal server error'}), 500
\ No newline at end of file
+        return jsonify({'error': 'Internal server error'}), 500
+
+@inventory_api_bp.route('/valuation', methods=['GET'])
+def api_stock_valuation():
+    """API endpoint for stock value at the end of a given day (default today)"""
+    try:
+        user = get_current_user()
+        if not user:
+            return jsonify({'error': 'Authentication required'}), 401
+        
+        as_of = request.args.get('date')
+        try:
+            as_of = datetime.fromisoformat(as_of).date() if as_of else datetime.now().date()
+        except ValueError:
+            return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+        
+        # Nearest stock snapshot plus the movements after it
+        return jsonify(stock_value_at(as_of)), 200
+        
+    except Exception as e:
+        logging.error(f"Stock valuation API error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
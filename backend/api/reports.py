@@ -4,8 +4,8 @@ REST API for business reports and analytics
 """
 
 from flask import Blueprint, request, jsonify
-from datetime import datetime, timedelta
-from sqlalchemy import func
+from sqlalchemy import select
+from datetime import datetime, time, timedelta
 import logging
 
 # Import from parent directory
@@ -16,6 +16,10 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from models import Transaction, ZakatCalculation
 from app import db
 from supabase_auth import get_current_user
+from rollups import totals_by_type
+from breakdown_cache import period_breakdown
+from stock_snapshots import stock_value_at
+from csv_export import csv_response
 
 reports_api_bp = Blueprint('reports_api', __name__)
 
@@ -38,43 +42,24 @@ def api_monthly_report():
         else:
             end_date = datetime(year, month + 1, 1).date()
         
-        # Get monthly income and expenses
-        monthly_income = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.type == 'income',
-            func.date(Transaction.date) >= start_date,
-            func.date(Transaction.date) < end_date
-        ).scalar() or 0
-        
-        monthly_expenses = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.type == 'expense',
-            func.date(Transaction.date) >= start_date,
-            func.date(Transaction.date) < end_date
-        ).scalar() or 0
+        # Get monthly income and expenses from the cached rollup breakdown
+        monthly_totals = period_breakdown(start_date, end_date)
+        monthly_income = monthly_totals['income']
+        monthly_expenses = monthly_totals['expense']
         
         # Channel breakdown
         channels = ['shopee', 'tiktok', 'walkin', 'agent']
+        channel_totals = monthly_totals['channels']
         channel_breakdown = {}
         
         for channel in channels:
-            channel_income = db.session.query(func.sum(Transaction.amount)).filter(
-                Transaction.type == 'income',
-                Transaction.channel == channel,
-                func.date(Transaction.date) >= start_date,
-                func.date(Transaction.date) < end_date
-            ).scalar() or 0
-            
-            channel_breakdown[channel] = float(channel_income)
+            channel_breakdown[channel] = float(channel_totals.get(channel, 0))
         
         # Category breakdown
-        expense_categories = db.session.query(
-            Transaction.category,
-            func.sum(Transaction.amount).label('total')
-        ).filter(
-            Transaction.type == 'expense',
-            func.date(Transaction.date) >= start_date,
-            func.date(Transaction.date) < end_date,
-            Transaction.category.isnot(None)
-        ).group_by(Transaction.category).all()
+        expense_categories = [
+            (cat, total) for cat, total in monthly_totals['expense_categories']
+            if cat is not None
+        ]
         
         return jsonify({
             'period': {
@@ -117,20 +102,16 @@ def api_zakat_report():
             start_date = datetime(year, 1, 1).date()
             end_date = datetime(year + 1, 1, 1).date()
             
-            annual_income = db.session.query(func.sum(Transaction.amount)).filter(
-                Transaction.type == 'income',
-                func.date(Transaction.date) >= start_date,
-                func.date(Transaction.date) < end_date
-            ).scalar() or 0
-            
-            annual_expenses = db.session.query(func.sum(Transaction.amount)).filter(
-                Transaction.type == 'expense',
-                func.date(Transaction.date) >= start_date,
-                func.date(Transaction.date) < end_date
-            ).scalar() or 0
+            annual_totals = totals_by_type(start_date, end_date)
+            annual_income = annual_totals['income']
+            annual_expenses = annual_totals['expense']
             
             net_profit = annual_income - annual_expenses
-            zakatable_amount = max(0, net_profit)  # Simplified calculation
+            
+            # Year-end stock value from stock snapshots (today's stock for the current year)
+            stock_value = stock_value_at(end_date - timedelta(days=1))['total_value']
+            
+            zakatable_amount = max(0, net_profit + stock_value)  # Simplified calculation
             zakat_amount = zakatable_amount * 0.025  # 2.5%
             
             zakat_calc = ZakatCalculation(
@@ -138,6 +119,7 @@ def api_zakat_report():
                 total_income=annual_income,
                 total_expenses=annual_expenses,
                 net_profit=net_profit,
+                stock_value=stock_value,
                 zakatable_amount=zakatable_amount,
                 zakat_amount=zakat_amount,
                 zakat_rate=2.5
@@ -151,6 +133,7 @@ def api_zakat_report():
             'total_income': float(zakat_calc.total_income),
             'total_expenses': float(zakat_calc.total_expenses),
             'net_profit': float(zakat_calc.net_profit),
+            'stock_value': float(zakat_calc.stock_value or 0),
             'zakatable_amount': float(zakat_calc.zakatable_amount),
             'zakat_amount': float(zakat_calc.zakat_amount),
             'zakat_rate': float(zakat_calc.zakat_rate),
@@ -184,30 +167,36 @@ def api_export_report(format):
         start_date = datetime.fromisoformat(start_date).date()
         end_date = datetime.fromisoformat(end_date).date()
         
-        # Get transactions for the period
-        transactions = Transaction.query.filter(
-            func.date(Transaction.date) >= start_date,
-            func.date(Transaction.date) <= end_date
-        ).order_by(Transaction.date.desc()).all()
+        # Half-open datetime range keeps the date index usable
+        period_filter = (
+            Transaction.date >= datetime.combine(start_date, time.min),
+            Transaction.date < datetime.combine(end_date + timedelta(days=1), time.min)
+        )
         
         if format == 'csv':
-            # Return data for CSV generation on frontend
-            return jsonify({
-                'format': 'csv',
-                'data': [
-                    {
-                        'date': t.date.isoformat(),
-                        'type': t.type,
-                        'amount': float(t.amount),
-                        'description': t.description,
-                        'channel': t.channel,
-                        'category': t.category or ''
-                    } for t in transactions
+            # Stream the CSV straight from a server-side cursor (?gzip=1 for gzip encoding)
+            statement = select(
+                Transaction.date, Transaction.type, Transaction.amount,
+                Transaction.description, Transaction.channel, Transaction.category
+            ).where(*period_filter).order_by(Transaction.date.desc())
+            
+            return csv_response(
+                statement,
+                ['date', 'type', 'amount', 'description', 'channel', 'category'],
+                lambda row: [
+                    row.date.isoformat(),
+                    row.type,
+                    f'{row.amount:.2f}',
+                    row.description,
+                    row.channel,
+                    row.category or ''
                 ],
-                'filename': f'transactions_{start_date}_{end_date}.csv'
-            }), 200
+                f'transactions_{start_date}_{end_date}.csv'
+            )
+        
+        transactions = Transaction.query.filter(*period_filter).order_by(Transaction.date.desc()).all()
         
-        elif format == 'pdf':
+        if format == 'pdf':
             # Return data for PDF generation
             return jsonify({
                 'format': 'pdf',
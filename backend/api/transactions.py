@@ -4,7 +4,11 @@ REST API for transaction management
 """
 
 from flask import Blueprint, request, jsonify
+from sqlalchemy import text, tuple_
 from datetime import datetime
+import base64
+import binascii
+import json
 import logging
 
 # Import from parent directory
@@ -15,9 +19,45 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from models import Transaction
 from app import db
 from supabase_auth import get_current_user
+from transaction_batch import ingest_transactions, BatchError
+from tenancy import current_tenant_id
 
 transactions_api_bp = Blueprint('transactions_api', __name__)
 
+# Largest page a client may request
+MAX_PER_PAGE = 100
+
+
+def encode_cursor(transaction):
+    """Opaque cursor pointing just past a transaction in (date, id) order"""
+    raw = json.dumps([transaction.date.isoformat(), transaction.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Turn a cursor back into (date, id); raises ValueError when malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_date, cursor_id = json.loads(raw)
+        return datetime.fromisoformat(cursor_date), int(cursor_id)
+    except (TypeError, ValueError, binascii.Error) as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
+
+
+def approximate_count(query, filtered):
+    """(count, is_estimate): planner row estimate for the whole table on PostgreSQL, exact count otherwise"""
+    # The estimate covers every business's rows; a tenant-scoped query is always filtered
+    if current_tenant_id() is not None:
+        filtered = True
+    if not filtered and db.engine.dialect.name == 'postgresql':
+        estimate = db.session.execute(
+            text('SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table_name)'),
+            {'table_name': Transaction.__tablename__}
+        ).scalar()
+        if estimate is not None and estimate >= 0:
+            return int(estimate), True
+    return query.order_by(None).count(), False
+
 @transactions_api_bp.route('/', methods=['GET'])
 def api_get_transactions():
     """API endpoint to get all transactions"""
@@ -27,8 +67,12 @@ def api_get_transactions():
             return jsonify({'error': 'Authentication required'}), 401
         
         # Get query parameters
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
+        cursor = request.args.get('cursor')
+        page = request.args.get('page', type=int)
+        if page is not None:
+            page = max(page, 1)
+        per_page = min(max(request.args.get('per_page', 20, type=int), 1), MAX_PER_PAGE)
+        include_total = request.args.get('include_total', '').lower()
         transaction_type = request.args.get('type')
         channel = request.args.get('channel')
         
@@ -41,10 +85,46 @@ def api_get_transactions():
         if channel:
             query = query.filter(Transaction.channel == channel)
         
-        # Order by date desc and paginate
-        transactions = query.order_by(Transaction.date.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        filtered = bool(transaction_type or channel)
+        total, total_is_estimate = None, False
+        if include_total in ('1', 'true', 'exact'):
+            total = query.order_by(None).count()
+        elif include_total == 'approx':
+            total, total_is_estimate = approximate_count(query, filtered)
+        
+        query = query.order_by(Transaction.date.desc(), Transaction.id.desc())
+        
+        if page and not cursor:
+            # Legacy page-number mode (OFFSET); kept for existing clients
+            query = query.offset((page - 1) * per_page)
+        elif cursor:
+            try:
+                cursor_date, cursor_id = decode_cursor(cursor)
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+            # Seek past the last row of the previous page: constant cost at any depth
+            query = query.filter(
+                tuple_(Transaction.date, Transaction.id) < tuple_(cursor_date, cursor_id)
+            )
+        
+        # Fetch one extra row to learn whether another page exists without counting
+        transactions = query.limit(per_page + 1).all()
+        has_next = len(transactions) > per_page
+        transactions = transactions[:per_page]
+        
+        pagination = {
+            'per_page': per_page,
+            'has_next': has_next,
+            'next_cursor': encode_cursor(transactions[-1]) if has_next else None,
+            'total': total,
+            'total_is_estimate': total_is_estimate,
+        }
+        if page and not cursor:
+            pagination.update({
+                'page': page,
+                'pages': -(-total // per_page) if total is not None else None,
+                'has_prev': page > 1
+            })
         
         return jsonify({
             'transactions': [
@@ -58,16 +138,9 @@ def api_get_transactions():
                     'date': t.date.isoformat(),
                     'receipt_image': t.receipt_image,
                     'created_at': t.created_at.isoformat()
-                } for t in transactions.items
+                } for t in transactions
             ],
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': transactions.total,
-                'pages': transactions.pages,
-                'has_next': transactions.has_next,
-                'has_prev': transactions.has_prev
-            }
+            'pagination': pagination
         }), 200
         
     except Exception as e:
@@ -126,6 +199,28 @@ def api_create_transaction():
         logging.error(f"Create transaction API error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@transactions_api_bp.route('/batch', methods=['POST'])
+def api_create_transactions_batch():
+    """API endpoint to create many transactions at once (offline sync), idempotent per item"""
+    try:
+        user = get_current_user()
+        if not user:
+            return jsonify({'error': 'Authentication required'}), 401
+        
+        data = request.get_json(silent=True)
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+        
+        result = ingest_transactions(data.get('transactions') if isinstance(data, dict) else data)
+        return jsonify({'success': True, **result}), 200
+        
+    except BatchError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Batch transaction API error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @transactions_api_bp.route('/<int:transaction_id>', methods=['PUT'])
 def api_update_transaction(transaction_id):
     """API endpoint to update transaction"""
@@ -52,17 +52,35 @@ def create_app():
         return database_url or "sqlite:///accounting.db"
 
     app.config["SQLALCHEMY_DATABASE_URI"] = get_database_uri()
-    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-        "pool_recycle": 300,
-        "pool_pre_ping": True,
-    }
+    
+    # Pool sizing and Supabase pooler mode from DB_POOL_* environment variables
+    from db_pool import engine_options
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
     
     # Initialize the app with the extension
     db.init_app(app)
     
+    # Per-route latency / SQL instrumentation, exported on /metrics
+    from perf_metrics import init_metrics
+    init_metrics(app)
+    
     with app.app_context():
         # Import models and API routes
         import models
+        import tenancy  # tenant scoping hooks, before any API queries
+        
+        # Register maintenance commands
+        from rollups import rebuild_rollups_command
+        from query_plans import create_indexes_command, explain_reports_command
+        from stock_snapshots import snapshot_stock_command
+        from tenancy import assign_tenant_command
+        from db_pool import loadtest_db_command
+        app.cli.add_command(rebuild_rollups_command)
+        app.cli.add_command(create_indexes_command)
+        app.cli.add_command(explain_reports_command)
+        app.cli.add_command(snapshot_stock_command)
+        app.cli.add_command(assign_tenant_command)
+        app.cli.add_command(loadtest_db_command)
         
         # Import and register API blueprints
         from api.auth import auth_api_bp
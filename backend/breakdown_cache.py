@@ -0,0 +1,157 @@
+"""
+Breakdown Cache Module for PocketBizz
+In-memory cache of per-period income/expense totals with channel and
+category breakdowns. Entries are dropped as soon as a write touches a
+date inside their period, so dashboard and report cards are normally
+served without a query.
+"""
+
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import event, func
+from sqlalchemy.engine import Engine
+
+from app import db
+from models import DailyLedgerRollup
+from rollups import on_rollup_change
+from tenancy import current_tenant_id
+
+# Upper bound on how stale another worker process's cache can get after a write
+BREAKDOWN_CACHE_TTL = 30
+
+# tenant -> {(start, end, scope): (expires_at, breakdown)}
+_cache = {}
+_lock = threading.Lock()
+_next_prune = 0.0
+
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _compute_breakdown(start, end):
+    """Totals and breakdowns for [start, end) from one grouped rollup scan"""
+    rows = db.session.query(
+        DailyLedgerRollup.type,
+        DailyLedgerRollup.channel,
+        DailyLedgerRollup.category,
+        func.sum(DailyLedgerRollup.total_amount)
+    ).filter(
+        DailyLedgerRollup.date >= start,
+        DailyLedgerRollup.date < end
+    ).group_by(
+        DailyLedgerRollup.type, DailyLedgerRollup.channel, DailyLedgerRollup.category
+    ).all()
+
+    totals = {'income': 0.0, 'expense': 0.0}
+    channels = {}
+    categories = {}
+    for transaction_type, channel, category, total in rows:
+        total = float(total or 0)
+        totals[transaction_type] = totals.get(transaction_type, 0.0) + total
+        if transaction_type == 'income':
+            channels[channel] = channels.get(channel, 0.0) + total
+        elif transaction_type == 'expense':
+            categories[category or None] = categories.get(category or None, 0.0) + total
+
+    return {
+        'income': totals['income'],
+        'expense': totals['expense'],
+        'channels': channels,
+        'expense_categories': sorted(categories.items(), key=lambda item: item[1], reverse=True),
+    }
+
+
+def _prune_expired(now):
+    """Drop expired entries of every tenant; called under _lock, at most once per TTL"""
+    global _next_prune
+    if now < _next_prune:
+        return
+    _next_prune = now + BREAKDOWN_CACHE_TTL
+    for tenant in list(_cache):
+        entries = _cache[tenant]
+        for key in [key for key, (expires_at, _) in entries.items() if expires_at <= now]:
+            del entries[key]
+        if not entries:
+            del _cache[tenant]
+
+
+def period_breakdown(start, end, scope='ledger'):
+    """Cached totals, income per channel and expense per category for [start, end).
+
+    The returned dict is shared between requests and must not be modified.
+    """
+    start, end = _as_date(start), _as_date(end)
+    # The rollup query is tenant-filtered, so each business gets its own entries
+    tenant = current_tenant_id()
+    key = (start, end, scope)
+    now = time.monotonic()
+
+    with _lock:
+        entry = _cache.get(tenant, {}).get(key)
+    if entry and entry[0] > now:
+        return entry[1]
+
+    breakdown = _compute_breakdown(start, end)
+    with _lock:
+        _prune_expired(now)
+        _cache.setdefault(tenant, {})[key] = (now + BREAKDOWN_CACHE_TTL, breakdown)
+    return breakdown
+
+
+def _drop_periods(entries, dates):
+    for key in [key for key in entries if any(key[0] <= day < key[1] for day in dates)]:
+        del entries[key]
+
+
+def invalidate_dates(changes):
+    """Drop cached periods containing any of a tenant's changed dates.
+
+    changes is {tenant: dates}; None drops every period of every tenant.
+    """
+    with _lock:
+        if changes is None:
+            _cache.clear()
+            return
+        for tenant, dates in changes.items():
+            if tenant in _cache:
+                _drop_periods(_cache[tenant], dates)
+        if None in _cache:
+            # Unscoped entries (tenant None) sum every tenant's rows
+            _drop_periods(_cache[None], set().union(*changes.values()))
+
+
+# === WRITE-THROUGH INVALIDATION ===
+# Entries are dropped when the rollup is written and again when that write
+# commits or rolls back, so a read racing the open transaction cannot keep
+# pre-commit totals cached.
+
+@on_rollup_change
+def _rollup_changed(connection, changes):
+    invalidate_dates(changes)
+    if changes is None:
+        connection.info['breakdown_dirty_all'] = True
+        return
+    pending = connection.info.setdefault('breakdown_dirty_dates', {})
+    for tenant, dates in changes.items():
+        pending.setdefault(tenant, set()).update(dates)
+
+
+def _flush_pending(connection):
+    pending = connection.info.pop('breakdown_dirty_dates', None)
+    if connection.info.pop('breakdown_dirty_all', False):
+        invalidate_dates(None)
+    elif pending:
+        invalidate_dates(pending)
+
+
+@event.listens_for(Engine, 'commit')
+def _after_commit(connection):
+    _flush_pending(connection)
+
+
+@event.listens_for(Engine, 'rollback')
+def _after_rollback(connection):
+    _flush_pending(connection)
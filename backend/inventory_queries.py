@@ -0,0 +1,135 @@
+"""
+Inventory Query Module for PocketBizz
+Bulk product serialization without per-product lazy loads: variant stock
+totals, variant counts and low-stock flags are aggregated in SQL and the
+supplier name is joined in, so any number of products costs one query.
+Also the single low-stock rule shared by every inventory page, API and
+notification.
+"""
+
+from sqlalchemy import and_, case, func, or_, select
+
+from app import db
+from models import Product, ProductVariant, Supplier, BusinessSettings
+
+# Products fetched per round trip while serializing
+SERIALIZE_BATCH_SIZE = 1000
+
+# Minimum stock for items without their own, when BusinessSettings has none
+DEFAULT_LOW_STOCK_THRESHOLD = 10
+
+
+def stock_alert_settings():
+    """(alerts enabled, low stock threshold) from BusinessSettings"""
+    settings = db.session.query(
+        BusinessSettings.enable_stock_alerts,
+        BusinessSettings.low_stock_threshold
+    ).first()
+    if settings is None:
+        return True, DEFAULT_LOW_STOCK_THRESHOLD
+
+    enabled, threshold = settings
+    return enabled is not False, threshold if threshold is not None else DEFAULT_LOW_STOCK_THRESHOLD
+
+
+def variant_summary(threshold=DEFAULT_LOW_STOCK_THRESHOLD):
+    """Per-product aggregate of its variants (stock and low-stock count cover active variants only)"""
+    active = ProductVariant.is_active == True
+    minimum = func.coalesce(ProductVariant.minimum_stock, threshold)
+    return select(
+        ProductVariant.product_id,
+        func.count(ProductVariant.id).label('variant_count'),
+        func.sum(case((active, ProductVariant.current_stock), else_=0)).label('active_stock'),
+        func.sum(case(
+            (and_(active, ProductVariant.current_stock <= minimum), 1),
+            else_=0
+        )).label('low_variants'),
+    ).group_by(ProductVariant.product_id).subquery('variant_summary')
+
+
+def low_stock_condition(variants, threshold=DEFAULT_LOW_STOCK_THRESHOLD):
+    """The low-stock rule in SQL, over a variant_summary() subquery.
+
+    Variant products are low when any active variant is at or below its
+    minimum; plain products when their own stock is. An item's own
+    minimum_stock wins; items left blank (NULL) use the business-wide
+    BusinessSettings.low_stock_threshold.
+    """
+    return or_(
+        and_(Product.has_variants == True, func.coalesce(variants.c.low_variants, 0) > 0),
+        and_(
+            or_(Product.has_variants == False, Product.has_variants.is_(None)),
+            Product.current_stock <= func.coalesce(Product.minimum_stock, threshold)
+        )
+    )
+
+
+def product_summary_query(*criteria, low_stock_only=False, threshold=None):
+    """Select (Product, supplier name, is_low_stock, total_stock, variant_count) rows"""
+    if threshold is None:
+        threshold = stock_alert_settings()[1]
+    variants = variant_summary(threshold)
+    if low_stock_only:
+        criteria += (low_stock_condition(variants, threshold),)
+    total_stock = case(
+        (Product.has_variants == True, func.coalesce(variants.c.active_stock, 0)),
+        else_=Product.current_stock
+    )
+
+    return select(
+        Product,
+        Supplier.name.label('supplier_name'),
+        case((low_stock_condition(variants, threshold), True), else_=False).label('is_low_stock'),
+        total_stock.label('total_stock'),
+        func.coalesce(variants.c.variant_count, 0).label('variant_count'),
+    ).outerjoin(
+        variants, variants.c.product_id == Product.id
+    ).outerjoin(
+        Supplier, Supplier.id == Product.supplier_id
+    ).where(*criteria).order_by(Product.id)
+
+
+def serialize_products(*criteria, low_stock_only=False, threshold=None):
+    """Product.to_dict() for every matching product in a single query"""
+    result = db.session.execute(
+        product_summary_query(*criteria, low_stock_only=low_stock_only, threshold=threshold).execution_options(
+            yield_per=SERIALIZE_BATCH_SIZE
+        )
+    )
+    return [
+        product.to_summary_dict(
+            supplier_name=supplier_name,
+            is_low_stock=bool(is_low_stock),
+            total_stock=int(total_stock or 0),
+            variant_count=variant_count
+        )
+        for product, supplier_name, is_low_stock, total_stock, variant_count in result
+    ]
+
+
+# === LOW STOCK ALERTS ===
+# Shared by the inventory page, both low-stock APIs and the notification poller
+
+def low_stock_products():
+    """Serialized active products that are low on stock ([] when stock alerts are off)"""
+    enabled, threshold = stock_alert_settings()
+    if not enabled:
+        return []
+    return serialize_products(Product.is_active == True, low_stock_only=True, threshold=threshold)
+
+
+def count_low_stock():
+    """Number of active products low on stock (0 when stock alerts are off)"""
+    enabled, threshold = stock_alert_settings()
+    if not enabled:
+        return 0
+
+    variants = variant_summary(threshold)
+    return db.session.execute(
+        select(func.count(Product.id)).outerjoin(
+            variants, variants.c.product_id == Product.id
+        ).where(
+            Product.is_active == True,
+            low_stock_condition(variants, threshold)
+        )
+    ).scalar()
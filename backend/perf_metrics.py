@@ -0,0 +1,196 @@
+"""
+Performance Metrics Module for PocketBizz
+Per-route request instrumentation: latency histogram, SQL statement
+count, SQL time and rows returned, recorded from Flask request hooks and
+SQLAlchemy cursor events and exposed in Prometheus text format
+"""
+
+import hmac
+import os
+import threading
+from bisect import bisect_left
+from time import perf_counter
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from supabase_auth import get_current_user, is_admin_user
+
+# Latency histogram bucket upper bounds, in seconds (Prometheus "le" labels)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# (method, endpoint) -> RouteStats
+_routes = {}
+_lock = threading.Lock()
+
+# Time spent inside the hooks themselves, to keep the overhead measurable
+_overhead = {'seconds': 0.0, 'requests': 0}
+
+
+class RouteStats:
+    """Counters for one (method, endpoint) pair"""
+
+    __slots__ = ('requests', 'errors', 'latency_sum', 'buckets',
+                 'sql_statements', 'sql_seconds', 'sql_rows')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.latency_sum = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # last slot is +Inf
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.sql_rows = 0
+
+
+# === REQUEST HOOKS ===
+
+def _start_request():
+    g._perf = [perf_counter(), 0, 0.0, 0]  # started, statements, sql seconds, rows
+
+
+def _finish_request(response):
+    perf = g.pop('_perf', None)
+    if perf is None:
+        return response
+
+    hook_started = perf_counter()
+    latency = hook_started - perf[0]
+    key = (request.method, request.url_rule.rule if request.url_rule else 'unmatched')
+
+    with _lock:
+        stats = _routes.get(key)
+        if stats is None:
+            stats = _routes[key] = RouteStats()
+        stats.requests += 1
+        if response.status_code >= 500:
+            stats.errors += 1
+        stats.latency_sum += latency
+        stats.buckets[bisect_left(LATENCY_BUCKETS, latency)] += 1
+        stats.sql_statements += perf[1]
+        stats.sql_seconds += perf[2]
+        stats.sql_rows += perf[3]
+
+        _overhead['requests'] += 1
+        _overhead['seconds'] += perf_counter() - hook_started
+    return response
+
+
+# === SQL HOOKS ===
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and '_perf' in g:
+        conn.info['perf_query_started'] = perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('perf_query_started', None)
+    if started is None or not has_request_context():
+        return
+    perf = g.get('_perf')
+    if perf is None:
+        return
+    perf[1] += 1
+    perf[2] += perf_counter() - started
+    # rowcount is the SELECT row count on PostgreSQL; SQLite reports -1 for reads
+    if cursor.rowcount > 0:
+        perf[3] += cursor.rowcount
+
+
+# === EXPORT ===
+
+def metrics_snapshot():
+    """Per-route summary rows, slowest total time first (for the admin dashboard)"""
+    with _lock:
+        items = [(key, stats.requests, stats.errors, stats.latency_sum, stats.sql_statements,
+                  stats.sql_seconds, stats.sql_rows) for key, stats in _routes.items()]
+
+    rows = []
+    for (method, route), requests, errors, latency_sum, statements, sql_seconds, sql_rows in items:
+        rows.append({
+            'method': method,
+            'route': route,
+            'requests': requests,
+            'errors': errors,
+            'avg_ms': round(latency_sum / requests * 1000, 2) if requests else 0,
+            'total_seconds': round(latency_sum, 3),
+            'avg_queries': round(statements / requests, 1) if requests else 0,
+            'avg_sql_ms': round(sql_seconds / requests * 1000, 2) if requests else 0,
+            'rows': sql_rows,
+        })
+    return sorted(rows, key=lambda row: row['total_seconds'], reverse=True)
+
+
+def overhead_per_request():
+    """Average seconds spent in the instrumentation hooks per request"""
+    with _lock:
+        if not _overhead['requests']:
+            return 0.0
+        return _overhead['seconds'] / _overhead['requests']
+
+
+def _labels(method, route):
+    route = route.replace('\\', '\\\\').replace('"', '\\"')
+    return f'method="{method}",route="{route}"'
+
+
+def render_prometheus():
+    """All route metrics in the Prometheus text exposition format"""
+    with _lock:
+        routes = sorted(_routes.items())
+        snapshot = [(key, stats.requests, stats.errors, stats.latency_sum, list(stats.buckets),
+                     stats.sql_statements, stats.sql_seconds, stats.sql_rows) for key, stats in routes]
+
+    lines = [
+        '# HELP pocketbizz_request_duration_seconds Request latency per route.',
+        '# TYPE pocketbizz_request_duration_seconds histogram',
+    ]
+    for (method, route), requests, _, latency_sum, buckets, _, _, _ in snapshot:
+        labels = _labels(method, route)
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, buckets):
+            cumulative += count
+            lines.append(f'pocketbizz_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'pocketbizz_request_duration_seconds_bucket{{{labels},le="+Inf"}} {requests}')
+        lines.append(f'pocketbizz_request_duration_seconds_sum{{{labels}}} {latency_sum:.6f}')
+        lines.append(f'pocketbizz_request_duration_seconds_count{{{labels}}} {requests}')
+
+    counters = (
+        ('pocketbizz_request_errors_total', 'Responses with a 5xx status per route.', 2),
+        ('pocketbizz_sql_statements_total', 'SQL statements issued per route.', 5),
+        ('pocketbizz_sql_seconds_total', 'Time spent executing SQL per route.', 6),
+        ('pocketbizz_sql_rows_total', 'Rows returned or affected by SQL per route.', 7),
+    )
+    for name, help_text, index in counters:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for entry in snapshot:
+            value = entry[index]
+            value = f'{value:.6f}' if isinstance(value, float) else value
+            lines.append(f'{name}{{{_labels(*entry[0])}}} {value}')
+
+    lines.append('# HELP pocketbizz_instrumentation_seconds_per_request Average time spent in the metrics hooks.')
+    lines.append('# TYPE pocketbizz_instrumentation_seconds_per_request gauge')
+    lines.append(f'pocketbizz_instrumentation_seconds_per_request {overhead_per_request():.9f}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_endpoint():
+    """Prometheus scrape endpoint: METRICS_TOKEN as a bearer token, or a logged-in admin"""
+    token = os.environ.get('METRICS_TOKEN')
+    authorization = request.headers.get('Authorization', '')
+    scraper = bool(token) and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())
+    # Route names and traffic are not public: without the token only admins may read them
+    if not scraper and not is_admin_user(get_current_user()):
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+def init_metrics(app):
+    """Install the request hooks and the /metrics endpoint on an app"""
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_endpoint)
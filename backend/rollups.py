@@ -0,0 +1,329 @@
+"""
+Daily Ledger Rollup Module for PocketBizz
+Keeps DailyLedgerRollup in step with Transaction writes and serves the
+aggregate reads used by the dashboard, reports, zakat and LHDN pages
+"""
+
+import logging
+from collections import defaultdict
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import event, func, inspect, literal, select, update, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app import db
+from models import Transaction, DailyLedgerRollup
+
+rollup_table = DailyLedgerRollup.__table__
+transaction_table = Transaction.__table__
+
+# Key columns shared by the rollup unique constraint and the upsert
+ROLLUP_KEY = ('tenant_id', 'date', 'type', 'channel', 'category')
+
+# Callbacks run with (connection, {tenant: changed dates}) after deltas are
+# applied; the map is None when the whole table was rebuilt
+_change_listeners = []
+
+
+def on_rollup_change(listener):
+    """Register a callback for rollup writes (used by caches built on the rollup)"""
+    _change_listeners.append(listener)
+    return listener
+
+
+def _notify_change(connection, changes):
+    for listener in _change_listeners:
+        listener(connection, changes)
+
+
+def notify_bulk_change(connection):
+    """Tell rollup listeners that any date may have changed (bulk writes that skip the hooks)"""
+    _notify_change(connection, None)
+
+
+def changed_dates(deltas):
+    """{tenant: set of dates} touched by a delta map"""
+    changes = defaultdict(set)
+    for key in deltas:
+        changes[key[0]].add(key[1])
+    return dict(changes)
+
+
+def rollup_key(tenant_id, transaction_date, transaction_type, channel, category):
+    """Build the (tenant, date, type, channel, category) key for one transaction"""
+    if isinstance(transaction_date, datetime):
+        transaction_date = transaction_date.date()
+    return (tenant_id or '', transaction_date, transaction_type, channel, category or '')
+
+
+def add_delta(deltas, key, amount, count):
+    """Accumulate an amount/count change for a rollup key"""
+    entry = deltas[key]
+    entry[0] += amount or 0.0
+    entry[1] += count
+
+
+def new_deltas():
+    """Empty delta map for add_delta/apply_rollup_deltas"""
+    return defaultdict(lambda: [0.0, 0])
+
+
+def deltas_for_rows(rows, sign=1):
+    """Build deltas from plain transaction dicts (used by bulk writers)"""
+    deltas = new_deltas()
+    for row in rows:
+        key = rollup_key(row.get('tenant_id'), row['date'], row['type'], row['channel'], row.get('category'))
+        add_delta(deltas, key, sign * row['amount'], sign)
+    return deltas
+
+
+def _upsert_statement(dialect_name):
+    """Dialect-specific INSERT ... ON CONFLICT that adds to existing totals"""
+    if dialect_name == 'postgresql':
+        stmt = postgresql.insert(rollup_table)
+    elif dialect_name == 'sqlite':
+        stmt = sqlite.insert(rollup_table)
+    else:
+        return None
+
+    return stmt.on_conflict_do_update(
+        index_elements=[rollup_table.c[name] for name in ROLLUP_KEY],
+        set_={
+            'total_amount': rollup_table.c.total_amount + stmt.excluded.total_amount,
+            'transaction_count': rollup_table.c.transaction_count + stmt.excluded.transaction_count,
+            'updated_at': stmt.excluded.updated_at,
+        }
+    )
+
+
+def apply_rollup_deltas(connection, deltas):
+    """Apply accumulated deltas to the rollup table in one executemany"""
+    if not deltas:
+        return
+
+    now = datetime.utcnow()
+    params = [
+        {
+            'tenant_id': key[0],
+            'date': key[1],
+            'type': key[2],
+            'channel': key[3],
+            'category': key[4],
+            'total_amount': amount,
+            'transaction_count': count,
+            'updated_at': now,
+        }
+        for key, (amount, count) in deltas.items()
+    ]
+
+    stmt = _upsert_statement(connection.dialect.name)
+    if stmt is not None:
+        connection.execute(stmt, params)
+    else:
+        # Generic fallback: UPDATE first, INSERT the keys that did not exist yet
+        for values in params:
+            result = connection.execute(
+                update(rollup_table).where(
+                    *[rollup_table.c[name] == values[name] for name in ROLLUP_KEY]
+                ).values(
+                    total_amount=rollup_table.c.total_amount + values['total_amount'],
+                    transaction_count=rollup_table.c.transaction_count + values['transaction_count'],
+                    updated_at=now
+                )
+            )
+            if result.rowcount == 0:
+                connection.execute(insert(rollup_table), values)
+
+    _notify_change(connection, changed_dates(deltas))
+
+
+# === SESSION HOOKS ===
+
+@event.listens_for(Session, 'before_flush')
+def _capture_previous_values(session, flush_context, instances):
+    """Remember committed values of transactions about to change or go away"""
+    ids = []
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Transaction):
+            identity = inspect(obj).identity
+            if identity:
+                ids.append(identity[0])
+
+    if not ids:
+        return
+
+    rows = session.connection().execute(
+        select(
+            transaction_table.c.id,
+            transaction_table.c.tenant_id,
+            transaction_table.c.date,
+            transaction_table.c.type,
+            transaction_table.c.channel,
+            transaction_table.c.category,
+            transaction_table.c.amount
+        ).where(transaction_table.c.id.in_(ids))
+    )
+    previous = session.info.setdefault('rollup_previous', {})
+    for row in rows:
+        previous[row.id] = row
+
+
+@event.listens_for(Session, 'after_flush')
+def _maintain_rollups(session, flush_context):
+    """Turn flushed Transaction inserts/updates/deletes into rollup deltas"""
+    previous = session.info.pop('rollup_previous', {})
+    deltas = new_deltas()
+
+    for obj in session.new:
+        if isinstance(obj, Transaction):
+            add_delta(deltas, rollup_key(obj.tenant_id, obj.date, obj.type, obj.channel, obj.category), obj.amount, 1)
+
+    for obj in list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, Transaction):
+            continue
+        old = previous.get(inspect(obj).identity[0]) if inspect(obj).identity else None
+        if old is not None:
+            add_delta(deltas, rollup_key(old.tenant_id, old.date, old.type, old.channel, old.category), -old.amount, -1)
+        if obj not in session.deleted:
+            add_delta(deltas, rollup_key(obj.tenant_id, obj.date, obj.type, obj.channel, obj.category), obj.amount, 1)
+
+    if deltas:
+        apply_rollup_deltas(session.connection(), deltas)
+
+
+# === READ HELPERS ===
+# All ranges are half-open: start <= date < end
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _rollup_range(query, start, end):
+    return query.filter(
+        DailyLedgerRollup.date >= _as_date(start),
+        DailyLedgerRollup.date < _as_date(end)
+    )
+
+
+def totals_by_type(start, end):
+    """Income and expense totals for a date range"""
+    rows = _rollup_range(
+        db.session.query(DailyLedgerRollup.type, func.sum(DailyLedgerRollup.total_amount)),
+        start, end
+    ).group_by(DailyLedgerRollup.type).all()
+
+    totals = {'income': 0.0, 'expense': 0.0}
+    for transaction_type, total in rows:
+        totals[transaction_type] = float(total or 0)
+    return totals
+
+
+def totals_by_channel(start, end, transaction_type='income'):
+    """Per-channel totals for a date range"""
+    rows = _rollup_range(
+        db.session.query(DailyLedgerRollup.channel, func.sum(DailyLedgerRollup.total_amount)),
+        start, end
+    ).filter(
+        DailyLedgerRollup.type == transaction_type
+    ).group_by(DailyLedgerRollup.channel).all()
+
+    return {channel: float(total or 0) for channel, total in rows}
+
+
+def totals_by_category(start, end, transaction_type='expense', limit=None):
+    """Per-category totals for a date range, largest first (None = no category)"""
+    total_column = func.sum(DailyLedgerRollup.total_amount)
+    query = _rollup_range(
+        db.session.query(DailyLedgerRollup.category, total_column),
+        start, end
+    ).filter(
+        DailyLedgerRollup.type == transaction_type
+    ).group_by(DailyLedgerRollup.category).order_by(total_column.desc())
+
+    if limit:
+        query = query.limit(limit)
+
+    return [(category or None, float(total or 0)) for category, total in query.all()]
+
+
+def daily_category_totals(start, end):
+    """One grouped scan of (date, type, category) totals for a date range"""
+    rows = _rollup_range(
+        db.session.query(
+            DailyLedgerRollup.date,
+            DailyLedgerRollup.type,
+            DailyLedgerRollup.category,
+            func.sum(DailyLedgerRollup.total_amount)
+        ),
+        start, end
+    ).group_by(
+        DailyLedgerRollup.date, DailyLedgerRollup.type, DailyLedgerRollup.category
+    ).all()
+
+    return [(day, transaction_type, category or None, float(total or 0))
+            for day, transaction_type, category, total in rows]
+
+
+
+def daily_channel_totals(start, end):
+    """One grouped scan of (date, type, channel) totals and transaction counts for a date range"""
+    rows = _rollup_range(
+        db.session.query(
+            DailyLedgerRollup.date,
+            DailyLedgerRollup.type,
+            DailyLedgerRollup.channel,
+            func.sum(DailyLedgerRollup.total_amount),
+            func.sum(DailyLedgerRollup.transaction_count)
+        ),
+        start, end
+    ).group_by(
+        DailyLedgerRollup.date, DailyLedgerRollup.type, DailyLedgerRollup.channel
+    ).all()
+
+    return [(day, transaction_type, channel, float(total or 0), int(count or 0))
+            for day, transaction_type, channel, total, count in rows]
+
+
+# === REBUILD / BACKFILL ===
+
+def rebuild_rollups():
+    """Recompute every rollup row from the Transaction table"""
+    connection = db.session.connection()
+    connection.execute(rollup_table.delete())
+
+    day = func.date(transaction_table.c.date)
+    category = func.coalesce(transaction_table.c.category, '')
+    source = select(
+        transaction_table.c.tenant_id,
+        day,
+        transaction_table.c.type,
+        transaction_table.c.channel,
+        category,
+        func.sum(transaction_table.c.amount),
+        func.count(transaction_table.c.id),
+        literal(datetime.utcnow(), type_=rollup_table.c.updated_at.type)
+    ).group_by(transaction_table.c.tenant_id, day, transaction_table.c.type, transaction_table.c.channel, category)
+
+    connection.execute(
+        insert(rollup_table).from_select(
+            ['tenant_id', 'date', 'type', 'channel', 'category', 'total_amount', 'transaction_count', 'updated_at'],
+            source
+        )
+    )
+    _notify_change(connection, None)
+    db.session.commit()
+
+    count = db.session.query(func.count(DailyLedgerRollup.id)).scalar()
+    logging.info(f"✅ Rebuilt {count} daily ledger rollup rows")
+    return count
+
+
+@click.command('rebuild-rollups')
+@with_appcontext
+def rebuild_rollups_command():
+    """Rebuild the daily ledger rollup table from existing transactions."""
+    count = rebuild_rollups()
+    click.echo(f'Rebuilt {count} daily ledger rollup rows')
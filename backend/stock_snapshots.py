@@ -0,0 +1,195 @@
+"""
+Stock Snapshot Module for PocketBizz
+End-of-day stock snapshots per product/variant, built incrementally by
+replaying only the StockMovements recorded since the previous snapshot.
+Point-in-time stock valuation is then snapshot + the movements after it,
+instead of a replay of the whole movement history.
+"""
+
+import logging
+from datetime import date, datetime, time, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import case, func, insert, select
+
+from app import db
+from models import Product, ProductVariant, StockMovement, StockSnapshot, StockSnapshotRun
+from tenancy import all_tenants
+
+
+def _end_of_day(day):
+    return datetime.combine(day + timedelta(days=1), time.min)
+
+
+def movement_deltas(after_id=0, before=None, since=None):
+    """Net stock change per (product_id, variant_id) for movements with id > after_id
+    and, optionally, date < before and/or date >= since (variant_id 0 = product level)"""
+    change = case(
+        (StockMovement.movement_type == 'out', -StockMovement.quantity),
+        else_=StockMovement.quantity
+    )
+    variant = func.coalesce(StockMovement.variant_id, 0)
+    query = select(StockMovement.product_id, variant, func.sum(change)).where(StockMovement.id > after_id)
+    if before is not None:
+        query = query.where(StockMovement.date < before)
+    if since is not None:
+        query = query.where(StockMovement.date >= since)
+
+    rows = db.session.execute(query.group_by(StockMovement.product_id, variant)).all()
+    return {(product_id, variant_id): int(total or 0) for product_id, variant_id, total in rows}
+
+
+def current_stock_levels():
+    """Today's {(product_id, variant_id): (quantity, unit_cost)} for active stock.
+
+    Products with variants are held per variant, other products at product level.
+    """
+    levels = {}
+    products = db.session.execute(
+        select(Product.id, Product.current_stock, Product.cost_price).where(
+            Product.is_active == True,
+            func.coalesce(Product.has_variants, False) == False
+        )
+    )
+    for product_id, quantity, cost in products:
+        levels[(product_id, 0)] = (quantity or 0, cost or 0.0)
+
+    variants = db.session.execute(
+        select(ProductVariant.product_id, ProductVariant.id, ProductVariant.current_stock, ProductVariant.cost_price).join(
+            Product, Product.id == ProductVariant.product_id
+        ).where(
+            Product.is_active == True,
+            Product.has_variants == True,
+            ProductVariant.is_active == True
+        )
+    )
+    for product_id, variant_id, quantity, cost in variants:
+        levels[(product_id, variant_id)] = (quantity or 0, cost or 0.0)
+    return levels
+
+
+def _snapshot_levels(run):
+    rows = db.session.execute(
+        select(StockSnapshot.product_id, StockSnapshot.variant_id, StockSnapshot.quantity, StockSnapshot.unit_cost).where(
+            StockSnapshot.snapshot_date == run.snapshot_date
+        )
+    )
+    return {(product_id, variant_id): (quantity, unit_cost) for product_id, variant_id, quantity, unit_cost in rows}
+
+
+def _apply(levels, deltas, sign=1, costs=None):
+    """Add movement deltas to {(product, variant): (quantity, cost)} levels"""
+    result = dict(levels)
+    for key, change in deltas.items():
+        quantity, cost = result.get(key, (0, (costs or {}).get(key, (0, 0.0))[1]))
+        result[key] = (quantity + sign * change, cost)
+    return result
+
+
+def _latest_run(on_or_before):
+    return StockSnapshotRun.query.filter(
+        StockSnapshotRun.snapshot_date <= on_or_before
+    ).order_by(StockSnapshotRun.snapshot_date.desc()).first()
+
+
+def take_stock_snapshot(snapshot_date=None):
+    """Record end-of-day stock for snapshot_date (default yesterday) from the previous snapshot plus new movements"""
+    # A run covers every business; each snapshot row carries its product's tenant
+    with all_tenants():
+        return _take_stock_snapshot(snapshot_date or date.today() - timedelta(days=1))
+
+
+def _take_stock_snapshot(snapshot_date):
+    existing = StockSnapshotRun.query.filter_by(snapshot_date=snapshot_date).first()
+    if existing:
+        return existing
+
+    end = _end_of_day(snapshot_date)
+    current = current_stock_levels()
+    previous = _latest_run(snapshot_date - timedelta(days=1))
+
+    if previous is None:
+        # First snapshot: anchor on today's stock and undo movements made after the snapshot day
+        levels = _apply(current, movement_deltas(since=end), sign=-1, costs=current)
+        after_id = 0
+    else:
+        levels = _apply(_snapshot_levels(previous), movement_deltas(after_id=previous.last_movement_id, before=end), costs=current)
+        after_id = previous.last_movement_id
+
+    # Watermark: the newest movement included (movement ids grow with their dates)
+    watermark = db.session.query(func.max(StockMovement.id)).filter(
+        StockMovement.id > after_id,
+        StockMovement.date < end
+    ).scalar() or after_id
+
+    tenants = dict(db.session.execute(select(Product.id, Product.tenant_id)).all())
+    rows = [
+        {
+            'tenant_id': tenants.get(product_id, ''),
+            'snapshot_date': snapshot_date,
+            'product_id': product_id,
+            'variant_id': variant_id,
+            'quantity': quantity,
+            'unit_cost': current.get((product_id, variant_id), (0, cost))[1],
+        }
+        for (product_id, variant_id), (quantity, cost) in levels.items()
+        if quantity
+    ]
+    if rows:
+        db.session.execute(insert(StockSnapshot), rows)
+
+    run = StockSnapshotRun(
+        snapshot_date=snapshot_date,
+        last_movement_id=watermark,
+        item_count=len(rows),
+        total_value=sum(row['quantity'] * row['unit_cost'] for row in rows)
+    )
+    db.session.add(run)
+    db.session.commit()
+    logging.info(f"✅ Stock snapshot {snapshot_date}: {len(rows)} items, RM{run.total_value:.2f}")
+    return run
+
+
+def stock_value_at(as_of):
+    """Stock quantity and value at the end of a day, from the nearest snapshot plus later movements"""
+    if isinstance(as_of, datetime):
+        as_of = as_of.date()
+
+    if as_of >= date.today():
+        levels, source, snapshot_date = current_stock_levels(), 'current', None
+    else:
+        run = _latest_run(as_of)
+        if run is not None:
+            levels = _apply(
+                _snapshot_levels(run),
+                movement_deltas(after_id=run.last_movement_id, before=_end_of_day(as_of)),
+                costs=current_stock_levels()
+            )
+            source, snapshot_date = 'snapshot', run.snapshot_date
+        else:
+            # No snapshot yet: replay backwards from today's stock
+            current = current_stock_levels()
+            levels = _apply(current, movement_deltas(since=_end_of_day(as_of)), sign=-1, costs=current)
+            source, snapshot_date = 'replay', None
+
+    return {
+        'as_of': as_of.isoformat(),
+        'total_value': round(sum(quantity * cost for quantity, cost in levels.values() if quantity > 0), 2),
+        'total_units': sum(quantity for quantity, _ in levels.values() if quantity > 0),
+        'items': sum(1 for quantity, _ in levels.values() if quantity > 0),
+        'source': source,
+        'snapshot_date': snapshot_date.isoformat() if snapshot_date else None,
+    }
+
+
+@click.command('snapshot-stock')
+@click.option('--date', 'snapshot_date', default=None, help='Day to snapshot (YYYY-MM-DD, default yesterday).')
+@click.option('--backfill-days', default=0, show_default=True, help='Also snapshot this many earlier days, oldest first.')
+@with_appcontext
+def snapshot_stock_command(snapshot_date, backfill_days):
+    """Record end-of-day stock snapshots (run daily, e.g. from cron)."""
+    day = datetime.strptime(snapshot_date, '%Y-%m-%d').date() if snapshot_date else date.today() - timedelta(days=1)
+    for offset in range(backfill_days, -1, -1):
+        run = take_stock_snapshot(day - timedelta(days=offset))
+        click.echo(f'{run.snapshot_date}: {run.item_count} items, RM{run.total_value:.2f}')
@@ -0,0 +1,176 @@
+"""
+Tenancy Module for PocketBizz
+Partitions business data by owner: the tenant is the Supabase user from
+get_current_user(), new rows are stamped with it and every ORM query on a
+TenantMixin model is filtered by it, so each business only reads its own
+rows through the tenant-leading indexes
+"""
+
+import contextvars
+import logging
+from contextlib import contextmanager
+
+import click
+from flask import current_app, g, has_request_context
+from flask.cli import with_appcontext
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session, with_loader_criteria
+
+from app import db
+from models import TenantMixin, DailyLedgerRollup
+from rollups import rebuild_rollups
+from supabase_auth import get_current_user
+
+# Explicit scope set by tenant_scope()/all_tenants(); overrides the request user
+_scope = contextvars.ContextVar('tenant_scope', default=None)
+
+# Scope value meaning "no filtering" (admin-wide views, maintenance jobs)
+ALL_TENANTS = object()
+
+
+def tenant_id_for(user):
+    """Tenant id for a user dict (session user or Supabase JWT payload)"""
+    if not user:
+        return None
+    return str(user.get('id') or user.get('sub') or '') or None
+
+
+def current_tenant_id():
+    """Tenant of the current request or scope; None when unscoped (CLI, workers, all_tenants).
+
+    Anonymous requests get '', the tenant of rows created before tenancy.
+    """
+    scope = _scope.get()
+    if scope is ALL_TENANTS:
+        return None
+    if scope is not None:
+        return scope
+    if not has_request_context():
+        return None
+
+    # Resolved once per request: get_current_user() may decode a JWT
+    if '_tenant_id' not in g:
+        g._tenant_id = tenant_id_for(get_current_user()) or ''
+    return g._tenant_id
+
+
+@contextmanager
+def tenant_scope(tenant_id):
+    """Run a block as a given tenant (e.g. a background job for that business)"""
+    token = _scope.set(tenant_id)
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+@contextmanager
+def all_tenants():
+    """Run a block without tenant filtering (admin-wide statistics)"""
+    token = _scope.set(ALL_TENANTS)
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+# === SIGNED BUSINESS LINKS ===
+# Public pages used by people without an account (agents submitting orders)
+# carry the business in a signed token instead of falling back to tenant ''.
+
+def _link_serializer(purpose):
+    return URLSafeSerializer(current_app.secret_key, salt=f'tenant-link:{purpose}')
+
+
+def tenant_link_token(tenant_id, purpose):
+    """Signed token naming a business, for a public link"""
+    return _link_serializer(purpose).dumps(tenant_id)
+
+
+def tenant_from_link_token(token, purpose):
+    """Tenant id from a tenant_link_token; None when missing, tampered or for another purpose"""
+    if not token:
+        return None
+    try:
+        tenant_id = _link_serializer(purpose).loads(token)
+    except BadSignature:
+        return None
+    return tenant_id if isinstance(tenant_id, str) else None
+
+
+# === SESSION HOOKS ===
+
+@event.listens_for(Session, 'do_orm_execute')
+def _filter_by_tenant(execute_state):
+    """Add tenant_id = <current tenant> to ORM selects, updates and deletes"""
+    if not (execute_state.is_select or execute_state.is_update or execute_state.is_delete):
+        return
+    if execute_state.is_column_load or execute_state.is_relationship_load:
+        # Lazy/refresh loads follow from an already tenant-filtered parent
+        return
+
+    tenant_id = current_tenant_id()
+    if tenant_id is None:
+        return
+
+    execute_state.statement = execute_state.statement.options(
+        with_loader_criteria(
+            TenantMixin,
+            lambda cls: cls.tenant_id == tenant_id,
+            include_aliases=True
+        )
+    )
+
+
+@event.listens_for(Session, 'before_flush')
+def _stamp_tenant(session, flush_context, instances):
+    """Give new rows the current tenant"""
+    tenant_id = current_tenant_id()
+    if tenant_id is None:
+        return
+    for obj in session.new:
+        if isinstance(obj, TenantMixin) and not obj.tenant_id:
+            obj.tenant_id = tenant_id
+
+
+def stamp_rows(rows):
+    """Set tenant_id on plain row dicts for bulk inserts (which skip the flush hook)"""
+    tenant_id = current_tenant_id()
+    if tenant_id is not None:
+        for row in rows:
+            row.setdefault('tenant_id', tenant_id)
+    return rows
+
+
+# === BACKFILL ===
+
+def assign_tenant(tenant_id):
+    """Give every row created before tenancy (tenant_id '') to one business"""
+    if not tenant_id:
+        raise ValueError('tenant_id is required')
+
+    moved = {}
+    for mapper in db.Model.registry.mappers:
+        model = mapper.class_
+        if not issubclass(model, TenantMixin) or model is DailyLedgerRollup:
+            continue
+        table = model.__table__
+        moved[table.name] = db.session.execute(
+            update(table).where(table.c.tenant_id == '').values(tenant_id=tenant_id)
+        ).rowcount
+    db.session.commit()
+
+    # Rollups are regrouped from the reassigned transactions
+    rebuild_rollups()
+    logging.info(f"✅ Assigned {sum(moved.values())} rows to tenant {tenant_id}")
+    return moved
+
+
+@click.command('assign-tenant')
+@click.argument('tenant_id')
+@with_appcontext
+def assign_tenant_command(tenant_id):
+    """Assign all rows without a tenant to TENANT_ID (the owner's Supabase user id)."""
+    for table, count in sorted(assign_tenant(tenant_id).items()):
+        click.echo(f'{table}: {count}')
@@ -0,0 +1,71 @@
+"""
+Streaming CSV Export Module for PocketBizz
+Writes transaction exports as a chunked response straight from a
+server-side cursor, so memory stays flat whatever the date range.
+Optionally gzip-encodes the stream.
+"""
+
+import csv
+import io
+import zlib
+
+from flask import Response, request, stream_with_context
+
+from app import db
+
+# Rows fetched from the cursor (and written out) per batch
+STREAM_BATCH_SIZE = 1000
+
+
+def iter_rows(statement, batch_size=STREAM_BATCH_SIZE):
+    """Iterate a select with a server-side cursor, batch_size rows at a time"""
+    result = db.session.execute(statement.execution_options(yield_per=batch_size))
+    for partition in result.partitions():
+        yield partition
+
+
+def csv_chunks(statement, header, format_row, batch_size=STREAM_BATCH_SIZE):
+    """Yield the CSV as one encoded chunk per cursor batch"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(header)
+    yield buffer.getvalue().encode('utf-8')
+
+    for partition in iter_rows(statement, batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(format_row(row) for row in partition)
+        yield buffer.getvalue().encode('utf-8')
+
+
+def gzip_chunks(chunks):
+    """Gzip-compress a stream of byte chunks incrementally"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def wants_gzip():
+    """Gzip only when asked for (?gzip=1) and the client accepts it"""
+    requested = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    return requested and 'gzip' in request.accept_encodings
+
+
+def csv_response(statement, header, format_row, filename):
+    """Chunked CSV download for a select, gzip-encoded on request"""
+    chunks = csv_chunks(statement, header, format_row)
+
+    headers = {
+        'Content-Disposition': f'attachment; filename={filename}',
+        'Vary': 'Accept-Encoding',
+        'X-Accel-Buffering': 'no',
+    }
+    if wants_gzip():
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+
+    return Response(stream_with_context(chunks), mimetype='text/csv', headers=headers)
@@ -0,0 +1,297 @@
+"""
+Streaming CSV Import Module for PocketBizz
+Reads Shopee/TikTok order exports incrementally and writes them in
+committed chunks with bulk inserts instead of one ORM object per row.
+Each order line gets a key (product, variation, SKU and which repeat of
+them it is within the order); the insert skips lines already stored via
+the unique (tenant, channel, Order ID, line key) index, so re-uploading an
+overlapping export is idempotent, even for two uploads running at once.
+"""
+
+import csv
+import hashlib
+import io
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import insert, select, update, bindparam
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from models import Transaction
+from rollups import apply_rollup_deltas, deltas_for_rows
+from tenancy import stamp_rows
+
+# Rows written per INSERT batch / commit
+CHUNK_SIZE = 1000
+
+# Row-level errors reported back to the client (the rest are only counted)
+MAX_ERROR_REPORTS = 100
+
+# Column names used by each marketplace export
+SOURCE_COLUMNS = {
+    'shopee': {
+        'order_id': 'Order ID',
+        'product': 'Product Name',
+        'amount': 'Order Amount',
+        'date': 'Order Date',
+        'variation': 'Variation Name',
+        'sku': 'SKU Reference No.',
+    },
+    'tiktok': {
+        'order_id': 'Order ID',
+        'product': 'Product',
+        'amount': 'Total Amount',
+        'date': 'Created Time',
+        'variation': 'Variation',
+        'sku': 'Seller SKU',
+    },
+}
+
+# Columns of the unique order line index, and the ones returned for the rollup deltas
+ORDER_LINE_KEY = ('tenant_id', 'channel', 'external_order_id', 'external_line_key')
+ROLLUP_COLUMNS = ('tenant_id', 'type', 'amount', 'channel', 'category', 'date')
+
+
+def parse_order_date(date_str, default):
+    """Parse the leading YYYY-MM-DD of an export timestamp"""
+    if date_str:
+        try:
+            return datetime.strptime(date_str.split()[0], '%Y-%m-%d')
+        except (ValueError, IndexError):
+            pass
+    return default
+
+
+def line_key(product, variation, sku, occurrence):
+    """Key of one order line: the item bought and which repeat of it this is within the order"""
+    parts = [' '.join((value or '').lower().split()) for value in (product, variation, sku)]
+    return hashlib.sha256('\x1f'.join(parts + [str(occurrence)]).encode()).hexdigest()
+
+
+def parse_row(row, source, default_date, occurrences):
+    """Map one CSV row to Transaction column values (None = nothing to import).
+
+    occurrences counts (Order ID, item) lines seen so far in the file; an
+    order's lines all come in the same export, so the n-th identical line
+    of an order gets the same key on every upload.
+    """
+    columns = SOURCE_COLUMNS[source]
+
+    amount_str = (row.get(columns['amount']) or '0').replace(',', '').strip()
+    try:
+        amount = float(amount_str or 0)
+    except ValueError:
+        raise ValueError(f"Jumlah tidak sah: {row.get(columns['amount'])!r}")
+
+    if amount <= 0:
+        return None
+
+    order_id = (row.get(columns['order_id']) or '').strip()[:100]
+    key = None
+    if order_id:
+        item = tuple(row.get(columns[name]) or '' for name in ('product', 'variation', 'sku'))
+        occurrences[(order_id, item)] += 1
+        key = line_key(*item, occurrences[(order_id, item)])
+    return {
+        'type': 'income',
+        'amount': amount,
+        'description': (order_id + ' - ' + (row.get(columns['product']) or ''))[:200],
+        'channel': source,
+        'category': 'Online Sales',
+        'date': parse_order_date(row.get(columns['date'], ''), default_date),
+        'external_order_id': order_id or None,
+        'external_line_key': key,
+    }
+
+
+def _skip_existing_statement(dialect_name):
+    """INSERT that skips order lines already in the unique index and returns the rows it wrote"""
+    if dialect_name == 'postgresql':
+        stmt = postgresql.insert(Transaction.__table__)
+    elif dialect_name == 'sqlite':
+        stmt = sqlite.insert(Transaction.__table__)
+    else:
+        return None
+
+    table = Transaction.__table__
+    return stmt.on_conflict_do_nothing(
+        index_elements=[table.c[name] for name in ORDER_LINE_KEY]
+    ).returning(*[table.c[name] for name in ROLLUP_COLUMNS])
+
+
+def _drop_existing(rows, source):
+    """Generic fallback: remove rows whose order line is already stored or earlier in the batch"""
+    order_ids = {row['external_order_id'] for row in rows if row['external_order_id']}
+    existing = set()
+    if order_ids:
+        existing = set(db.session.execute(
+            select(Transaction.external_order_id, Transaction.external_line_key).where(
+                Transaction.channel == source,
+                Transaction.external_order_id.in_(order_ids)
+            )
+        ).all())
+
+    fresh = []
+    for row in rows:
+        if row['external_order_id']:
+            key = (row['external_order_id'], row['external_line_key'])
+            if key in existing:
+                continue
+            existing.add(key)
+        fresh.append(row)
+    return fresh
+
+
+def _write_chunk(rows, source):
+    """Bulk insert the new rows of one chunk and keep the daily rollup in step"""
+    rows = stamp_rows(rows)
+    stmt = _skip_existing_statement(db.session.connection().dialect.name)
+    if stmt is not None:
+        # Only the rows actually inserted come back, so duplicates never reach the rollup
+        written = [dict(row._mapping) for row in db.session.execute(stmt, rows)] if rows else []
+    else:
+        written = _drop_existing(rows, source)
+        if written:
+            db.session.execute(insert(Transaction), written)
+    if written:
+        apply_rollup_deltas(db.session.connection(), deltas_for_rows(written))
+    db.session.commit()
+    return len(written)
+
+
+def import_csv_stream(binary_stream, source, chunk_size=CHUNK_SIZE):
+    """Import a marketplace CSV from a binary stream, one committed chunk at a time"""
+    if source not in SOURCE_COLUMNS:
+        raise ValueError(f'Sumber CSV tidak disokong: {source}')
+
+    started = time.perf_counter()
+    text_stream = io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(text_stream)
+    default_date = datetime.now()
+    occurrences = defaultdict(int)
+
+    result = {
+        'source': source,
+        'rows_read': 0,
+        'imported': 0,
+        'skipped': 0,
+        'duplicates': 0,
+        'failed': 0,
+        'chunks': [],
+        'errors': [],
+    }
+
+    def record_error(line, message):
+        result['failed'] += 1
+        if len(result['errors']) < MAX_ERROR_REPORTS:
+            result['errors'].append({'line': line, 'error': message})
+
+    def flush(rows, lines):
+        chunk_started = time.perf_counter()
+        duplicates = 0
+        try:
+            imported = _write_chunk(rows, source)
+            duplicates = len(rows) - imported
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"CSV import chunk failed: {str(e)}")
+            for line in lines:
+                record_error(line, f'Ralat menyimpan baris: {str(e)}')
+            imported = 0
+
+        result['imported'] += imported
+        result['duplicates'] += duplicates
+        result['chunks'].append({
+            'chunk': len(result['chunks']) + 1,
+            'rows': len(rows),
+            'imported': imported,
+            'duplicates': duplicates,
+            'rows_read': result['rows_read'],
+            'seconds': round(time.perf_counter() - chunk_started, 4),
+        })
+
+    rows, lines = [], []
+    try:
+        for row in reader:
+            result['rows_read'] += 1
+            try:
+                values = parse_row(row, source, default_date, occurrences)
+            except Exception as e:
+                record_error(reader.line_num, str(e))
+                continue
+
+            if values is None:
+                result['skipped'] += 1
+                continue
+
+            rows.append(values)
+            lines.append(reader.line_num)
+            if len(rows) >= chunk_size:
+                flush(rows, lines)
+                rows, lines = [], []
+
+        if rows:
+            flush(rows, lines)
+    finally:
+        # Leave the underlying upload stream for werkzeug to close
+        text_stream.detach()
+
+    elapsed = time.perf_counter() - started
+    result['elapsed_seconds'] = round(elapsed, 4)
+    result['rows_per_second'] = round(result['rows_read'] / elapsed, 1) if elapsed > 0 else None
+    result['errors_truncated'] = result['failed'] > len(result['errors'])
+    return result
+
+
+def backfill_order_ids(batch_size=CHUNK_SIZE):
+    """Fill external_order_id and external_line_key on marketplace rows imported before those columns existed"""
+    table = Transaction.__table__
+    # Older imports kept no variation or SKU: their lines are keyed on the product name alone
+    occurrences = defaultdict(int)
+    updated = 0
+    while True:
+        rows = db.session.execute(
+            select(table.c.id, table.c.tenant_id, table.c.channel, table.c.description).where(
+                table.c.channel.in_(list(SOURCE_COLUMNS)),
+                table.c.category == 'Online Sales',
+                table.c.external_line_key.is_(None)
+            ).order_by(table.c.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        params = []
+        for row_id, tenant_id, channel, description in rows:
+            if ' - ' in description:
+                order_id, product = description.split(' - ', 1)
+                order_id = order_id.strip()[:100]
+                item = (tenant_id, channel, order_id, product)
+                occurrences[item] += 1
+                key = line_key(product, '', '', occurrences[item])
+            else:
+                # No "<Order ID> - <product>" description: '' with a per-row key moves the loop past it
+                order_id, key = '', f'row:{row_id}'
+            params.append({'row_id': row_id, 'order_id': order_id, 'line_key': key})
+
+        db.session.execute(
+            update(table).where(table.c.id == bindparam('row_id')).values(
+                external_order_id=bindparam('order_id'),
+                external_line_key=bindparam('line_key')
+            ),
+            params
+        )
+        db.session.commit()
+        updated += len(rows)
+    return updated
+
+
+@click.command('backfill-order-ids')
+@with_appcontext
+def backfill_order_ids_command():
+    """Set the marketplace Order ID and line key on previously imported CSV rows."""
+    click.echo(f'Updated {backfill_order_ids()} transactions')
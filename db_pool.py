@@ -0,0 +1,198 @@
+"""
+Database Pool Module for PocketBizz
+SQLAlchemy connection pool settings from the environment, with a mode for
+the Supabase transaction pooler (PgBouncer/Supavisor on port 6543), pool
+counters, and a load test that reports connection reuse and checkout
+latency
+"""
+
+import os
+import threading
+from time import perf_counter
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, Pool
+
+# Supabase pooler port that runs PgBouncer-style transaction pooling
+TRANSACTION_POOLER_PORT = 6543
+
+POOL_MODES = ('auto', 'session', 'transaction', 'none')
+
+# Pool-wide counters, updated from pool events
+_counters = {'connects': 0, 'checkouts': 0}
+_counters_lock = threading.Lock()
+
+
+def _env_int(environ, name, default):
+    value = environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def _env_bool(environ, name, default):
+    value = environ.get(name)
+    if value in (None, ''):
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def pool_mode(database_uri, environ=os.environ):
+    """Effective DB_POOL_MODE: 'auto' picks 'transaction' for the Supabase pooler port"""
+    mode = (environ.get('DB_POOL_MODE') or 'auto').lower()
+    if mode not in POOL_MODES:
+        raise ValueError(f'DB_POOL_MODE must be one of {", ".join(POOL_MODES)}, not {mode!r}')
+    if mode != 'auto':
+        return mode
+
+    url = make_url(database_uri)
+    if url.get_backend_name() == 'postgresql' and url.port == TRANSACTION_POOLER_PORT:
+        return 'transaction'
+    return 'session'
+
+
+def engine_options(database_uri, environ=os.environ):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database and pool mode.
+
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE and
+    DB_POOL_PRE_PING tune the pool; DB_STATEMENT_CACHE_SIZE sizes the
+    compiled SQL cache. Pre-ping is off by default: it costs a round trip
+    on every checkout, and pool_recycle already retires connections before
+    Supabase's idle timeout.
+    """
+    url = make_url(database_uri)
+    mode = pool_mode(database_uri, environ)
+    options = {
+        'query_cache_size': _env_int(environ, 'DB_STATEMENT_CACHE_SIZE', 1200),
+        'pool_pre_ping': _env_bool(environ, 'DB_POOL_PRE_PING', False),
+    }
+
+    if url.get_backend_name() != 'postgresql':
+        options['pool_recycle'] = _env_int(environ, 'DB_POOL_RECYCLE', 300)
+        return options
+
+    if mode == 'none':
+        # One connection per checkout, e.g. when an external pooler does all pooling
+        options['poolclass'] = NullPool
+        return options
+
+    options.update({
+        'pool_size': _env_int(environ, 'DB_POOL_SIZE', 5),
+        'max_overflow': _env_int(environ, 'DB_MAX_OVERFLOW', 5 if mode == 'transaction' else 10),
+        'pool_timeout': _env_int(environ, 'DB_POOL_TIMEOUT', 10),
+        'pool_recycle': _env_int(environ, 'DB_POOL_RECYCLE', 300),
+        # Reuse the most recent connection so idle extras age out and get recycled
+        'pool_use_lifo': True,
+    })
+
+    # psycopg2 binds parameters client-side and never prepares statements on the
+    # server, so transaction pooling needs no driver options: only a smaller overflow
+    return options
+
+
+# === POOL COUNTERS ===
+
+@event.listens_for(Pool, 'connect')
+def _count_connect(dbapi_connection, connection_record):
+    with _counters_lock:
+        _counters['connects'] += 1
+
+
+@event.listens_for(Pool, 'checkout')
+def _count_checkout(dbapi_connection, connection_record, connection_proxy):
+    with _counters_lock:
+        _counters['checkouts'] += 1
+
+
+def pool_counters():
+    """New DBAPI connections and checkouts since process start"""
+    with _counters_lock:
+        return dict(_counters)
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_pool_load_test(engine, threads=20, iterations=50, statement='SELECT 1'):
+    """Check out a connection and run one statement iterations times in each of threads threads"""
+    checkout_times, query_times, errors = [], [], []
+    lock = threading.Lock()
+    query = text(statement)
+
+    def worker():
+        local_checkout, local_query = [], []
+        for _ in range(iterations):
+            try:
+                started = perf_counter()
+                with engine.connect() as connection:
+                    checked_out = perf_counter()
+                    connection.execute(query).fetchall()
+                    local_query.append(perf_counter() - checked_out)
+                local_checkout.append(checked_out - started)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+        with lock:
+            checkout_times.extend(local_checkout)
+            query_times.extend(local_query)
+
+    before = pool_counters()
+    started = perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = perf_counter() - started
+    after = pool_counters()
+
+    checkouts = after['checkouts'] - before['checkouts']
+    connects = after['connects'] - before['connects']
+    return {
+        'checkouts': checkouts,
+        'new_connections': connects,
+        'reuse_ratio': round(1 - connects / checkouts, 4) if checkouts else 0,
+        'checkout_ms': {
+            'p50': round(_percentile(checkout_times, 0.5) * 1000, 3),
+            'p95': round(_percentile(checkout_times, 0.95) * 1000, 3),
+            'max': round(max(checkout_times, default=0) * 1000, 3),
+        },
+        'query_ms': {
+            'p50': round(_percentile(query_times, 0.5) * 1000, 3),
+            'p95': round(_percentile(query_times, 0.95) * 1000, 3),
+        },
+        'requests_per_second': round(len(query_times) / elapsed, 1) if elapsed else 0,
+        'errors': errors[:10],
+        'error_count': len(errors),
+        'pool_status': engine.pool.status(),
+    }
+
+
+@click.command('loadtest-db')
+@click.option('--threads', default=20, show_default=True, help='Concurrent threads checking out connections.')
+@click.option('--iterations', default=50, show_default=True, help='Checkouts per thread.')
+@click.option('--statement', default='SELECT 1', show_default=True, help='SQL run on each checkout.')
+@with_appcontext
+def loadtest_db_command(threads, iterations, statement):
+    """Load-test the connection pool and report reuse and checkout latency."""
+    engine = current_app.extensions['sqlalchemy'].engine
+    mode = pool_mode(current_app.config['SQLALCHEMY_DATABASE_URI'])
+    click.echo(f'pool mode: {mode}  ({engine.pool.__class__.__name__})')
+
+    result = run_pool_load_test(engine, threads, iterations, statement)
+    click.echo(f"checkouts: {result['checkouts']}  new connections: {result['new_connections']}  "
+               f"reuse: {result['reuse_ratio'] * 100:.1f}%")
+    click.echo(f"checkout ms  p50 {result['checkout_ms']['p50']}  p95 {result['checkout_ms']['p95']}  "
+               f"max {result['checkout_ms']['max']}")
+    click.echo(f"query ms     p50 {result['query_ms']['p50']}  p95 {result['query_ms']['p95']}")
+    click.echo(f"throughput: {result['requests_per_second']} checkouts/s")
+    click.echo(f"pool: {result['pool_status']}")
+    if result['error_count']:
+        click.echo(f"errors: {result['error_count']} (first: {result['errors'][0]})")
+        raise SystemExit(1)
@@ -0,0 +1,280 @@
+"""
+Forecasting Module for PocketBizz
+Revenue, profit and order forecasts from additive Holt-Winters models
+(weekly seasonality) fitted per business and per sales channel on the
+daily ledger rollup, with prediction intervals. Fitted models are kept in
+memory and advanced one closed day at a time, so a request normally only
+evaluates the cached model instead of refitting.
+"""
+
+import math
+import threading
+import time
+from datetime import date, timedelta
+
+from rollups import daily_channel_totals, on_rollup_change
+from tenancy import current_tenant_id
+
+SEASON_DAYS = 7
+HORIZON_DAYS = 30
+
+# Closed days of history a model is fitted on
+HISTORY_DAYS = 182
+
+# Prediction interval coverage (percent) and its normal quantile
+INTERVAL_LEVEL = 80
+INTERVAL_Z = 1.2816
+
+# Full refit after this many incremental day updates, or this many seconds
+# (bounds drift from other worker processes' backdated writes)
+REFIT_AFTER_DAYS = 7
+MAX_MODEL_AGE = 3600
+
+# (alpha, beta, gamma) candidates for the level, trend and seasonal smoothing
+SMOOTHING_GRID = [
+    (alpha, beta, gamma)
+    for alpha in (0.05, 0.2, 0.4)
+    for beta in (0.0, 0.01, 0.05)
+    for gamma in (0.0, 0.1, 0.3)
+    if beta <= alpha and gamma <= 1 - alpha
+]
+
+# tenant -> _ForecastEntry
+_entries = {}
+_lock = threading.Lock()
+
+
+class SeasonalModel:
+    """Additive Holt-Winters state for one daily series, in error-correction (ETS A,A,A) form"""
+
+    __slots__ = ('alpha', 'beta', 'gamma', 'level', 'trend', 'season', 'sse', 'count')
+
+    def __init__(self, alpha, beta, gamma, level, trend, season):
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.level = level
+        self.trend = trend
+        self.season = season  # season[0] is the seasonal term of the next day
+        self.sse = 0.0
+        self.count = 0
+
+    def update(self, values):
+        """Advance the state over new observations with the fitted smoothing parameters"""
+        level, trend, season = self.level, self.trend, self.season
+        for value in values:
+            seasonal = season.pop(0)
+            error = value - (level + trend + seasonal)
+            level = level + trend + self.alpha * error
+            trend = trend + self.beta * error
+            season.append(seasonal + self.gamma * error)
+            self.sse += error * error
+            self.count += 1
+        self.level, self.trend = level, trend
+        return self
+
+    def copy(self):
+        """Independent copy, so a cached model is never advanced while another request reads it"""
+        model = SeasonalModel(self.alpha, self.beta, self.gamma, self.level, self.trend, list(self.season))
+        model.sse, model.count = self.sse, self.count
+        return model
+
+    @property
+    def sigma(self):
+        return math.sqrt(self.sse / self.count) if self.count else 0.0
+
+    def _weights(self, horizon):
+        # c_j: effect of a one-step error on the forecast j steps later
+        return [self.alpha + self.beta * j + (self.gamma if j % SEASON_DAYS == 0 else 0.0)
+                for j in range(1, horizon)]
+
+    def forecast(self, horizon):
+        """Point forecasts and their standard errors for the next `horizon` days"""
+        points = [self.level + h * self.trend + self.season[(h - 1) % SEASON_DAYS] for h in range(1, horizon + 1)]
+        errors, total = [], 0.0
+        for weight in [0.0] + self._weights(horizon):
+            total += weight * weight
+            errors.append(self.sigma * math.sqrt(1 + total))
+        return points, errors
+
+    def forecast_total(self, horizon):
+        """Forecast of the sum of the next `horizon` days and its standard error"""
+        points, _ = self.forecast(horizon)
+        # The error of day k feeds every later day of the period: 1 + c_1 + ... + c_(horizon-k)
+        weights = self._weights(horizon)
+        variance, cumulative = 0.0, 0.0
+        for k in range(horizon, 0, -1):
+            variance += (1 + cumulative) ** 2
+            if horizon - k < len(weights):
+                cumulative += weights[horizon - k]
+        return sum(points), self.sigma * math.sqrt(variance)
+
+
+def _initial_state(values):
+    if len(values) >= 2 * SEASON_DAYS:
+        first = sum(values[:SEASON_DAYS]) / SEASON_DAYS
+        second = sum(values[SEASON_DAYS:2 * SEASON_DAYS]) / SEASON_DAYS
+        return first, (second - first) / SEASON_DAYS, [value - first for value in values[:SEASON_DAYS]]
+    mean = sum(values) / len(values) if values else 0.0
+    return mean, 0.0, [0.0] * SEASON_DAYS
+
+
+def fit_series(values):
+    """Fit a SeasonalModel to a daily series, picking the smoothing with the lowest one-step error"""
+    level, trend, season = _initial_state(values)
+    seasonal = len(values) >= 2 * SEASON_DAYS
+
+    best = None
+    for alpha, beta, gamma in SMOOTHING_GRID:
+        if not seasonal and gamma:
+            continue
+        model = SeasonalModel(alpha, beta, gamma, level, trend, list(season)).update(values)
+        if best is None or model.sse < best.sse:
+            best = model
+    return best
+
+
+# === PER-TENANT CACHE ===
+
+class _ForecastEntry:
+    __slots__ = ('last_day', 'models', 'days', 'updates', 'fitted_at')
+
+    def __init__(self, last_day, models, days):
+        self.last_day = last_day
+        self.models = models
+        self.days = days
+        self.updates = 0
+        self.fitted_at = time.monotonic()
+
+
+def _daily_series(start, end):
+    """{series name: [value per day]} for [start, end): revenue, profit, orders and channel:<name>"""
+    days = (end - start).days
+    series = {'revenue': [0.0] * days, 'profit': [0.0] * days, 'orders': [0.0] * days}
+    for day, transaction_type, channel, total, count in daily_channel_totals(start, end):
+        index = (day - start).days
+        if transaction_type == 'income':
+            series['revenue'][index] += total
+            series['profit'][index] += total
+            series['orders'][index] += count
+            series.setdefault(f'channel:{channel}', [0.0] * days)[index] += total
+        elif transaction_type == 'expense':
+            series['profit'][index] -= total
+    return series
+
+
+def _fit_entry(last_day):
+    start = last_day - timedelta(days=HISTORY_DAYS - 1)
+    series = _daily_series(start, last_day + timedelta(days=1))
+
+    # New businesses: train from their first day with any activity, not on leading zeros
+    first = next((i for i, value in enumerate(series['revenue']) if value or series['profit'][i]), len(series['revenue']))
+    models = {name: fit_series(values[first:]) for name, values in series.items()}
+    return _ForecastEntry(last_day, models, len(series['revenue']) - first)
+
+
+def _advance_entry(entry, last_day):
+    """New entry fed with the days closed since `entry` was fitted; None when a full refit is needed.
+
+    The cached entry is left untouched: other requests may be reading it.
+    """
+    series = _daily_series(entry.last_day + timedelta(days=1), last_day + timedelta(days=1))
+    if not entry.days or set(series) - set(entry.models):
+        return None  # no history yet, or a channel the models have not seen
+
+    new_days = (last_day - entry.last_day).days
+    models = {name: model.copy().update(series.get(name) or [0.0] * new_days)
+              for name, model in entry.models.items()}
+    advanced = _ForecastEntry(last_day, models, entry.days + new_days)
+    advanced.updates = entry.updates + new_days
+    advanced.fitted_at = entry.fitted_at
+    return advanced
+
+
+def _current_entry(last_day):
+    tenant = current_tenant_id()
+    with _lock:
+        entry = _entries.get(tenant)
+
+    stale = (entry is None or entry.last_day > last_day or entry.updates >= REFIT_AFTER_DAYS
+             or time.monotonic() - entry.fitted_at > MAX_MODEL_AGE)
+    if stale:
+        entry = _fit_entry(last_day)
+    elif entry.last_day < last_day:
+        entry = _advance_entry(entry, last_day) or _fit_entry(last_day)
+
+    with _lock:
+        _entries[tenant] = entry
+    return entry
+
+
+def invalidate_forecasts(changes):
+    """Drop fitted models whose history contains a changed date of their tenant.
+
+    changes is {tenant: dates}; None drops every model.
+    """
+    with _lock:
+        if changes is None:
+            _entries.clear()
+            return
+        if None in _entries:
+            # The unscoped model (tenant None) is fitted on every tenant's rows
+            changes = {**changes, None: set().union(*changes.values())}
+        for tenant, dates in changes.items():
+            entry = _entries.get(tenant)
+            if entry is not None and dates and min(dates) <= entry.last_day:
+                del _entries[tenant]
+
+
+@on_rollup_change
+def _rollup_changed(connection, changes):
+    # Today's sales are not in any model yet; only backdated writes force a refit
+    invalidate_forecasts(changes)
+
+
+# === FORECAST ===
+
+def _interval(point, error, floor=None):
+    lower, upper = point - INTERVAL_Z * error, point + INTERVAL_Z * error
+    if floor is not None:
+        point, lower = max(point, floor), max(lower, floor)
+    return round(point, 2), round(lower, 2), round(upper, 2)
+
+
+def revenue_forecast(today=None, horizon=HORIZON_DAYS):
+    """Next `horizon` days of revenue, profit and orders with INTERVAL_LEVEL% prediction intervals"""
+    today = today or date.today()
+    entry = _current_entry(today - timedelta(days=1))
+    models = entry.models
+
+    revenue = _interval(*models['revenue'].forecast_total(horizon), floor=0)
+    profit = _interval(*models['profit'].forecast_total(horizon))
+    orders = _interval(*models['orders'].forecast_total(horizon), floor=0)
+
+    channels = {}
+    for name, model in models.items():
+        if name.startswith('channel:'):
+            point, lower, upper = _interval(*model.forecast_total(horizon), floor=0)
+            channels[name.split(':', 1)[1]] = {'revenue': point, 'lower': lower, 'upper': upper}
+
+    points, errors = models['revenue'].forecast(horizon)
+    daily = []
+    for h, (point, error) in enumerate(zip(points, errors)):
+        point, lower, upper = _interval(point, error, floor=0)
+        daily.append({'date': (today + timedelta(days=h)).isoformat(), 'revenue': point, 'lower': lower, 'upper': upper})
+
+    return {
+        'nextMonth': {'revenue': revenue[0], 'orders': int(round(orders[0])), 'profit': profit[0]},
+        'interval': {
+            'level': INTERVAL_LEVEL,
+            'revenue': [revenue[1], revenue[2]],
+            'orders': [int(orders[1]), int(math.ceil(orders[2]))],
+            'profit': [profit[1], profit[2]],
+        },
+        'channels': channels,
+        'daily': daily,
+        'confidence': INTERVAL_LEVEL,
+        'model': 'holt-winters',
+        'historyDays': entry.days,
+        'trainedThrough': entry.last_day.isoformat(),
+    }
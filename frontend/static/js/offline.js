@@ -8,6 +8,7 @@ class OfflineManager {
         this.dbName = 'PocketBizzOffline';
         this.dbVersion = 1;
         this.storeName = 'transactions';
+        this.syncBatchSize = 500; // Server limit per /api/transactions/batch request
         this.db = null;
         this.isOnline = navigator.onLine;
         
@@ -139,7 +140,8 @@ class OfflineManager {
             ...transactionData,
             timestamp: new Date().toISOString(),
             synced: false,
-            offlineId: Date.now() + Math.random() // Unique offline ID
+            offlineId: Date.now() + Math.random(), // Unique offline ID
+            idempotencyKey: this.newIdempotencyKey()
         };
         
         return new Promise((resolve, reject) => {
@@ -194,13 +196,20 @@ class OfflineManager {
             
             let syncedCount = 0;
             
-            for (const transaction of offlineTransactions) {
-                try {
-                    await this.syncSingleTransaction(transaction);
-                    await this.markTransactionAsSynced(transaction.id);
-                    syncedCount++;
-                } catch (error) {
-                    console.error('Failed to sync transaction:', transaction, error);
+            // One request per batch instead of one POST per transaction
+            for (let i = 0; i < offlineTransactions.length; i += this.syncBatchSize) {
+                const batch = offlineTransactions.slice(i, i + this.syncBatchSize);
+                const results = await this.syncTransactionBatch(batch);
+                
+                for (const result of results) {
+                    const transaction = batch[result.index];
+                    if (result.status === 'invalid') {
+                        console.error('Transaction rejected by server:', transaction, result.error);
+                        await this.markTransactionAsSynced(transaction.id, result.error);
+                    } else {
+                        await this.markTransactionAsSynced(transaction.id);
+                        syncedCount++;
+                    }
                 }
             }
             
@@ -218,27 +227,46 @@ class OfflineManager {
         }
     }
     
-    async syncSingleTransaction(transactionData) {
-        const formData = new FormData();
-        formData.append('type', transactionData.type);
-        formData.append('amount', transactionData.amount);
-        formData.append('description', transactionData.description);
-        formData.append('channel', transactionData.channel);
-        formData.append('category', transactionData.category || '');
-        
-        const response = await fetch('/add_transaction', {
+    async syncTransactionBatch(transactions) {
+        const response = await fetch('/api/transactions/batch', {
             method: 'POST',
-            body: formData
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                transactions: transactions.map(transaction => ({
+                    // Lets the server skip items a previous, interrupted sync already saved
+                    idempotency_key: transaction.idempotencyKey || String(transaction.offlineId),
+                    type: transaction.type,
+                    amount: transaction.amount,
+                    description: transaction.description,
+                    channel: transaction.channel,
+                    category: transaction.category || '',
+                    date: transaction.date || this.localDateTime(transaction.timestamp)
+                }))
+            })
         });
         
         if (!response.ok) {
             throw new Error(`HTTP ${response.status}: ${response.statusText}`);
         }
         
-        return response;
+        const data = await response.json();
+        return data.results;
+    }
+    
+    localDateTime(isoTimestamp) {
+        // Local wall-clock time of the offline entry, without a timezone (as the forms send it)
+        const date = new Date(isoTimestamp);
+        return new Date(date.getTime() - date.getTimezoneOffset() * 60000).toISOString().slice(0, 19);
     }
     
-    async markTransactionAsSynced(transactionId) {
+    newIdempotencyKey() {
+        if (window.crypto && typeof window.crypto.randomUUID === 'function') {
+            return window.crypto.randomUUID();
+        }
+        return `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+    }
+    
+    async markTransactionAsSynced(transactionId, rejectedReason = null) {
         const transaction = this.db.transaction([this.storeName], 'readwrite');
         const store = transaction.objectStore(this.storeName);
         
@@ -249,6 +277,9 @@ class OfflineManager {
                 const data = request.result;
                 data.synced = true;
                 data.syncedAt = new Date().toISOString();
+                if (rejectedReason) {
+                    data.rejectedReason = rejectedReason;
+                }
                 
                 const updateRequest = store.put(data);
                 updateRequest.onsuccess = () => resolve();
@@ -310,7 +341,8 @@ class OfflineManager {
             amount: parseFloat(formData.get('amount')),
             description: formData.get('description'),
             channel: formData.get('channel'),
-            category: formData.get('category') || ''
+            category: formData.get('category') || '',
+            date: formData.get('date') || ''
         };
         
         try {
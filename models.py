@@ -1,7 +1,23 @@
 from datetime import datetime
 from app import db
 
-class Transaction(db.Model):
+# Multi-tenant partitioning: each business row carries its owner's Supabase user id.
+# tenancy.py fills it on insert and filters every ORM query by it; '' = not yet assigned.
+class TenantMixin:
+    tenant_id = db.Column(db.String(64), nullable=False, default='', server_default='')
+
+class Transaction(TenantMixin, db.Model):
+    __table_args__ = (
+        db.Index('ix_transaction_tenant_date_type', 'tenant_id', 'date', 'type'),
+        db.Index('ix_transaction_tenant_date_id', 'tenant_id', 'date', 'id'),  # keyset pagination order
+        db.Index('ix_transaction_tenant_type_channel_date', 'tenant_id', 'type', 'channel', 'date'),
+        db.Index('ix_transaction_tenant_category_type_date', 'tenant_id', 'category', 'type', 'date'),
+        # One row per marketplace order line: CSV re-imports skip lines already stored
+        db.Index('ux_transaction_tenant_channel_order_line', 'tenant_id', 'channel', 'external_order_id',
+                 'external_line_key', unique=True),
+        db.Index('ux_transaction_tenant_idempotency_key', 'tenant_id', 'idempotency_key', unique=True),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     type = db.Column(db.String(20), nullable=False)  # 'income' or 'expense'
     amount = db.Column(db.Float, nullable=False)
@@ -10,6 +26,9 @@ class Transaction(db.Model):
     category = db.Column(db.String(100))
     date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     receipt_image = db.Column(db.String(200))  # Path to uploaded receipt image
+    external_order_id = db.Column(db.String(100))  # Marketplace Order ID for CSV imports
+    external_line_key = db.Column(db.String(64))  # Identity of the line within that order (see csv_import.line_key)
+    idempotency_key = db.Column(db.String(64))  # Client-generated key for offline sync batches
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def __repr__(self):
@@ -25,10 +44,33 @@ class Transaction(db.Model):
             'category': self.category,
             'date': self.date.isoformat(),
             'receipt_image': self.receipt_image,
+            'external_order_id': self.external_order_id,
             'created_at': self.created_at.isoformat()
         }
 
-class BusinessSettings(db.Model):
+# Daily Ledger Rollup (pre-aggregated Transaction totals, maintained by rollups.py)
+class DailyLedgerRollup(TenantMixin, db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('tenant_id', 'date', 'type', 'channel', 'category', name='uq_daily_ledger_rollup_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False)
+    type = db.Column(db.String(20), nullable=False)  # 'income' or 'expense'
+    channel = db.Column(db.String(50), nullable=False)
+    category = db.Column(db.String(100), nullable=False, default='')  # '' stands in for no category
+    total_amount = db.Column(db.Float, nullable=False, default=0.0)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<DailyLedgerRollup {self.date} {self.type}/{self.channel}: RM{self.total_amount}>'
+
+class BusinessSettings(TenantMixin, db.Model):
+    __table_args__ = (
+        db.Index('ix_business_settings_tenant', 'tenant_id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     business_name = db.Column(db.String(200))
     welcome_name = db.Column(db.String(100))  # Personal name for welcome badge
@@ -45,15 +87,20 @@ class BusinessSettings(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 # Product/Inventory Management
-class Product(db.Model):
+class Product(TenantMixin, db.Model):
+    __table_args__ = (
+        db.Index('ix_product_tenant_is_active', 'tenant_id', 'is_active'),
+        db.UniqueConstraint('tenant_id', 'sku', name='uq_product_tenant_sku'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
-    sku = db.Column(db.String(100), unique=True)
+    sku = db.Column(db.String(100))  # unique per tenant
     description = db.Column(db.Text)
     cost_price = db.Column(db.Float, default=0.0)
     selling_price = db.Column(db.Float, default=0.0)
     current_stock = db.Column(db.Integer, default=0)
-    minimum_stock = db.Column(db.Integer, default=10)
+    minimum_stock = db.Column(db.Integer)  # None: use BusinessSettings.low_stock_threshold
     category = db.Column(db.String(100))
     supplier_id = db.Column(db.Integer, db.ForeignKey('supplier.id'))  # Link to supplier table
     
@@ -75,12 +122,12 @@ class Product(db.Model):
     def __repr__(self):
         return f'<Product {self.name}: {self.current_stock} units>'
     
-    @property
-    def is_low_stock(self):
+    def is_low_stock_at(self, threshold):
+        """Low on stock, with `threshold` (the business setting) for items without their own minimum"""
         if self.has_variants:
             # Check if any variant is low stock
-            return any(variant.is_low_stock for variant in self.variants if variant.is_active)
-        return self.current_stock <= self.minimum_stock
+            return any(variant.is_low_stock_at(threshold) for variant in self.variants if variant.is_active)
+        return self.current_stock <= (self.minimum_stock if self.minimum_stock is not None else threshold)
     
     def total_stock(self):
         if self.has_variants:
@@ -88,6 +135,15 @@ class Product(db.Model):
         return self.current_stock
     
     def to_dict(self):
+        return self.to_summary_dict(
+            supplier_name=self.supplier.name if self.supplier else None,
+            is_low_stock=self.is_low_stock,
+            total_stock=self.total_stock(),
+            variant_count=len(self.variants)
+        )
+    
+    def to_summary_dict(self, supplier_name, is_low_stock, total_stock, variant_count):
+        """to_dict() with the relationship-derived fields supplied by the caller (see inventory_queries)"""
         return {
             'id': self.id,
             'name': self.name,
@@ -99,22 +155,27 @@ class Product(db.Model):
             'cost_price': self.cost_price,
             'category': self.category,
             'supplier_id': self.supplier_id,
-            'supplier_name': self.supplier.name if self.supplier else None,
+            'supplier_name': supplier_name,
             'brand': self.brand,
             'model': self.model,
             'barcode': self.barcode,
             'has_variants': self.has_variants,
             'is_active': self.is_active,
-            'is_low_stock': self.is_low_stock,
-            'total_stock': self.total_stock(),
-            'variant_count': len(self.variants),
+            'is_low_stock': is_low_stock,
+            'total_stock': total_stock,
+            'variant_count': variant_count,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
 # Stock Movement Tracking
-class StockMovement(db.Model):
+class StockMovement(TenantMixin, db.Model):
+    __table_args__ = (
+        db.Index('ix_stock_movement_tenant_date', 'tenant_id', 'date'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    variant_id = db.Column(db.Integer, db.ForeignKey('product_variant.id'))  # Set when the movement is for a variant
     movement_type = db.Column(db.String(20), nullable=False)  # 'in', 'out', 'adjustment'
     quantity = db.Column(db.Integer, nullable=False)
     reference_type = db.Column(db.String(50))  # 'sale', 'purchase', 'return', 'adjustment'
@@ -127,7 +188,11 @@ class StockMovement(db.Model):
         return f'<StockMovement {self.movement_type}: {self.quantity} units>'
 
 # Agent/Reseller Management
-class Agent(db.Model):
+class Agent(TenantMixin, db.Model):
+    __table_args__ = (
+        db.Index('ix_agent_tenant_status', 'tenant_id', 'status'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
     phone = db.Column(db.String(20))
@@ -160,7 +225,11 @@ class Agent(db.Model):
         }
 
 # Agent Orders/Sales Submissions
-class AgentOrder(db.Model):
+class AgentOrder(TenantMixin, db.Model):
+    __table_args__ = (
+        db.Index('ix_agent_order_tenant_status', 'tenant_id', 'status'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     agent_id = db.Column(db.Integer, db.ForeignKey('agent.id'), nullable=False)
     order_number = db.Column(db.String(100), unique=True)
@@ -194,8 +263,45 @@ class AgentOrder(db.Model):
             'payment_method': self.payment_method
         }
 
+# Agent Monthly Sales (approved AgentOrder totals per agent and month, maintained by agent_sales.py)
+class AgentMonthlySales(TenantMixin, db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('tenant_id', 'agent_id', 'month', name='uq_agent_monthly_sales_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    agent_id = db.Column(db.Integer, db.ForeignKey('agent.id'), nullable=False)
+    month = db.Column(db.Date, nullable=False)  # First day of the month
+    total_sales = db.Column(db.Float, nullable=False, default=0.0)
+    total_commission = db.Column(db.Float, nullable=False, default=0.0)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<AgentMonthlySales {self.agent_id} {self.month}: RM{self.total_sales}>'
+
+# Number Sequence (per-day counters behind order and PO numbers, allocated by number_sequences.py).
+# Not tenant-scoped: order_number and po_number are unique across all businesses.
+class NumberSequence(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('name', 'period', name='uq_number_sequence_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)  # Number prefix, e.g. 'ORD', 'PO'
+    period = db.Column(db.String(20), nullable=False)  # 'YYYYMMDD'
+    value = db.Column(db.Integer, nullable=False, default=0)  # Last number handed out
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<NumberSequence {self.name}{self.period}: {self.value}>'
+
 # Zakat Calculation History
-class ZakatCalculation(db.Model):
+class ZakatCalculation(TenantMixin, db.Model):
+    __table_args__ = (
+        db.Index('ix_zakat_calculation_tenant_year', 'tenant_id', 'year'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     year = db.Column(db.Integer, nullable=False)
     total_income = db.Column(db.Float, default=0.0)
@@ -230,7 +336,11 @@ class ZakatCalculation(db.Model):
 
 # ===== SUPPLIER & PRODUCT VARIANT SYSTEM =====
 
-class Supplier(db.Model):
+class Supplier(TenantMixin, db.Model):
+    __table_args__ = (
+        db.Index('ix_supplier_tenant_status', 'tenant_id', 'status'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
     company_name = db.Column(db.String(200))
@@ -266,11 +376,16 @@ class Supplier(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
-class ProductVariant(db.Model):
+class ProductVariant(TenantMixin, db.Model):
+    __table_args__ = (
+        db.Index('ix_product_variant_tenant_product_id', 'tenant_id', 'product_id'),
+        db.UniqueConstraint('tenant_id', 'sku', name='uq_product_variant_tenant_sku'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
     variant_name = db.Column(db.String(200), nullable=False)  # e.g., "Merah - Size L"
-    sku = db.Column(db.String(100), unique=True)
+    sku = db.Column(db.String(100))  # unique per tenant
     
     # Variant attributes
     color = db.Column(db.String(50))
@@ -282,7 +397,7 @@ class ProductVariant(db.Model):
     cost_price = db.Column(db.Float, default=0.0)
     selling_price = db.Column(db.Float, default=0.0)
     current_stock = db.Column(db.Integer, default=0)
-    minimum_stock = db.Column(db.Integer, default=5)
+    minimum_stock = db.Column(db.Integer)  # None: use BusinessSettings.low_stock_threshold
     
     # Additional info
     barcode = db.Column(db.String(100))
@@ -293,9 +408,9 @@ class ProductVariant(db.Model):
     def __repr__(self):
         return f'<ProductVariant {self.variant_name}>'
     
-    @property
-    def is_low_stock(self):
-        return self.current_stock <= self.minimum_stock
+    def is_low_stock_at(self, threshold):
+        """Low on stock, with `threshold` (the business setting) when the variant has no minimum"""
+        return self.current_stock <= (self.minimum_stock if self.minimum_stock is not None else threshold)
     
     def to_dict(self):
         return {
@@ -317,7 +432,11 @@ class ProductVariant(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
-class PurchaseOrder(db.Model):
+class PurchaseOrder(TenantMixin, db.Model):
+    __table_args__ = (
+        db.Index('ix_purchase_order_tenant_status', 'tenant_id', 'status'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     po_number = db.Column(db.String(100), unique=True)
     supplier_id = db.Column(db.Integer, db.ForeignKey('supplier.id'), nullable=False)
@@ -369,7 +488,11 @@ class PurchaseOrder(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
-class PurchaseOrderItem(db.Model):
+class PurchaseOrderItem(TenantMixin, db.Model):
+    __table_args__ = (
+        db.Index('ix_purchase_order_item_tenant_po_id', 'tenant_id', 'po_id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     po_id = db.Column(db.Integer, db.ForeignKey('purchase_order.id'), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
@@ -387,6 +510,67 @@ class PurchaseOrderItem(db.Model):
     def __repr__(self):
         return f'<PurchaseOrderItem {self.product.name if self.product else "Unknown"}>'
 
+# Inventory Snapshots (end-of-day stock per product/variant for point-in-time valuation)
+class StockSnapshot(TenantMixin, db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('snapshot_date', 'product_id', 'variant_id', name='uq_stock_snapshot_item'),
+        db.Index('ix_stock_snapshot_tenant_date', 'tenant_id', 'snapshot_date'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    snapshot_date = db.Column(db.Date, nullable=False)  # Stock as at the end of this day
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    variant_id = db.Column(db.Integer, nullable=False, default=0)  # 0 stands in for product-level stock
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    unit_cost = db.Column(db.Float, nullable=False, default=0.0)
+    
+    def __repr__(self):
+        return f'<StockSnapshot {self.snapshot_date} {self.product_id}/{self.variant_id}: {self.quantity}>'
+
+class StockSnapshotRun(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    snapshot_date = db.Column(db.Date, nullable=False, unique=True)
+    last_movement_id = db.Column(db.Integer, nullable=False, default=0)  # Watermark: movements up to here are included
+    item_count = db.Column(db.Integer, default=0)
+    total_value = db.Column(db.Float, default=0.0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<StockSnapshotRun {self.snapshot_date}: movements <= {self.last_movement_id}>'
+
+# Background PDF Report Jobs
+class ReportJob(TenantMixin, db.Model):
+    __table_args__ = (
+        db.Index('ix_report_job_tenant_cache_key', 'tenant_id', 'cache_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    report_type = db.Column(db.String(50), nullable=False)  # 'transactions', 'lhdn'
+    params = db.Column(db.Text, nullable=False)  # JSON encoded report parameters
+    cache_key = db.Column(db.String(64), nullable=False, index=True)  # Hash of type, params and data version
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # 'queued', 'running', 'done', 'failed'
+    filename = db.Column(db.String(200))  # Download filename
+    artifact_path = db.Column(db.String(300))  # Generated PDF on disk
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<ReportJob {self.id} {self.report_type}: {self.status}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'report_type': self.report_type,
+            'status': self.status,
+            'filename': self.filename,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
 class NotificationSettings(db.Model):
     """Notification control settings for admin"""
     id = db.Column(db.Integer, primary_key=True)
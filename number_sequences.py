@@ -0,0 +1,105 @@
+"""
+Number Sequence Module for PocketBizz
+Allocates agent order and purchase order numbers (ORD202501310001,
+PO202501310001) from a per-day counter row incremented with one
+INSERT ... ON CONFLICT DO UPDATE ... RETURNING statement, so two
+simultaneous submissions never get the same number and no table is
+counted
+"""
+
+from datetime import datetime
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app import db
+from models import AgentOrder, PurchaseOrder, NumberSequence
+
+sequence_table = NumberSequence.__table__
+
+# Number prefixes and the column each one fills
+AGENT_ORDER_PREFIX = 'ORD'
+PURCHASE_ORDER_PREFIX = 'PO'
+
+NUMBER_COLUMNS = {
+    AGENT_ORDER_PREFIX: AgentOrder.__table__.c.order_number,
+    PURCHASE_ORDER_PREFIX: PurchaseOrder.__table__.c.po_number,
+}
+
+
+def _highest_issued(connection, name, period):
+    """Highest number already issued for the prefix and day (e.g. by the old count-based scheme), 0 if none"""
+    column = NUMBER_COLUMNS.get(name)
+    if column is None:
+        return 0
+    stem = f'{name}{period}'
+    numbers = connection.execute(select(column).where(column.like(f'{stem}%'))).scalars()
+    suffixes = [int(number[len(stem):]) for number in numbers if number[len(stem):].isdigit()]
+    return max(suffixes, default=0)
+
+
+def _increment_statement(dialect_name, name, period, now, first):
+    """Dialect-specific upsert that creates the counter at `first` or adds 1, returning the new value"""
+    if dialect_name == 'postgresql':
+        stmt = postgresql.insert(sequence_table)
+    elif dialect_name == 'sqlite':
+        stmt = sqlite.insert(sequence_table)
+    else:
+        return None
+
+    return stmt.values(name=name, period=period, value=first, updated_at=now).on_conflict_do_update(
+        index_elements=[sequence_table.c.name, sequence_table.c.period],
+        set_={'value': sequence_table.c.value + 1, 'updated_at': now}
+    ).returning(sequence_table.c.value)
+
+
+def _increment(connection, name, period):
+    now = datetime.utcnow()
+    key = (sequence_table.c.name == name, sequence_table.c.period == period)
+
+    # A new day's counter starts after any number already issued that day
+    first = 1
+    if connection.execute(select(sequence_table.c.id).where(*key)).first() is None:
+        first = _highest_issued(connection, name, period) + 1
+
+    stmt = _increment_statement(connection.dialect.name, name, period, now, first)
+    if stmt is not None:
+        return connection.execute(stmt).scalar_one()
+
+    # Generic fallback: UPDATE first, INSERT when the counter does not exist yet
+    result = connection.execute(
+        update(sequence_table).where(*key).values(value=sequence_table.c.value + 1, updated_at=now)
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(sequence_table), {'name': name, 'period': period, 'value': first, 'updated_at': now})
+    return connection.execute(select(sequence_table.c.value).where(*key)).scalar_one()
+
+
+def next_number(prefix, when=None):
+    """Next '<prefix><YYYYMMDD><nnnn>' number for the day of `when` (default now)"""
+    period = (when or datetime.now()).strftime('%Y%m%d')
+
+    if db.engine.dialect.name == 'postgresql':
+        # Own short transaction, like a database sequence: the counter row is locked
+        # only for this statement, not until the caller commits. A rolled-back
+        # caller leaves a gap in the numbering instead of blocking other submissions.
+        with db.engine.begin() as connection:
+            value = _increment(connection, prefix, period)
+    else:
+        # SQLite allows one writer at a time; a second connection would wait on the session's own lock
+        value = _increment(db.session.connection(), prefix, period)
+
+    return f'{prefix}{period}{value:04d}'
+
+
+# === SESSION HOOKS ===
+
+@event.listens_for(Session, 'before_flush')
+def _assign_numbers(session, flush_context, instances):
+    """Give new agent orders and purchase orders a number when the caller did not set one"""
+    for obj in session.new:
+        if isinstance(obj, AgentOrder) and not obj.order_number:
+            obj.order_number = next_number(AGENT_ORDER_PREFIX)
+        elif isinstance(obj, PurchaseOrder) and not obj.po_number:
+            obj.po_number = next_number(PURCHASE_ORDER_PREFIX)
@@ -0,0 +1,144 @@
+"""
+Query Plan Module for PocketBizz
+Creates missing indexes on existing databases and checks with EXPLAIN
+that the main report queries are served by an index (SQLite and PostgreSQL)
+"""
+
+import json
+import logging
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import select, text, tuple_
+
+from app import db
+from models import Transaction, DailyLedgerRollup, AgentMonthlySales
+
+
+def create_missing_indexes():
+    """Create indexes declared on the models that an older database lacks"""
+    checked = []
+    engine = db.engine
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+            checked.append(index.name)
+    return checked
+
+
+def report_queries():
+    """The raw-table and rollup queries behind the dashboard and report pages, as one tenant runs them"""
+    start = datetime(datetime.now().year, 1, 1)
+    end = start + timedelta(days=31)
+    # Every request adds tenant_id = <business>; '' is the tenant of pre-tenancy rows
+    tenant = ''
+
+    return {
+        'transactions_by_period': select(Transaction.id).where(
+            Transaction.tenant_id == tenant,
+            Transaction.date >= start,
+            Transaction.date < end
+        ).order_by(Transaction.date.desc()),
+        'transactions_keyset_page': select(Transaction.id).where(
+            Transaction.tenant_id == tenant,
+            tuple_(Transaction.date, Transaction.id) < tuple_(end, 2 ** 31 - 1)
+        ).order_by(Transaction.date.desc(), Transaction.id.desc()).limit(21),
+        'transactions_by_type_channel': select(Transaction.id).where(
+            Transaction.tenant_id == tenant,
+            Transaction.type == 'income',
+            Transaction.channel == 'shopee',
+            Transaction.date >= start,
+            Transaction.date < end
+        ),
+        'transactions_by_category': select(Transaction.id).where(
+            Transaction.tenant_id == tenant,
+            Transaction.category == 'Online Sales',
+            Transaction.type == 'income',
+            Transaction.date >= start,
+            Transaction.date < end
+        ),
+        'rollup_by_period': select(DailyLedgerRollup.type, DailyLedgerRollup.total_amount).where(
+            DailyLedgerRollup.tenant_id == tenant,
+            DailyLedgerRollup.date >= start.date(),
+            DailyLedgerRollup.date < end.date()
+        ),
+        'agent_monthly_sales': select(AgentMonthlySales.month, AgentMonthlySales.total_sales).where(
+            AgentMonthlySales.tenant_id == tenant,
+            AgentMonthlySales.agent_id == 1,
+            AgentMonthlySales.month >= start.date(),
+            AgentMonthlySales.month <= end.date()
+        ),
+    }
+
+
+def explain(connection, statement):
+    """Return the database plan for a statement as a list of plan lines"""
+    dialect = connection.dialect
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+
+    if dialect.name == 'sqlite':
+        rows = connection.execute(text(f'EXPLAIN QUERY PLAN {sql}')).fetchall()
+        return [row[-1] for row in rows]
+
+    if dialect.name == 'postgresql':
+        plan = connection.execute(text(f'EXPLAIN (FORMAT JSON) {sql}')).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        lines = []
+        nodes = [plan[0]['Plan']]
+        while nodes:
+            node = nodes.pop()
+            lines.append(f"{node['Node Type']} {node.get('Index Name', '')}".strip())
+            nodes.extend(node.get('Plans', []))
+        return lines
+
+    raise ValueError(f'EXPLAIN not supported for {dialect.name}')
+
+
+def uses_index(plan_lines):
+    """True when the plan reads through an index rather than a full table scan"""
+    for line in plan_lines:
+        if 'INDEX' in line.upper():
+            return True
+    return False
+
+
+def check_report_query_plans():
+    """EXPLAIN every report query and report whether it hits an index"""
+    results = {}
+    with db.engine.connect() as connection:
+        if connection.dialect.name == 'postgresql':
+            # Small tables always favour a sequential scan; ask whether an index path exists
+            connection.execute(text('SET enable_seqscan = off'))
+
+        for name, statement in report_queries().items():
+            plan = explain(connection, statement)
+            results[name] = {'uses_index': uses_index(plan), 'plan': plan}
+
+        connection.rollback()
+    return results
+
+
+@click.command('create-indexes')
+@with_appcontext
+def create_indexes_command():
+    """Create any model indexes missing from an existing database."""
+    for name in create_missing_indexes():
+        click.echo(f'ok  {name}')
+
+
+@click.command('explain-reports')
+@with_appcontext
+def explain_reports_command():
+    """Check with EXPLAIN that the main report queries use an index."""
+    failures = 0
+    for name, result in check_report_query_plans().items():
+        status = 'ok' if result['uses_index'] else 'SCAN'
+        if not result['uses_index']:
+            failures += 1
+        click.echo(f'{status:5} {name}: {" | ".join(result["plan"])}')
+
+    if failures:
+        logging.warning(f"⚠️ {failures} report queries are not using an index")
+        raise SystemExit(1)
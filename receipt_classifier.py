@@ -0,0 +1,115 @@
+"""
+Receipt Classifier Module for PocketBizz
+Categorises receipt OCR text with one word-boundary regex compiled at
+import time from every category keyword (as a prefix trie, so matching
+does not retry each keyword at every position): a single pass over the
+text yields weighted scores for all categories
+"""
+
+import re
+
+# Returned when no keyword matches
+DEFAULT_CATEGORY = 'lain_lain'
+
+# Category keywords; order decides ties (earlier category wins)
+CATEGORY_KEYWORDS = {
+    'makanan': ['restaurant', 'cafe', 'kedai makan', 'food', 'makan', 'restoran', 'mamak', 'mcd', 'kfc', 'pizza', 'burger', 'nasi', 'mee', 'kuih', 'minuman'],
+    'peralatan': ['hardware', 'tools', 'alat', 'peralatan', 'equipment', 'machinery', 'engine', 'motor', 'drill', 'hammer'],
+    'bekalan_pejabat': ['stationery', 'kertas', 'pen', 'paper', 'office', 'pejabat', 'supplies', 'printer', 'ink', 'stapler'],
+    'pengangkutan': ['petrol', 'minyak', 'transport', 'grab', 'taxi', 'toll', 'parking', 'bas', 'train', 'flight', 'fuel'],
+    'utiliti': ['electric', 'water', 'internet', 'phone', 'wifi', 'streamyx', 'celcom', 'maxis', 'digi', 'tnb', 'air', 'bill'],
+    'rawatan_kesihatan': ['hospital', 'clinic', 'doctor', 'ubat', 'medicine', 'pharmacy', 'dentist', 'medical', 'health'],
+    'pakaian': ['clothes', 'shirt', 'pants', 'shoes', 'fashion', 'baju', 'seluar', 'kasut', 'tudung', 'dress'],
+    'pemasaran': ['advertising', 'marketing', 'promotion', 'facebook', 'google', 'ads', 'banner', 'flyer', 'design'],
+    'sewa': ['rent', 'rental', 'sewa', 'office rent', 'office rental', 'shop rent', 'shop rental', 'warehouse', 'premise'],
+    'insurans': ['insurance', 'insurans', 'takaful', 'coverage', 'policy', 'premium', 'protection'],
+}
+
+# Common words that say little about the category on their own
+WEAK_KEYWORDS = {'air', 'pen', 'bill', 'ads', 'design', 'premium', 'policy', 'coverage', 'protection', 'supplies'}
+
+
+def _keyword_weight(keyword):
+    if keyword in WEAK_KEYWORDS:
+        return 0.5
+    # Phrases are more specific than any of their words
+    return float(len(keyword.split()))
+
+
+def _trie_pattern(keywords):
+    """Regex for a set of keywords with shared prefixes factored out ('pe(?:n|trol)'),
+    so the engine follows one branch per character instead of trying every keyword"""
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        if list(node) == ['']:
+            return ''
+        branches = [(r'\s+' if char == ' ' else re.escape(char)) + build(child)
+                    for char, child in sorted(node.items()) if char]
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # A keyword ending here that is also the prefix of a longer one: the longer match is tried first
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+
+def _build_matcher(category_keywords):
+    """Compile every keyword into one word-boundary regex and a keyword -> [(category, weight)] map"""
+    keyword_targets = {}
+    for category, keywords in category_keywords.items():
+        for keyword in keywords:
+            keyword = ' '.join(keyword.lower().split())
+            keyword_targets.setdefault(keyword, []).append((category, _keyword_weight(keyword)))
+
+    pattern = re.compile(r'\b(?:' + _trie_pattern(keyword_targets) + r')\b')
+    return pattern, keyword_targets
+
+
+_PATTERN, _KEYWORD_TARGETS = _build_matcher(CATEGORY_KEYWORDS)
+
+
+def _matched_keywords(text):
+    """Distinct keywords found in lower-cased text"""
+    matches = set(_PATTERN.findall(text))
+    # Phrases matched across a line break or double space are stored with single spaces
+    return {match if match in _KEYWORD_TARGETS else ' '.join(match.split()) for match in matches}
+
+
+def _scores_for_keywords(keywords):
+    scores = dict.fromkeys(CATEGORY_KEYWORDS, 0.0)
+    for keyword in keywords:
+        for category, weight in _KEYWORD_TARGETS[keyword]:
+            scores[category] += weight
+    return scores
+
+
+def _best(scores):
+    category, score = max(scores.items(), key=lambda item: item[1])
+    return category if score > 0 else DEFAULT_CATEGORY
+
+
+def category_scores(ocr_text):
+    """Weighted score per category; each distinct keyword counts once"""
+    return _scores_for_keywords(_matched_keywords((ocr_text or '').lower()))
+
+
+def classify_receipt(ocr_text):
+    """Best category for one receipt's OCR text ('lain_lain' when nothing matches)"""
+    return _best(category_scores(ocr_text))
+
+
+def classify_receipts(ocr_texts, with_scores=False):
+    """Classify many receipts (bulk re-categorisation) with the shared compiled pattern.
+
+    Returns a category per text, or (category, scores) pairs with with_scores.
+    """
+    results = []
+    for text in ocr_texts:
+        scores = category_scores(text)
+        results.append((_best(scores), scores) if with_scores else _best(scores))
+    return results
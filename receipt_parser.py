@@ -0,0 +1,261 @@
+"""
+Receipt Parser Module for PocketBizz
+Extracts vendor, total, date, SST and line items from receipt OCR text.
+Only lines ending in an amount are matched, each against the pattern its
+first word selects, and dates are parsed (day first, English or Malay
+month names) to a real datetime. This does more than the previous
+per-field extraction (line items, SST, validated dates) and costs more
+per receipt; the benchmark reports both.
+"""
+
+import random
+import re
+from datetime import datetime
+from time import perf_counter
+
+import click
+
+# Returned when no vendor line is found
+UNKNOWN_VENDOR = 'KEDAI TIDAK DIKENALI'
+
+AMOUNT = r'\d{1,3}(?:,\d{3})+(?:\.\d{1,2})?|\d+(?:\.\d{1,2})?'
+MONEY = r'\d{1,3}(?:,\d{3})+\.\d{2}|\d+\.\d{2}'
+
+# Lines that look like "<name> <amount>" but are not line items
+NOT_ITEM = (r'(?:sub[ \t]*total|total|jumlah|grand|amount|tunai|cash|change|baki|bayar|paid|payment|'
+            r'rounding|pembundaran|sst|gst|service[ \t]+tax|cukai|discount|diskaun|visa|master|card|kad|rm)\b')
+
+# Words after "total" that mark a count or adjustment line, not the amount paid
+NOT_TOTAL = r'(?:qty|quantity|items?|discount|diskaun|rounding|pembundaran)\b'
+
+# Line patterns, each matched against a whole stripped lower-cased line;
+# a line's first word picks which of them it is tried against
+TOTAL_PREFIXES = ('total', 'jumlah', 'grand', 'net', 'amount')
+TOTAL_LINE = re.compile(rf'''
+    (?:grand[ \t]+|net[ \t]+)?(?:total|jumlah(?:[ \t]+besar)?|amount[ \t]+due)\b
+    (?![ \t:]*{NOT_TOTAL})[^\d]*({AMOUNT})(?:[ \t]*rm)?
+''', re.VERBOSE)
+
+SST_PREFIXES = ('sst', 'gst', 'service', 'sales', 'cukai')
+SST_LINE = re.compile(rf'''
+    (?:sst|gst|service[ \t]+tax|sales[ \t]+tax|cukai(?:[ \t]+(?:jualan|perkhidmatan))?)\b
+    .*[^\d.,]({MONEY})
+''', re.VERBOSE)
+
+ITEM_LINE = re.compile(rf'''
+    (?!{NOT_ITEM})(?:(\d{{1,3}})[ \t]*[x@][ \t]*)?([a-z].*?)[ \t]+(?:rm[ \t]*)?({MONEY})
+''', re.VERBOSE)
+
+DATE_PATTERN = re.compile(r'\d(?<!\d\d)(?:\d?[/.-]\d{1,2}[/.-]\d{2,4}|\d{3}[/.-]\d{1,2}[/.-]\d{1,2}|\d?[ \t]+[a-z]{3,9}[ \t]+\d{4})(?!\d)')
+
+# Fallback total when there is no total line: "RM 12.50" or "12.50 RM"
+RM_PATTERN = re.compile(rf'\brm[ \t]*({AMOUNT})|\b({AMOUNT})[ \t]*rm\b')
+
+DATE_PARTS = re.compile(r'(\d{1,4})[/.-](\d{1,2})[/.-](\d{1,4})|(\d{1,2})[ \t]+([a-z]{3,9})[ \t]+(\d{4})')
+
+# English and Malay month names (and their three-letter forms)
+MONTHS = {
+    'jan': 1, 'january': 1, 'januari': 1,
+    'feb': 2, 'february': 2, 'februari': 2,
+    'mar': 3, 'march': 3, 'mac': 3,
+    'apr': 4, 'april': 4,
+    'may': 5, 'mei': 5,
+    'jun': 6, 'june': 6,
+    'jul': 7, 'july': 7, 'julai': 7,
+    'aug': 8, 'august': 8, 'ogo': 8, 'ogos': 8,
+    'sep': 9, 'sept': 9, 'september': 9,
+    'oct': 10, 'october': 10, 'okt': 10, 'oktober': 10,
+    'nov': 11, 'november': 11,
+    'dec': 12, 'december': 12, 'dis': 12, 'disember': 12,
+}
+
+
+def _to_float(value):
+    return float(value.replace(',', ''))
+
+
+def parse_receipt_date(value):
+    """datetime for a receipt date string (dd/mm/yyyy, yyyy-mm-dd, '5 Mac 2025'); None when invalid"""
+    match = DATE_PARTS.search(value.lower())
+    if not match:
+        return None
+    try:
+        if match.group(5):
+            month = MONTHS.get(match.group(5))
+            if not month:
+                return None
+            return datetime(int(match.group(6)), month, int(match.group(4)))
+
+        first, month, last = match.group(1), int(match.group(2)), match.group(3)
+        if len(first) == 4:
+            return datetime(int(first), month, int(last))
+        # Malaysian receipts put the day first
+        year = int(last)
+        if len(last) == 2:
+            year += 2000
+        return datetime(year, month, int(first))
+    except ValueError:
+        return None
+
+
+def _vendor(lines):
+    """First short line near the top that is not mostly a number or a date"""
+    for line in lines[:5]:
+        line = line.strip()
+        if 3 < len(line) < 50 and not line.isdigit():
+            if not any(char.isdigit() for char in line[:len(line) // 2]):
+                return line.upper()
+    return UNKNOWN_VENDOR
+
+
+def parse_receipt(text):
+    """Vendor, total, date, SST and line items from receipt OCR text.
+
+    Returns {'vendor', 'amount', 'date' (datetime or None), 'date_text',
+    'sst', 'items': [{'description', 'quantity', 'amount'}]}. The total is
+    the amount on the last total/jumlah line (whole ringgit included), else
+    the last RM amount, else 0.0.
+    """
+    text = text or ''
+    lower = text.lower()
+    total = sst = None
+    items = []
+
+    for line in lower.split('\n'):
+        line = line.strip()
+        # Every line field ends in an amount
+        if not (line[-1:].isdigit() or line.endswith('rm')):
+            continue
+        if line.startswith(TOTAL_PREFIXES):
+            match = TOTAL_LINE.fullmatch(line)
+            if match:
+                total = _to_float(match.group(1))
+                continue
+        elif line.startswith(SST_PREFIXES):
+            match = SST_LINE.fullmatch(line)
+            if match:
+                sst = _to_float(match.group(1))
+                continue
+        match = ITEM_LINE.fullmatch(line)
+        if match:
+            quantity, name, amount = match.groups()
+            items.append({
+                'description': ' '.join(name.split()),
+                'quantity': int(quantity) if quantity else 1,
+                'amount': _to_float(amount),
+            })
+
+    if total is None:
+        amounts = RM_PATTERN.findall(lower)
+        total = _to_float(''.join(amounts[-1])) if amounts else 0.0
+
+    date_value = date_text = None
+    for match in DATE_PATTERN.finditer(lower):
+        date_value = parse_receipt_date(match.group())
+        if date_value:
+            date_text = match.group()
+            break
+
+    return {
+        'vendor': _vendor(text.split('\n')),
+        'amount': total,
+        'date': date_value,
+        'date_text': date_text,
+        'sst': sst,
+        'items': items,
+    }
+
+
+# === BENCHMARK ===
+
+def _previous_extract(text):
+    """The per-field extraction /api/smart-receipt-process used before, for comparison"""
+    lines = text.split('\n')
+    vendor = 'KEDAI TIDAK DIKENALI'
+    for line in lines[:5]:
+        line = line.strip()
+        if len(line) > 3 and len(line) < 50 and not line.isdigit():
+            if not any(char.isdigit() for char in line[:len(line)//2]):
+                vendor = line.upper()
+                break
+
+    amount = 0.0
+    text_lower = text.lower()
+    for pattern in [r'rm\s*(\d+\.?\d*)', r'(\d+\.?\d*)\s*rm', r'total\s*:?\s*rm?\s*(\d+\.?\d*)', r'jumlah\s*:?\s*rm?\s*(\d+\.?\d*)']:
+        matches = re.findall(pattern, text_lower)
+        if matches:
+            try:
+                amount = float(matches[-1])
+                break
+            except ValueError:
+                continue
+
+    date_found = datetime.now().strftime('%d/%m/%Y')
+    for pattern in [r'(\d{1,2}[\/\-]\d{1,2}[\/\-]\d{2,4})', r'(\d{1,2}\s\w+\s\d{4})', r'(\d{2,4}[\/\-]\d{1,2}[\/\-]\d{1,2})']:
+        matches = re.findall(pattern, text)
+        if matches:
+            date_found = matches[0]
+            break
+
+    return vendor, amount, date_found
+
+
+def sample_receipts(count, seed=0):
+    """Synthetic OCR texts shaped like Malaysian shop receipts"""
+    rng = random.Random(seed)
+    shops = ('KEDAI RUNCIT AMINAH', 'RESTORAN NASI KANDAR', 'ABC HARDWARE SDN BHD', 'KEDAI ALAT TULIS MAJU', 'PETRONAS')
+    products = ('Nasi lemak', 'Teh tarik', 'Roti canai', 'Kertas A4', 'Pen biru', 'Skru 10mm', 'Minyak masak', 'Gula 1kg')
+    months = ('Jan', 'Mac', 'Mei', 'Ogos', 'Dis')
+    texts = []
+    for _ in range(count):
+        lines = [rng.choice(shops), f'No {rng.randint(1, 99)}, Jalan {rng.randint(1, 20)}/3, 40000 Shah Alam',
+                 f'Tel: 03-{rng.randint(1000000, 9999999)}']
+        if rng.random() < 0.5:
+            lines.append(f'Tarikh: {rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2025 {rng.randint(8, 22)}:{rng.randint(0, 59):02d}')
+        else:
+            lines.append(f'{rng.randint(1, 28)} {rng.choice(months)} 2025')
+        subtotal = 0.0
+        for _ in range(rng.randint(2, 12)):
+            quantity, price = rng.randint(1, 5), rng.randint(100, 5000) / 100
+            subtotal += quantity * price
+            lines.append(f'{quantity} x {rng.choice(products)}  RM {quantity * price:.2f}')
+        sst = round(subtotal * 0.06, 2)
+        lines += [f'Subtotal RM {subtotal:.2f}', f'SST 6% {sst:.2f}', f'JUMLAH RM {subtotal + sst:.2f}',
+                  f'Tunai RM {subtotal + sst + 10:.2f}', 'Terima kasih, sila datang lagi']
+        texts.append('\n'.join(lines))
+    return texts
+
+
+def benchmark_receipt_parser(count=10000, seed=0):
+    """Time parse_receipt and the previous extraction over the same sample corpus"""
+    texts = sample_receipts(count, seed)
+
+    started = perf_counter()
+    parsed = [parse_receipt(text) for text in texts]
+    parser_seconds = perf_counter() - started
+
+    started = perf_counter()
+    for text in texts:
+        _previous_extract(text)
+    previous_seconds = perf_counter() - started
+
+    return {
+        'receipts': count,
+        'parser_seconds': parser_seconds,
+        'previous_seconds': previous_seconds,
+        'dates_parsed': sum(1 for result in parsed if result['date'] is not None),
+        'with_sst': sum(1 for result in parsed if result['sst'] is not None),
+        'items': sum(len(result['items']) for result in parsed),
+    }
+
+
+@click.command('bench-receipts')
+@click.option('--count', default=10000, show_default=True, help='Number of sample receipts.')
+@click.option('--seed', default=0, show_default=True, help='Random seed for the sample corpus.')
+def bench_receipts_command(count, seed):
+    """Benchmark receipt parsing against the previous per-field extraction."""
+    result = benchmark_receipt_parser(count, seed)
+    per_receipt = result['parser_seconds'] / count * 1e6 if count else 0
+    click.echo(f"{result['receipts']} receipts  parser {result['parser_seconds'] * 1000:.1f} ms "
+               f"({per_receipt:.1f} µs each)  previous {result['previous_seconds'] * 1000:.1f} ms")
+    click.echo(f"dates parsed: {result['dates_parsed']}  with SST: {result['with_sst']}  items: {result['items']}")
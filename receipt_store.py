@@ -0,0 +1,155 @@
+"""
+Receipt Storage Module for PocketBizz
+Content-addressed storage for uploaded receipts and payment proofs:
+uploads are named by the SHA-256 of their bytes (the same photo is stored
+once), images are re-encoded to a bounded size with a thumbnail for list
+views, files are sharded by hash prefix, and they are served with the
+hash as ETag and immutable caching
+"""
+
+import hashlib
+import io
+import os
+import re
+
+from flask import send_file, url_for
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+from app import app
+
+# Longest side of stored images and thumbnails, in pixels
+MAX_IMAGE_SIZE = 1600
+THUMBNAIL_SIZE = 320
+
+# Largest upload accepted, in bytes
+MAX_RECEIPT_BYTES = 20 * 1024 * 1024
+
+# Stored files never change under a key, so clients may cache them for a year
+RECEIPT_MAX_AGE = 365 * 24 * 3600
+
+# WebP when Pillow was built with it, JPEG otherwise
+IMAGE_FORMAT = 'WEBP' if features.check('webp') else 'JPEG'
+IMAGE_EXTENSION = 'webp' if IMAGE_FORMAT == 'WEBP' else 'jpg'
+IMAGE_QUALITY = 80
+
+MIMETYPES = {'webp': 'image/webp', 'jpg': 'image/jpeg', 'pdf': 'application/pdf'}
+
+# "<sha256>.<ext>"; anything else in a receipt column is a pre-existing upload filename
+RECEIPT_KEY = re.compile(r'^([0-9a-f]{64})\.(webp|jpg|pdf)$')
+
+
+def receipt_root():
+    """Directory holding stored receipts"""
+    path = os.path.join(app.instance_path, 'receipts')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def is_receipt_key(value):
+    return bool(value and RECEIPT_KEY.match(value))
+
+
+def receipt_path(key, size=None):
+    """Path of a stored receipt (size='thumb' for the thumbnail); None for invalid keys"""
+    match = RECEIPT_KEY.match(key or '')
+    if not match:
+        return None
+    digest, extension = match.groups()
+    name = f'{digest}_thumb.{extension}' if size == 'thumb' and extension != 'pdf' else key
+    # Two levels of 256 directories keep each directory small
+    return os.path.join(receipt_root(), digest[:2], digest[2:4], name)
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _encode(image, max_size):
+    image = image.copy()
+    image.thumbnail((max_size, max_size))
+    buffer = io.BytesIO()
+    image.save(buffer, IMAGE_FORMAT, quality=IMAGE_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def _read_upload(file_storage):
+    data = file_storage.stream.read(MAX_RECEIPT_BYTES + 1)
+    if len(data) > MAX_RECEIPT_BYTES:
+        raise ValueError(f'Fail terlalu besar (had {MAX_RECEIPT_BYTES // (1024 * 1024)} MB)')
+    if not data:
+        raise ValueError('Fail kosong')
+    return data
+
+
+def store_receipt(file_storage):
+    """Store an uploaded image or PDF and return its receipt key.
+
+    Images are re-encoded (EXIF orientation applied, metadata dropped) to at
+    most MAX_IMAGE_SIZE pixels plus a thumbnail. Raises ValueError for files
+    that are not a readable image or PDF.
+    """
+    data = _read_upload(file_storage)
+    digest = hashlib.sha256(data).hexdigest()
+
+    if data.startswith(b'%PDF-'):
+        key = f'{digest}.pdf'
+        path = receipt_path(key)
+        if not os.path.exists(path):
+            _write_atomic(path, data)
+        return key
+
+    key = f'{digest}.{IMAGE_EXTENSION}'
+    path = receipt_path(key)
+    if os.path.exists(path) and os.path.exists(receipt_path(key, 'thumb')):
+        return key  # Same upload stored before
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image = ImageOps.exif_transpose(image)
+            image = image.convert('RGB')
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        raise ValueError('Fail bukan imej atau PDF yang sah')
+
+    _write_atomic(receipt_path(key, 'thumb'), _encode(image, THUMBNAIL_SIZE))
+    _write_atomic(path, _encode(image, MAX_IMAGE_SIZE))
+    return key
+
+
+def receipt_url(value, size=None):
+    """URL for a receipt column value: stored keys go through receipt_file, older uploads stay static files"""
+    if not value:
+        return None
+    if is_receipt_key(value):
+        return url_for('receipt_file', key=value, size=size) if size else url_for('receipt_file', key=value)
+    # Earlier uploads stored a bare filename in static/uploads (or the whole static path)
+    if value.startswith('static/'):
+        value = value[len('static/'):]
+    elif not value.startswith('uploads/'):
+        value = f'uploads/{value}'
+    return url_for('static', filename=value)
+
+
+def send_receipt(key, size=None):
+    """Response for a stored receipt with ETag and immutable caching (404 when missing)"""
+    path = receipt_path(key, size)
+    if path is None or not os.path.exists(path):
+        return None
+
+    digest, extension = RECEIPT_KEY.match(key).groups()
+    etag = f'{digest}-thumb' if size == 'thumb' and extension != 'pdf' else digest
+    response = send_file(
+        path,
+        mimetype=MIMETYPES[extension],
+        etag=etag,
+        conditional=True,
+        max_age=RECEIPT_MAX_AGE
+    )
+    # Receipts belong to one business: cache in the browser only, never in shared caches
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
@@ -0,0 +1,229 @@
+"""
+Report Job Queue Module for PocketBizz
+Runs PDF report generation outside the request worker: jobs are ReportJob
+rows executed by a process pool, and finished PDFs are cached by
+(report type, parameters, data version) so repeat downloads are free
+"""
+
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, update
+
+from app import app, db
+from models import ReportJob, DailyLedgerRollup, BusinessSettings
+from tenancy import current_tenant_id, tenant_scope
+
+# Jobs left 'running' longer than this are assumed lost with their worker
+STALE_JOB_AFTER = timedelta(minutes=10)
+
+# report_type -> {'builder', 'period', 'filename'}, filled in by register_report()
+_report_types = {}
+
+# Lazily created per web worker process when REPORT_JOB_MODE is 'pool'
+_executor = None
+
+
+def register_report(report_type, builder, period, filename):
+    """Register a PDF report.
+
+    builder(**params) returns a BytesIO with the PDF, period(params) returns the
+    half-open (start, end) date range the report reads, filename(params) the
+    download name.
+    """
+    _report_types[report_type] = {
+        'builder': builder,
+        'period': period,
+        'filename': filename,
+    }
+
+
+def data_version(start, end):
+    """Fingerprint of the ledger data behind a report over [start, end)"""
+    count, total, last_update = db.session.query(
+        func.sum(DailyLedgerRollup.transaction_count),
+        func.sum(DailyLedgerRollup.total_amount),
+        func.max(DailyLedgerRollup.updated_at)
+    ).filter(
+        DailyLedgerRollup.date >= start,
+        DailyLedgerRollup.date < end
+    ).one()
+    settings_updated = db.session.query(func.max(BusinessSettings.updated_at)).scalar()
+    return f'{count or 0}:{round(total or 0, 2)}:{last_update}:{settings_updated}'
+
+
+def report_cache_key(report_type, params):
+    """Cache key for a report: type, parameters, tenant and the data version of its period"""
+    start, end = _report_types[report_type]['period'](params)
+    raw = json.dumps([report_type, params, current_tenant_id(), data_version(start, end)], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def artifact_dir():
+    """Directory holding generated report PDFs"""
+    path = os.path.join(app.instance_path, 'report_cache')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _is_reusable(job):
+    if job.status == 'done':
+        return bool(job.artifact_path) and os.path.exists(job.artifact_path)
+    if job.status == 'running':
+        return job.started_at is not None and datetime.utcnow() - job.started_at < STALE_JOB_AFTER
+    return job.status == 'queued'
+
+
+def submit_report_job(report_type, params):
+    """Queue a report, or return the cached/in-flight job for the same data"""
+    if report_type not in _report_types:
+        raise ValueError(f'Unknown report type: {report_type}')
+
+    key = report_cache_key(report_type, params)
+
+    existing = ReportJob.query.filter(
+        ReportJob.cache_key == key,
+        ReportJob.status.in_(['done', 'queued', 'running'])
+    ).order_by(ReportJob.id.desc()).first()
+    if existing and _is_reusable(existing):
+        return existing
+
+    job = ReportJob(
+        report_type=report_type,
+        params=json.dumps(params, sort_keys=True),
+        cache_key=key,
+        filename=_report_types[report_type]['filename'](params),
+        status='queued'
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    _dispatch(job.id)
+    return job
+
+
+# === EXECUTION ===
+
+def _init_worker_process():
+    """Drop pooled connections inherited from the parent process"""
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def _new_executor(processes):
+    return ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context('fork'),
+        initializer=_init_worker_process
+    )
+
+
+def _dispatch(job_id):
+    """Hand a queued job to the in-process pool (no-op when a separate worker runs)"""
+    global _executor
+    if app.config.get('REPORT_JOB_MODE', 'pool') != 'pool':
+        return
+
+    for _ in range(2):
+        if _executor is None:
+            _executor = _new_executor(app.config.get('REPORT_WORKER_PROCESSES', 2))
+        try:
+            _executor.submit(run_report_job, job_id)
+            return
+        except BrokenProcessPool:
+            logging.warning("⚠️ Report worker pool broken, starting a new one")
+            _executor = None
+
+
+def run_report_job(job_id):
+    """Claim a queued job, build its PDF and store the artifact"""
+    with app.app_context():
+        claimed = db.session.execute(
+            update(ReportJob).where(
+                ReportJob.id == job_id,
+                ReportJob.status == 'queued'
+            ).values(status='running', started_at=datetime.utcnow())
+        ).rowcount
+        db.session.commit()
+        if not claimed:
+            return False
+
+        job = db.session.get(ReportJob, job_id)
+        try:
+            spec = _report_types[job.report_type]
+            # Workers have no request user: build as the business that asked for the report
+            with tenant_scope(job.tenant_id):
+                buffer = spec['builder'](**json.loads(job.params))
+
+            path = os.path.join(artifact_dir(), f'{job.cache_key}.pdf')
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(buffer.getvalue())
+            os.replace(tmp_path, path)
+
+            job.artifact_path = path
+            job.status = 'done'
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"❌ Report job {job_id} failed: {str(e)}")
+            job = db.session.get(ReportJob, job_id)
+            job.status = 'failed'
+            job.error = str(e)
+
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        return job.status == 'done'
+
+
+def requeue_stale_jobs():
+    """Put jobs whose worker died back in the queue"""
+    requeued = db.session.execute(
+        update(ReportJob).where(
+            ReportJob.status == 'running',
+            ReportJob.started_at < datetime.utcnow() - STALE_JOB_AFTER
+        ).values(status='queued', started_at=None)
+    ).rowcount
+    db.session.commit()
+    return requeued
+
+
+def run_report_worker(processes=2, poll_interval=1.0):
+    """Poll the ReportJob table and feed queued jobs to a process pool"""
+    executor = _new_executor(processes)
+    in_flight = {}
+    logging.info(f"✅ Report worker started with {processes} processes")
+
+    while True:
+        requeue_stale_jobs()
+
+        queued_ids = [job_id for (job_id,) in db.session.query(ReportJob.id).filter(
+            ReportJob.status == 'queued'
+        ).order_by(ReportJob.id).limit(processes * 2).all()]
+        db.session.commit()
+
+        for job_id in queued_ids:
+            if job_id not in in_flight:
+                in_flight[job_id] = executor.submit(run_report_job, job_id)
+
+        for job_id in [job_id for job_id, future in in_flight.items() if future.done()]:
+            in_flight.pop(job_id)
+
+        time.sleep(poll_interval)
+
+
+@click.command('report-worker')
+@click.option('--processes', default=2, show_default=True, help='Worker processes building PDFs.')
+@click.option('--poll-interval', default=1.0, show_default=True, help='Seconds between queue polls.')
+@with_appcontext
+def report_worker_command(processes, poll_interval):
+    """Run the background PDF report worker (for REPORT_JOB_MODE=worker)."""
+    run_report_worker(processes, poll_interval)
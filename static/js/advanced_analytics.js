@@ -560,6 +560,7 @@ class AdvancedAnalytics {
         container.textContent = '';
         
         const forecast = this.analyticsData.forecast;
+        const interval = forecast.interval;
         
         // Revenue forecast card
         const revenueCard = this.createInsightCard(
@@ -568,18 +569,22 @@ class AdvancedAnalytics {
             'font-semibold text-purple-800',
             `RM ${forecast.nextMonth.revenue.toLocaleString()}`,
             'text-2xl font-bold text-purple-600',
-            'Pendapatan dijangka',
+            interval
+                ? `Julat RM ${interval.revenue[0].toLocaleString()} - RM ${interval.revenue[1].toLocaleString()}`
+                : 'Pendapatan dijangka',
             'text-sm text-purple-700'
         );
         
-        // Confidence card
+        // Confidence card (coverage of the prediction interval)
         const confidenceCard = this.createInsightCard(
             'text-center p-4 bg-yellow-50 rounded-lg',
             '🎯 Keyakinan Ramalan',
             'font-semibold text-yellow-800',
             `${forecast.confidence}%`,
             'text-2xl font-bold text-yellow-600',
-            'Berdasarkan data lepas',
+            forecast.historyDays !== undefined
+                ? `Julat ramalan, berdasarkan ${forecast.historyDays} hari data`
+                : 'Berdasarkan data lepas',
             'text-sm text-yellow-700'
         );
         
@@ -352,27 +352,41 @@ class ComplianceManager {
                 })
             });
             
-            if (response.ok) {
-                const blob = await response.blob();
-                const url = window.URL.createObjectURL(blob);
-                const a = document.createElement('a');
-                a.href = url;
-                a.download = `LHDN-${type.toUpperCase()}-${taxYear}.pdf`;
-                document.body.appendChild(a);
-                a.click();
-                window.URL.revokeObjectURL(url);
-                document.body.removeChild(a);
-                
-                this.showNotification(`Laporan LHDN ${type.toUpperCase()} telah dijana.`, 'success');
-            } else {
+            if (!response.ok) {
                 throw new Error('Failed to generate report');
             }
+            
+            // The report is built by a background job; poll until the PDF is ready
+            this.showNotification(`Laporan LHDN ${type.toUpperCase()} sedang dijana...`, 'info');
+            const job = await this.waitForReportJob(await response.json());
+            
+            const a = document.createElement('a');
+            a.href = job.download_url;
+            a.download = job.filename;
+            document.body.appendChild(a);
+            a.click();
+            document.body.removeChild(a);
+            
+            this.showNotification(`Laporan LHDN ${type.toUpperCase()} telah dijana.`, 'success');
         } catch (error) {
             console.error('Report generation failed:', error);
             this.showNotification('Gagal menjana laporan. Sila cuba lagi.', 'error');
         }
     }
     
+    async waitForReportJob(job) {
+        while (job.status === 'queued' || job.status === 'running') {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            const response = await fetch(job.status_url);
+            job = await response.json();
+        }
+        
+        if (job.status !== 'done') {
+            throw new Error(job.error || 'Report job failed');
+        }
+        return job;
+    }
+    
     saveTaxSettings() {
         const settings = {
             taxYear: document.getElementById('taxYear')?.value || '',
@@ -0,0 +1,174 @@
+"""
+Stock Ledger Module for PocketBizz
+Applies stock movements for products and variants with conditional
+UPDATEs, so concurrent "out" movements can never oversell, and records
+the StockMovement rows in the same transaction. A batch of lines (e.g.
+a whole purchase order receipt) is applied with one UPDATE per table.
+"""
+
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import case, func, insert, select, update, bindparam
+
+from app import db
+from models import Product, ProductVariant, StockMovement, PurchaseOrder, PurchaseOrderItem
+from tenancy import stamp_rows
+
+MOVEMENT_TYPES = ('in', 'out', 'adjustment')
+
+
+class InsufficientStock(ValueError):
+    """Raised when a movement would take stock below zero (or the item does not exist)"""
+
+    def __init__(self, items):
+        self.items = items
+        names = ', '.join(item['name'] for item in items)
+        super().__init__(f'Stok tidak mencukupi: {names}')
+
+
+def signed_quantity(movement_type, quantity):
+    """Stock change for a movement: 'in' adds, 'out' removes, 'adjustment' is already signed"""
+    if movement_type not in MOVEMENT_TYPES:
+        raise ValueError(f'Jenis pergerakan tidak sah: {movement_type}')
+    if movement_type == 'out':
+        return -abs(quantity)
+    if movement_type == 'in':
+        return abs(quantity)
+    return quantity
+
+
+def _apply_deltas(model, deltas):
+    """One conditional UPDATE for all rows of a table; returns the ids that could not be applied"""
+    if not deltas:
+        return []
+
+    delta = case(deltas, value=model.id, else_=0)
+    applied = db.session.execute(
+        update(model).where(
+            model.id.in_(list(deltas)),
+            model.current_stock + delta >= 0
+        ).values(current_stock=model.current_stock + delta).execution_options(synchronize_session=False)
+    ).rowcount
+    if applied == len(deltas):
+        return []
+
+    # Some rows did not qualify: find which, for the error message
+    current = dict(db.session.execute(
+        select(model.id, model.current_stock).where(model.id.in_(list(deltas)))
+    ).all())
+    return [item_id for item_id, change in deltas.items()
+            if item_id not in current or (current[item_id] or 0) + change < 0]
+
+
+def _failed_items(model, ids):
+    name = Product.name if model is Product else ProductVariant.variant_name
+    names = dict(db.session.execute(select(model.id, name).where(model.id.in_(ids))).all())
+    return [{'id': item_id, 'variant': model is ProductVariant, 'name': names.get(item_id, f'#{item_id}')}
+            for item_id in ids]
+
+
+def apply_movements(lines, created_by=None):
+    """Apply movement lines atomically and record them as StockMovement rows.
+
+    Each line is a dict with product_id, movement_type, quantity and optionally
+    variant_id, reference_type, reference_id and notes. Variant lines move the
+    variant's stock; other lines move the product's. Raises InsufficientStock
+    (after rolling back) if any line would take an item below zero. The caller
+    commits.
+    """
+    if not lines:
+        return []
+
+    product_deltas = defaultdict(int)
+    variant_deltas = defaultdict(int)
+    for line in lines:
+        change = signed_quantity(line['movement_type'], int(line['quantity']))
+        if line.get('variant_id'):
+            variant_deltas[int(line['variant_id'])] += change
+        else:
+            product_deltas[int(line['product_id'])] += change
+
+    failed = _failed_items(Product, _apply_deltas(Product, dict(product_deltas)))
+    if not failed:
+        failed = _failed_items(ProductVariant, _apply_deltas(ProductVariant, dict(variant_deltas)))
+    if failed:
+        db.session.rollback()
+        raise InsufficientStock(failed)
+
+    now = datetime.utcnow()
+    movements = [
+        {
+            'product_id': int(line['product_id']),
+            'variant_id': int(line['variant_id']) if line.get('variant_id') else None,
+            'movement_type': line['movement_type'],
+            'quantity': abs(int(line['quantity'])) if line['movement_type'] != 'adjustment' else int(line['quantity']),
+            'reference_type': line.get('reference_type', 'manual_adjustment'),
+            'reference_id': line.get('reference_id'),
+            'notes': line.get('notes', ''),
+            'date': now,
+            'created_by': created_by,
+        }
+        for line in lines
+    ]
+    db.session.execute(insert(StockMovement), stamp_rows(movements))
+    return movements
+
+
+def receive_purchase_order(po_id, received=None, created_by=None):
+    """Book a purchase order delivery into stock in one batch.
+
+    received maps PurchaseOrderItem id -> quantity delivered now; by default
+    every item's outstanding quantity is received. The caller commits.
+    """
+    po = db.session.get(PurchaseOrder, po_id)
+    if po is None:
+        raise ValueError('Pesanan pembelian tidak dijumpai')
+    if po.status in ('received', 'cancelled'):
+        raise ValueError(f'Pesanan pembelian sudah {po.status}')
+
+    items = db.session.execute(
+        select(
+            PurchaseOrderItem.id,
+            PurchaseOrderItem.product_id,
+            PurchaseOrderItem.variant_id,
+            PurchaseOrderItem.quantity_ordered,
+            PurchaseOrderItem.quantity_received
+        ).where(PurchaseOrderItem.po_id == po_id)
+    ).all()
+
+    lines, item_updates, fully_received = [], [], True
+    for item in items:
+        outstanding = item.quantity_ordered - (item.quantity_received or 0)
+        quantity = outstanding if received is None else min(int(received.get(item.id, 0)), outstanding)
+        if quantity < outstanding:
+            fully_received = False
+        if quantity <= 0:
+            continue
+
+        lines.append({
+            'product_id': item.product_id,
+            'variant_id': item.variant_id,
+            'movement_type': 'in',
+            'quantity': quantity,
+            'reference_type': 'purchase',
+            'reference_id': po_id,
+            'notes': f'Terima PO {po.po_number}',
+        })
+        item_updates.append({'item_id': item.id, 'received_now': quantity})
+
+    movements = apply_movements(lines, created_by=created_by)
+
+    if item_updates:
+        items_table = PurchaseOrderItem.__table__
+        db.session.execute(
+            update(items_table).where(items_table.c.id == bindparam('item_id')).values(
+                quantity_received=func.coalesce(items_table.c.quantity_received, 0) + bindparam('received_now')
+            ),
+            item_updates
+        )
+
+    po.actual_delivery = datetime.utcnow()
+    if fully_received:
+        po.status = 'received'
+    return movements
@@ -62,6 +62,10 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def is_admin_user(user):
+    """Whether a user (from get_current_user) has the admin role"""
+    return bool(user) and (user.get('is_admin', False) or user.get('email') == 'admin@pocketbizz.my')
+
 def admin_required(f):
     """Decorator to require admin role"""
     @wraps(f)
@@ -73,7 +77,7 @@ def admin_required(f):
             return redirect(url_for('auth_login'))
         
         # Check if user is admin (you can customize this logic)
-        if not user.get('is_admin', False) and user.get('email') != 'admin@pocketbizz.my':
+        if not is_admin_user(user):
             if request.is_json:
                 return jsonify({'error': 'Admin access required'}), 403
             flash('Akses admin diperlukan', 'error')
@@ -0,0 +1,163 @@
+"""
+Transaction Batch Module for PocketBizz
+Bulk ingestion of transactions queued offline on a device: every item
+carries a client-generated idempotency key, the batch is validated item by
+item and the valid, not-yet-seen items are inserted in one statement and
+one commit, so a retried sync never creates duplicates
+"""
+
+import logging
+import math
+from datetime import datetime
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from models import Transaction
+from rollups import apply_rollup_deltas, deltas_for_rows
+from tenancy import stamp_rows
+
+# Largest batch accepted in one request
+MAX_BATCH_ITEMS = 500
+
+TRANSACTION_TYPES = ('income', 'expense')
+
+
+class BatchError(ValueError):
+    """Raised when the request body as a whole is not a valid batch"""
+
+
+def _parse_date(value):
+    if not value:
+        return datetime.now()
+    value = str(value).strip()
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    parsed = datetime.fromisoformat(value)
+    # Dates are stored naive in server time, like add_transaction stores them
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def validate_item(item):
+    """Transaction column values for one batch item; raises ValueError with the reason"""
+    if not isinstance(item, dict):
+        raise ValueError('item must be an object')
+
+    key = str(item.get('idempotency_key') or '').strip()
+    if not key:
+        raise ValueError('idempotency_key is required')
+    if len(key) > 64:
+        raise ValueError('idempotency_key is longer than 64 characters')
+
+    for field in ('type', 'amount', 'description', 'channel'):
+        if item.get(field) in (None, ''):
+            raise ValueError(f'{field} is required')
+    if item['type'] not in TRANSACTION_TYPES:
+        raise ValueError(f"type must be one of {', '.join(TRANSACTION_TYPES)}")
+
+    try:
+        amount = float(item['amount'])
+    except (TypeError, ValueError):
+        raise ValueError('amount must be a number')
+    if not math.isfinite(amount) or amount <= 0:
+        raise ValueError('amount must be positive')
+
+    try:
+        transaction_date = _parse_date(item.get('date'))
+    except ValueError:
+        raise ValueError('date must be an ISO 8601 date')
+
+    return {
+        'idempotency_key': key,
+        'type': item['type'],
+        'amount': amount,
+        'description': str(item['description'])[:200],
+        'channel': str(item['channel'])[:50],
+        'category': (str(item['category'])[:100] or None) if item.get('category') else None,
+        'date': transaction_date,
+    }
+
+
+def _existing_keys(keys):
+    """idempotency key -> transaction id for keys this business already synced (one indexed query)"""
+    if not keys:
+        return {}
+    rows = db.session.execute(
+        select(Transaction.idempotency_key, Transaction.id).where(Transaction.idempotency_key.in_(keys))
+    )
+    return dict(rows.all())
+
+
+def _insert_batch(items):
+    results = [None] * len(items)
+    pending = {}
+    for index, item in enumerate(items):
+        try:
+            values = validate_item(item)
+        except ValueError as e:
+            results[index] = {'index': index, 'status': 'invalid', 'error': str(e),
+                              'idempotency_key': item.get('idempotency_key') if isinstance(item, dict) else None}
+            continue
+        if values['idempotency_key'] in pending:
+            results[index] = {'index': index, 'status': 'duplicate', 'idempotency_key': values['idempotency_key']}
+            continue
+        pending[values['idempotency_key']] = (index, values)
+
+    existing = _existing_keys(list(pending))
+    rows = []
+    for key, (index, values) in pending.items():
+        if key in existing:
+            results[index] = {'index': index, 'status': 'duplicate', 'idempotency_key': key, 'id': existing[key]}
+        else:
+            rows.append(values)
+
+    if rows:
+        created = db.session.execute(
+            insert(Transaction).returning(Transaction.id, Transaction.idempotency_key, sort_by_parameter_order=True),
+            stamp_rows(rows)
+        ).all()
+        apply_rollup_deltas(db.session.connection(), deltas_for_rows(rows))
+        for transaction_id, key in created:
+            index = pending[key][0]
+            results[index] = {'index': index, 'status': 'created', 'idempotency_key': key, 'id': transaction_id}
+    db.session.commit()
+
+    # Duplicates inside the batch point at the id their key resolved to
+    ids = {result['idempotency_key']: result['id'] for result in results if 'id' in result}
+    for result in results:
+        if result['status'] == 'duplicate' and 'id' not in result:
+            result['id'] = ids.get(result['idempotency_key'])
+    return results
+
+
+def ingest_transactions(items):
+    """Insert a batch of offline transactions, skipping keys already synced.
+
+    Returns {'results': [per-item status], 'created', 'duplicates', 'invalid'}.
+    """
+    if not isinstance(items, list):
+        raise BatchError('transactions must be a list')
+    if len(items) > MAX_BATCH_ITEMS:
+        raise BatchError(f'at most {MAX_BATCH_ITEMS} transactions per batch')
+
+    try:
+        results = _insert_batch(items)
+    except IntegrityError:
+        # A concurrent sync of the same items committed first: retry, its keys are now existing
+        db.session.rollback()
+        logging.warning("⚠️ Transaction batch raced another sync, retrying")
+        results = _insert_batch(items)
+
+    summary = {status: sum(1 for result in results if result['status'] == status)
+               for status in ('created', 'duplicate', 'invalid')}
+    logging.info(f"✅ Transaction batch: {summary['created']} created, {summary['duplicate']} duplicate, "
+                 f"{summary['invalid']} invalid")
+    return {
+        'results': results,
+        'created': summary['created'],
+        'duplicates': summary['duplicate'],
+        'invalid': summary['invalid'],
+    }
@@ -1,17 +1,37 @@
-import csv
 import io
 import os
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from flask import render_template, request, redirect, url_for, flash, jsonify, make_response, send_file, g
-from werkzeug.utils import secure_filename
+from sqlalchemy import select, func
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.units import inch
 from app import app, db
-from models import Transaction, BusinessSettings, Product, StockMovement, Agent, AgentOrder, ZakatCalculation, Supplier, ProductVariant, PurchaseOrder, PurchaseOrderItem, NotificationSettings
+from models import Transaction, BusinessSettings, Product, StockMovement, Agent, AgentOrder, ZakatCalculation, Supplier, ProductVariant, PurchaseOrder, PurchaseOrderItem, NotificationSettings, DailyLedgerRollup, ReportJob, AgentMonthlySales, StockSnapshot
 from supabase_auth import login_required, admin_required, get_current_user, is_demo_mode
+from rollups import totals_by_type, totals_by_channel, notify_bulk_change
+from breakdown_cache import period_breakdown
+from perf_metrics import metrics_snapshot, overhead_per_request
+from stock_snapshots import stock_value_at
+from stock_ledger import apply_movements, receive_purchase_order, InsufficientStock
+from inventory_queries import serialize_products, stock_alert_settings, low_stock_products, count_low_stock
+from csv_import import import_csv_stream
+from csv_export import csv_response
+from report_jobs import register_report, submit_report_job
+from tenancy import all_tenants, tenant_scope, tenant_id_for, tenant_link_token, tenant_from_link_token
+from analytics import analytics_summary, top_products
+from transaction_batch import ingest_transactions, BatchError
+from receipt_store import store_receipt, receipt_url, send_receipt
+from agent_sales import agent_monthly_sales
+from agent_approvals import review_agent_orders
+from number_sequences import next_number, AGENT_ORDER_PREFIX
+from receipt_classifier import classify_receipt, classify_receipts
+from receipt_parser import parse_receipt
+
+# Templates link receipts and payment proofs through receipt_url()
+app.add_template_global(receipt_url)
 
 UPLOAD_FOLDER = 'static/uploads'
 ALLOWED_EXTENSIONS = {'csv', 'png', 'jpg', 'jpeg', 'gif', 'pdf'}
@@ -42,27 +62,19 @@ def index():
         return redirect(url_for('landing'))
     
     today = datetime.now().date()
+    tomorrow = today + timedelta(days=1)
     
-    # Get today's transactions
-    today_transactions = Transaction.query.filter(
-        db.func.date(Transaction.date) == today
-    ).all()
-    
-    # Calculate today's totals
-    today_income = sum(t.amount for t in today_transactions if t.type == 'income')
-    today_expenses = sum(t.amount for t in today_transactions if t.type == 'expense')
+    # Today's totals and channel performance (cached breakdown of the daily rollup)
+    today_breakdown = period_breakdown(today, tomorrow)
+    today_income = today_breakdown['income']
+    today_expenses = today_breakdown['expense']
     today_profit = today_income - today_expenses
     
     # Get recent transactions (last 5)
     recent_transactions = Transaction.query.order_by(Transaction.created_at.desc()).limit(5).all()
     
     # Channel performance for today
-    channel_stats = {}
-    for transaction in today_transactions:
-        if transaction.type == 'income':
-            if transaction.channel not in channel_stats:
-                channel_stats[transaction.channel] = 0
-            channel_stats[transaction.channel] += transaction.amount
+    channel_stats = dict(today_breakdown['channels'])
     
     # Get business settings for welcome badge
     settings = BusinessSettings.query.first()
@@ -113,24 +125,16 @@ def add_transaction_post():
         if 'receipt_pdf' in request.files:
             pdf_file = request.files['receipt_pdf']
             if pdf_file and pdf_file.filename and pdf_file.filename.endswith('.pdf'):
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-                pdf_filename = timestamp + secure_filename(pdf_file.filename)
-                pdf_path = os.path.join(UPLOAD_FOLDER, pdf_filename)
-                pdf_file.save(pdf_path)
-                receipt_pdf_path = pdf_filename
+                receipt_pdf_path = store_receipt(pdf_file)
         
         # Handle regular image upload (backwards compatibility)
         receipt_image_path = None
         if 'receipt_image' in request.files:
             image_file = request.files['receipt_image']
             if image_file and image_file.filename and allowed_file(image_file.filename):
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-                image_filename = timestamp + secure_filename(image_file.filename)
-                image_path = os.path.join(UPLOAD_FOLDER, image_filename)
-                image_file.save(image_path)
-                receipt_image_path = image_filename
+                receipt_image_path = store_receipt(image_file)
         
-        # Use PDF path if available, otherwise use image path
+        # Use PDF key if available, otherwise use image key (content-addressed, see receipt_store)
         receipt_attachment = receipt_pdf_path or receipt_image_path
         
         # Create new transaction
@@ -154,6 +158,22 @@ def add_transaction_post():
         flash(f'Error: {str(e)}', 'error')
         return redirect(url_for('add_transaction'))
 
+@app.route('/receipts/<key>')
+@login_required
+def receipt_file(key):
+    """Serve a stored receipt or payment proof (?size=thumb for the list thumbnail)"""
+    # Files are shared by content hash: serve only keys referenced by this business's rows
+    owned = (
+        db.session.query(Transaction.id).filter(Transaction.receipt_image == key).first()
+        or db.session.query(AgentOrder.id).filter(AgentOrder.payment_proof == key).first()
+    )
+    if not owned:
+        return jsonify({'error': 'Resit tidak dijumpai'}), 404
+    response = send_receipt(key, request.args.get('size'))
+    if response is None:
+        return jsonify({'error': 'Resit tidak dijumpai'}), 404
+    return response
+
 @app.route('/scan_receipt')
 def scan_receipt():
     """OCR receipt scanning page"""
@@ -170,16 +190,16 @@ def upload_receipt():
         return jsonify({'error': 'Tiada fail dipilih'}), 400
     
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-        filename = timestamp + filename
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
+        try:
+            key = store_receipt(file)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         return jsonify({
             'success': True,
-            'filename': filename,
-            'filepath': filepath
+            'filename': key,
+            'url': receipt_url(key),
+            'thumbnail_url': receipt_url(key, 'thumb')
         })
     
     return jsonify({'error': 'Format fail tidak disokong'}), 400
@@ -196,58 +216,14 @@ def upload_csv():
     
     if file and file.filename.lower().endswith('.csv'):
         try:
-            # Read CSV content
-            stream = io.StringIO(file.stream.read().decode("UTF-8"), newline=None)
-            csv_input = csv.DictReader(stream)
-            
-            transactions_added = 0
-            source = request.form.get('source', 'shopee')
+            # Stream the upload in committed chunks instead of reading it whole
+            source = request.form.get('source') or request.form.get('platform', 'shopee')
+            result = import_csv_stream(file.stream, source)
             
-            for row in csv_input:
-                try:
-                    # Map CSV columns based on source
-                    if source == 'shopee':
-                        # Shopee CSV format mapping
-                        description = row.get('Order ID', '') + ' - ' + row.get('Product Name', '')
-                        amount = float(row.get('Order Amount', 0))
-                        date_str = row.get('Order Date', '')
-                    elif source == 'tiktok':
-                        # TikTok Shop CSV format mapping
-                        description = row.get('Order ID', '') + ' - ' + row.get('Product', '')
-                        amount = float(row.get('Total Amount', 0))
-                        date_str = row.get('Created Time', '')
-                    else:
-                        continue
-                    
-                    if amount > 0:
-                        # Parse date
-                        transaction_date = datetime.now()
-                        if date_str:
-                            try:
-                                transaction_date = datetime.strptime(date_str.split()[0], '%Y-%m-%d')
-                            except:
-                                pass
-                        
-                        transaction = Transaction(
-                            type='income',
-                            amount=amount,
-                            description=description,
-                            channel=source,
-                            category='Online Sales',
-                            date=transaction_date
-                        )
-                        
-                        db.session.add(transaction)
-                        transactions_added += 1
-                        
-                except Exception as e:
-                    app.logger.error(f"Error processing CSV row: {e}")
-                    continue
-            
-            db.session.commit()
             return jsonify({
                 'success': True,
-                'message': f'{transactions_added} transaksi berjaya diimport'
+                'message': f"{result['imported']} transaksi berjaya diimport, {result['duplicates']} pendua dilangkau",
+                **result
             })
             
         except Exception as e:
@@ -261,32 +237,22 @@ def reports():
     # Get current month data
     now = datetime.now()
     start_of_month = datetime(now.year, now.month, 1)
+    start_of_next_month = datetime(now.year + 1, 1, 1) if now.month == 12 else datetime(now.year, now.month + 1, 1)
     
-    monthly_transactions = Transaction.query.filter(
-        Transaction.date >= start_of_month
-    ).all()
-    
-    # Calculate monthly totals
-    monthly_income = sum(t.amount for t in monthly_transactions if t.type == 'income')
-    monthly_expenses = sum(t.amount for t in monthly_transactions if t.type == 'expense')
+    # Calculate monthly totals from the cached rollup breakdown
+    monthly_breakdown = period_breakdown(start_of_month, start_of_next_month)
+    monthly_income = monthly_breakdown['income']
+    monthly_expenses = monthly_breakdown['expense']
     monthly_profit = monthly_income - monthly_expenses
     
     # Channel breakdown
-    channel_income = {}
-    for transaction in monthly_transactions:
-        if transaction.type == 'income':
-            if transaction.channel not in channel_income:
-                channel_income[transaction.channel] = 0
-            channel_income[transaction.channel] += transaction.amount
+    channel_income = dict(monthly_breakdown['channels'])
     
     # Category breakdown for expenses
     expense_categories = {}
-    for transaction in monthly_transactions:
-        if transaction.type == 'expense':
-            category = transaction.category or 'Lain-lain'
-            if category not in expense_categories:
-                expense_categories[category] = 0
-            expense_categories[category] += transaction.amount
+    for category, amount in monthly_breakdown['expense_categories']:
+        category = category or 'Lain-lain'
+        expense_categories[category] = expense_categories.get(category, 0) + amount
     
     return render_template('reports.html',
                          monthly_income=monthly_income,
@@ -300,44 +266,38 @@ def reports():
 
 @app.route('/export_csv')
 def export_csv():
-    """Export transactions to CSV"""
+    """Export transactions to CSV (streamed; add ?gzip=1 for a gzip-encoded response)"""
     # Get date range from query parameters
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     
-    query = Transaction.query
+    statement = select(
+        Transaction.date, Transaction.type, Transaction.amount,
+        Transaction.description, Transaction.channel, Transaction.category
+    )
     
     if start_date:
-        query = query.filter(Transaction.date >= datetime.strptime(start_date, '%Y-%m-%d'))
+        statement = statement.where(Transaction.date >= datetime.strptime(start_date, '%Y-%m-%d'))
     if end_date:
-        query = query.filter(Transaction.date <= datetime.strptime(end_date, '%Y-%m-%d'))
-    
-    transactions = query.order_by(Transaction.date.desc()).all()
-    
-    # Create CSV output
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write header
-    writer.writerow(['Tarikh', 'Jenis', 'Jumlah (RM)', 'Keterangan', 'Saluran', 'Kategori'])
-    
-    # Write data
-    for transaction in transactions:
-        writer.writerow([
-            transaction.date.strftime('%Y-%m-%d'),
-            'Pendapatan' if transaction.type == 'income' else 'Perbelanjaan',
-            f'{transaction.amount:.2f}',
-            transaction.description,
-            transaction.channel.title(),
-            transaction.category or ''
-        ])
-    
-    # Create response
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = f'attachment; filename=laporan_akaun_{datetime.now().strftime("%Y%m%d")}.csv'
+        # Half-open range so the whole end day is included and the date index is used
+        statement = statement.where(Transaction.date < datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1))
+    
+    def format_row(row):
+        return [
+            row.date.strftime('%Y-%m-%d'),
+            'Pendapatan' if row.type == 'income' else 'Perbelanjaan',
+            f'{row.amount:.2f}',
+            row.description,
+            row.channel.title(),
+            row.category or ''
+        ]
     
-    return response
+    return csv_response(
+        statement.order_by(Transaction.date.desc()),
+        ['Tarikh', 'Jenis', 'Jumlah (RM)', 'Keterangan', 'Saluran', 'Kategori'],
+        format_row,
+        f'laporan_akaun_{datetime.now().strftime("%Y%m%d")}.csv'
+    )
 
 @app.route('/api/transactions')
 def api_transactions():
@@ -345,6 +305,23 @@ def api_transactions():
     transactions = Transaction.query.order_by(Transaction.date.desc()).limit(10).all()
     return jsonify([t.to_dict() for t in transactions])
 
+@app.route('/api/transactions/batch', methods=['POST'])
+@login_required
+def api_transactions_batch():
+    """Create queued offline transactions in one request (idempotent per item)"""
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+    
+    try:
+        result = ingest_transactions(data.get('transactions') if isinstance(data, dict) else data)
+        return jsonify({'success': True, **result})
+    except BatchError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/delete_transaction/<int:transaction_id>', methods=['POST'])
 def delete_transaction(transaction_id):
     """Delete a transaction"""
@@ -403,16 +380,18 @@ def update_settings():
 @app.route('/inventory')
 def inventory():
     """Inventory management page"""
-    products = Product.query.filter_by(is_active=True).all()
-    low_stock_products = [p for p in products if p.is_low_stock]
+    # One query for the products with their SQL-evaluated low-stock flags
+    products = serialize_products(Product.is_active == True)
+    alerts_enabled = stock_alert_settings()[0]
+    low_stock_items = [p for p in products if p['is_low_stock']] if alerts_enabled else []
     
     # Stock summary statistics
     total_products = len(products)
-    total_stock_value = sum(p.current_stock * p.cost_price for p in products)
+    total_stock_value = sum((p['current_stock'] or 0) * (p['cost_price'] or 0) for p in products)
     
     return render_template('inventory.html', 
                          products=products,
-                         low_stock_products=low_stock_products,
+                         low_stock_products=low_stock_items,
                          total_products=total_products,
                          total_stock_value=total_stock_value)
 
@@ -428,7 +407,7 @@ def add_product():
                 cost_price=float(request.form.get('cost_price', 0)),
                 selling_price=float(request.form.get('selling_price', 0)),
                 current_stock=int(request.form.get('current_stock', 0)),
-                minimum_stock=int(request.form.get('minimum_stock', 10)),
+                minimum_stock=request.form.get('minimum_stock', type=int),  # blank: business threshold
                 category=request.form.get('category'),
                 supplier=request.form.get('supplier')
             )
@@ -459,41 +438,53 @@ def add_product():
 @app.route('/stock_movement/<int:product_id>', methods=['POST'])
 def stock_movement(product_id):
     """Record stock movement"""
+    variant_id = request.form.get('variant_id', type=int)
+    # The variant's stock is what moves: it must belong to the product in the URL
+    if variant_id and not ProductVariant.query.filter_by(id=variant_id, product_id=product_id).first():
+        flash('Varian tidak sepadan dengan produk ini!', 'error')
+        return redirect(url_for('inventory'))
+    
     try:
-        product = Product.query.get_or_404(product_id)
-        movement_type = request.form['movement_type']  # 'in' or 'out'
+        movement_type = request.form['movement_type']  # 'in', 'out' or 'adjustment'
         quantity = int(request.form['quantity'])
         notes = request.form.get('notes', '')
-        
-        # Update product stock
-        if movement_type == 'in':
-            product.current_stock += quantity
-        elif movement_type == 'out':
-            if product.current_stock >= quantity:
-                product.current_stock -= quantity
-            else:
-                flash('Stok tidak mencukupi!', 'error')
-                return redirect(url_for('inventory'))
-        
-        # Record movement
-        movement = StockMovement(
-            product_id=product_id,
-            movement_type=movement_type,
-            quantity=quantity,
-            reference_type='manual_adjustment',
-            notes=notes
-        )
-        
-        db.session.add(movement)
+        user = get_current_user()
+        
+        # Conditional UPDATE + movement row in one transaction (no oversell under concurrency)
+        apply_movements([{
+            'product_id': product_id,
+            'variant_id': variant_id,
+            'movement_type': movement_type,
+            'quantity': quantity,
+            'reference_type': 'manual_adjustment',
+            'notes': notes
+        }], created_by=user.get('email') if user else None)
         db.session.commit()
         
         flash('Pergerakan stok berjaya direkodkan!', 'success')
         
+    except InsufficientStock:
+        flash('Stok tidak mencukupi!', 'error')
     except Exception as e:
+        db.session.rollback()
         flash(f'Ralat: {str(e)}', 'error')
     
     return redirect(url_for('inventory'))
 
+@app.route('/purchase_order/<int:po_id>/receive', methods=['POST'])
+def receive_purchase_order_stock(po_id):
+    """Receive a purchase order into stock (all outstanding quantities in one batch)"""
+    try:
+        user = get_current_user()
+        movements = receive_purchase_order(po_id, created_by=user.get('email') if user else None)
+        db.session.commit()
+        flash(f'{len(movements)} item PO berjaya diterima ke dalam stok!', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Ralat: {str(e)}', 'error')
+    
+    return redirect(url_for('suppliers'))
+
 # === AGENT MANAGEMENT ROUTES ===
 
 @app.route('/agents')
@@ -531,6 +522,7 @@ def add_agent():
     return render_template('add_agent.html')
 
 @app.route('/agent_orders')
+@login_required
 def agent_orders():
     """Agent orders management"""
     status_filter = request.args.get('status', 'all')
@@ -544,130 +536,139 @@ def agent_orders():
                          orders=orders,
                          current_status=status_filter)
 
+# Purpose of the signed ?business= token on the public agent order form
+AGENT_ORDER_LINK = 'agent-order'
+
 @app.route('/submit_agent_order', methods=['GET', 'POST'])
 def submit_agent_order():
-    """Agent submit new order"""
-    if request.method == 'POST':
-        try:
-            # Generate order number
-            order_count = AgentOrder.query.count() + 1
-            order_number = f"ORD{datetime.now().strftime('%Y%m%d')}{order_count:04d}"
-            
-            agent_order = AgentOrder(
-                agent_id=int(request.form['agent_id']),
-                order_number=order_number,
-                customer_name=request.form['customer_name'],
-                customer_phone=request.form.get('customer_phone'),
-                total_amount=float(request.form['total_amount']),
-                payment_method=request.form['payment_method'],
-                notes=request.form.get('notes')
-            )
-            
-            # Calculate commission
-            agent = Agent.query.get(agent_order.agent_id)
-            if agent:
+    """Agent submit new order (owners open it logged in; agents through the owner's signed link)"""
+    owner = get_current_user()
+    token = request.args.get('business')
+    # Never the anonymous '' tenant: agents have no account, the link says which business they sell for
+    tenant_id = tenant_from_link_token(token, AGENT_ORDER_LINK) if token else tenant_id_for(owner)
+    if not tenant_id:
+        flash('Pautan order ejen tidak sah. Minta pautan baru daripada pemilik perniagaan.', 'error')
+        return render_template('submit_agent_order.html', agents=[], agent_link=None), 404
+    
+    with tenant_scope(tenant_id):
+        if request.method == 'POST':
+            try:
+                agent = Agent.query.filter_by(id=int(request.form['agent_id']), status='active').first()
+                if not agent:
+                    raise ValueError('Ejen tidak dijumpai')
+                
+                # Order number from the per-day counter (safe for simultaneous submissions)
+                agent_order = AgentOrder(
+                    agent_id=agent.id,
+                    order_number=next_number(AGENT_ORDER_PREFIX),
+                    customer_name=request.form['customer_name'],
+                    customer_phone=request.form.get('customer_phone'),
+                    total_amount=float(request.form['total_amount']),
+                    payment_method=request.form['payment_method'],
+                    notes=request.form.get('notes')
+                )
+                
+                # Calculate commission
                 agent_order.commission_amount = (agent_order.total_amount * agent.commission_rate) / 100
-            
-            # Handle payment proof upload
-            if 'payment_proof' in request.files:
-                file = request.files['payment_proof']
-                if file and allowed_file(file.filename):
-                    filename = secure_filename(file.filename)
-                    filepath = os.path.join(UPLOAD_FOLDER, filename)
-                    file.save(filepath)
-                    agent_order.payment_proof = filepath
-            
-            db.session.add(agent_order)
-            db.session.commit()
-            
-            flash('Order berjaya dihantar untuk semakan!', 'success')
-            return redirect(url_for('agent_orders'))
-            
-        except Exception as e:
-            flash(f'Ralat: {str(e)}', 'error')
+                
+                # Handle payment proof upload
+                if 'payment_proof' in request.files:
+                    file = request.files['payment_proof']
+                    if file and allowed_file(file.filename):
+                        agent_order.payment_proof = store_receipt(file)
+                
+                db.session.add(agent_order)
+                db.session.commit()
+                
+                flash('Order berjaya dihantar untuk semakan!', 'success')
+                if owner:
+                    return redirect(url_for('agent_orders'))
+                return redirect(url_for('submit_agent_order', business=token))
+                
+            except Exception as e:
+                db.session.rollback()
+                flash(f'Ralat: {str(e)}', 'error')
+        
+        agents = Agent.query.filter_by(status='active').all()
     
-    agents = Agent.query.filter_by(status='active').all()
-    return render_template('submit_agent_order.html', agents=agents)
+    # Owners get the link to share with their agents
+    agent_link = url_for('submit_agent_order', business=tenant_link_token(tenant_id, AGENT_ORDER_LINK),
+                         _external=True) if owner and not token else None
+    return render_template('submit_agent_order.html', agents=agents, agent_link=agent_link)
 
-@app.route('/approve_order/<int:order_id>')
+@app.route('/approve_order/<int:order_id>', methods=['GET', 'POST'])
+@login_required
 def approve_order(order_id):
     """Approve agent order"""
     try:
-        order = AgentOrder.query.get_or_404(order_id)
-        order.status = 'approved'
-        order.approved_at = datetime.utcnow()
-        order.approved_by = 'Admin'  # In real app, get from session
-        
-        # Update agent totals
-        agent = order.agent
-        agent.total_sales += order.total_amount
-        agent.total_commission += order.commission_amount
-        
-        # Create transaction record
-        transaction = Transaction(
-            type='income',
-            amount=order.total_amount,
-            description=f'Order dari {agent.name} - {order.customer_name}',
-            channel='agent',
-            category='agent_sales',
-            date=order.order_date
-        )
-        
-        db.session.add(transaction)
-        db.session.commit()
-        
-        flash('Order berjaya diluluskan!', 'success')
+        AgentOrder.query.get_or_404(order_id)
+        # Only pending orders are approved, so a repeated click cannot record the income twice;
+        # agent totals, monthly sales and the income transaction are written by review_agent_orders
+        result = review_agent_orders([order_id], 'approve')
+        if result['processed']:
+            flash('Order berjaya diluluskan!', 'success')
+        else:
+            flash('Order ini telah diproses sebelum ini.', 'error')
         
     except Exception as e:
         flash(f'Ralat: {str(e)}', 'error')
     
     return redirect(url_for('agent_orders'))
 
-@app.route('/reject_order/<int:order_id>')
+@app.route('/reject_order/<int:order_id>', methods=['GET', 'POST'])
+@login_required
 def reject_order(order_id):
     """Reject agent order"""
     try:
-        order = AgentOrder.query.get_or_404(order_id)
-        order.status = 'rejected'
-        order.approved_at = datetime.utcnow()
-        order.approved_by = 'Admin'
-        
-        db.session.commit()
-        flash('Order telah ditolak!', 'info')
+        AgentOrder.query.get_or_404(order_id)
+        # An approved order already has its income recorded; only pending orders can be rejected
+        result = review_agent_orders([order_id], 'reject')
+        if result['processed']:
+            flash('Order telah ditolak!', 'info')
+        else:
+            flash('Order ini telah diproses sebelum ini.', 'error')
         
     except Exception as e:
         flash(f'Ralat: {str(e)}', 'error')
     
     return redirect(url_for('agent_orders'))
 
+@app.route('/api/agent_orders/bulk', methods=['POST'])
+@login_required
+def api_bulk_review_orders():
+    """Approve or reject many pending agent orders in one transaction"""
+    data = request.get_json(silent=True) or {}
+    try:
+        result = review_agent_orders(data.get('order_ids') or [], data.get('action'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify({'success': True, **result})
+
 # === ZAKAT CALCULATION ROUTES ===
 
 @app.route('/zakat')
 def zakat():
     """Zakat calculation page"""
-    current_year = datetime.now().year
+    current_year = request.args.get('year', datetime.now().year, type=int)
     
-    # Get existing calculation for current year
+    # Get existing calculation for the year
     existing_calc = ZakatCalculation.query.filter_by(year=current_year).first()
     
-    # Calculate current year data if no existing calculation
+    # Calculate the year's data if no existing calculation
     if not existing_calc:
-        # Get transactions for current year
-        year_start = datetime(current_year, 1, 1)
-        year_end = datetime(current_year, 12, 31)
-        
-        year_transactions = Transaction.query.filter(
-            Transaction.date >= year_start,
-            Transaction.date <= year_end
-        ).all()
+        # Get totals for the year from the daily rollup
+        year_totals = totals_by_type(datetime(current_year, 1, 1), datetime(current_year + 1, 1, 1))
         
-        total_income = sum(t.amount for t in year_transactions if t.type == 'income')
-        total_expenses = sum(t.amount for t in year_transactions if t.type == 'expense')
+        total_income = year_totals['income']
+        total_expenses = year_totals['expense']
         net_profit = total_income - total_expenses
         
-        # Calculate current stock value
-        products = Product.query.filter_by(is_active=True).all()
-        stock_value = sum(p.current_stock * p.cost_price for p in products)
+        # Stock value at the end of the year (today for the current year), from stock snapshots
+        stock_value = stock_value_at(datetime(current_year, 12, 31).date())['total_value']
         
         # Create preliminary calculation
         prelim_calc = {
@@ -757,45 +758,52 @@ def mark_zakat_paid(calc_id):
 @app.route('/api/low_stock_alerts')
 def api_low_stock_alerts():
     """API to get low stock alerts"""
-    products = Product.query.filter_by(is_active=True).all()
-    low_stock = [p.to_dict() for p in products if p.is_low_stock]
+    low_stock = low_stock_products()
     
     return jsonify({
         'alerts': low_stock,
         'count': len(low_stock)
     })
 
+MONTH_NAMES = ['Jan', 'Feb', 'Mac', 'Apr', 'Mei', 'Jun', 'Jul', 'Aug', 'Sep', 'Okt', 'Nov', 'Dis']
+
+# Longest range /api/agent_stats returns, in months
+AGENT_STATS_MAX_MONTHS = 120
+
 @app.route('/api/agent_stats/<int:agent_id>')
 def api_agent_stats(agent_id):
-    """API to get agent statistics"""
+    """API to get agent statistics (?start=YYYY-MM&end=YYYY-MM, default the current year)"""
     agent = Agent.query.get_or_404(agent_id)
     
-    # Get monthly sales for current year
     current_year = datetime.now().year
-    monthly_sales = []
+    try:
+        start = datetime.strptime(request.args.get('start') or f'{current_year}-01', '%Y-%m').date()
+        end = datetime.strptime(request.args.get('end') or f'{start.year}-12', '%Y-%m').date()
+    except ValueError:
+        return jsonify({'error': 'start and end must be YYYY-MM'}), 400
     
-    for month in range(1, 13):
-        month_start = datetime(current_year, month, 1)
-        if month == 12:
-            month_end = datetime(current_year + 1, 1, 1)
-        else:
-            month_end = datetime(current_year, month + 1, 1)
-        
-        month_orders = AgentOrder.query.filter(
-            AgentOrder.agent_id == agent_id,
-            AgentOrder.status == 'approved',
-            AgentOrder.order_date >= month_start,
-            AgentOrder.order_date < month_end
-        ).all()
-        
-        total = sum(order.total_amount for order in month_orders)
-        monthly_sales.append(total)
+    month_count = (end.year - start.year) * 12 + end.month - start.month + 1
+    if month_count < 1 or month_count > AGENT_STATS_MAX_MONTHS:
+        return jsonify({'error': f'range must cover 1 to {AGENT_STATS_MAX_MONTHS} months'}), 400
+    
+    # One indexed read of the pre-aggregated months
+    totals = agent_monthly_sales(agent_id, start, end)
+    
+    months = [date(start.year + (start.month - 1 + i) // 12, (start.month - 1 + i) % 12 + 1, 1)
+              for i in range(month_count)]
+    single_year = start.year == end.year
+    monthly = [totals.get(month, (0.0, 0.0, 0)) for month in months]
     
     return jsonify({
         'agent': agent.to_dict(),
-        'monthly_sales': monthly_sales,
-        'months': ['Jan', 'Feb', 'Mac', 'Apr', 'Mei', 'Jun', 
-                  'Jul', 'Aug', 'Sep', 'Okt', 'Nov', 'Dis']
+        'start': start.strftime('%Y-%m'),
+        'end': end.strftime('%Y-%m'),
+        'periods': [month.strftime('%Y-%m') for month in months],
+        'monthly_sales': [sales for sales, _, _ in monthly],
+        'monthly_commission': [commission for _, commission, _ in monthly],
+        'monthly_orders': [count for _, _, count in monthly],
+        'months': [MONTH_NAMES[month.month - 1] if single_year else f"{MONTH_NAMES[month.month - 1]} {month.year}"
+                   for month in months]
     })
 
 # === PDF EXPORT FUNCTIONS ===
@@ -844,7 +852,7 @@ def generate_transaction_report_pdf(start_date, end_date, format_type='monthly')
     # Get transactions
     transactions = Transaction.query.filter(
         Transaction.date >= start_date,
-        Transaction.date <= end_date
+        Transaction.date < end_date + timedelta(days=1)
     ).order_by(Transaction.date.desc()).all()
     
     # Summary calculations
@@ -920,27 +928,18 @@ def generate_transaction_report_pdf(start_date, end_date, format_type='monthly')
 
 @app.route('/export_pdf')
 def export_pdf():
-    """Export monthly report as PDF"""
+    """Export monthly report as PDF (generated by a background report job)"""
     # Get date range from request
     month = int(request.args.get('month', datetime.now().month))
     year = int(request.args.get('year', datetime.now().year))
     
-    # Calculate start and end dates
-    start_date = datetime(year, month, 1)
-    if month == 12:
-        end_date = datetime(year + 1, 1, 1) - timedelta(days=1)
-    else:
-        end_date = datetime(year, month + 1, 1) - timedelta(days=1)
-    
-    # Generate PDF
-    pdf_buffer = generate_transaction_report_pdf(start_date, end_date)
+    job = submit_report_job('transactions', {'month': month, 'year': year})
     
-    # Create response
-    response = make_response(pdf_buffer.getvalue())
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = f'attachment; filename=laporan-transaksi-{month:02d}-{year}.pdf'
+    # Cached PDF for unchanged data is served straight away
+    if job.status == 'done':
+        return send_file(job.artifact_path, mimetype='application/pdf', as_attachment=True, download_name=job.filename)
     
-    return response
+    return render_template('report_job.html', job=report_job_payload(job))
 
 @app.route('/print_report')
 def print_report():
@@ -959,7 +958,7 @@ def print_report():
     # Get transactions
     transactions = Transaction.query.filter(
         Transaction.date >= start_date,
-        Transaction.date <= end_date
+        Transaction.date < end_date + timedelta(days=1)
     ).order_by(Transaction.date.desc()).all()
     
     # Calculate summary
@@ -987,79 +986,10 @@ def print_report():
 def api_analytics():
     """API endpoint for advanced analytics data"""
     try:
-        # Get last 30 days of transactions
-        thirty_days_ago = datetime.now() - timedelta(days=30)
-        transactions = Transaction.query.filter(
-            Transaction.date >= thirty_days_ago
-        ).all()
-        
-        # Calculate channel performance
-        channel_performance = {}
-        for transaction in transactions:
-            if transaction.type == 'income':
-                channel = transaction.channel
-                if channel not in channel_performance:
-                    channel_performance[channel] = {
-                        'revenue': 0, 'orders': 0, 'avgOrder': 0, 'growth': 0
-                    }
-                channel_performance[channel]['revenue'] += transaction.amount
-                channel_performance[channel]['orders'] += 1
-        
-        # Calculate average order values
-        for channel in channel_performance:
-            if channel_performance[channel]['orders'] > 0:
-                channel_performance[channel]['avgOrder'] = (
-                    channel_performance[channel]['revenue'] / 
-                    channel_performance[channel]['orders']
-                )
-        
-        # Generate daily trends
-        daily_trends = []
-        for i in range(30):
-            date = thirty_days_ago + timedelta(days=i)
-            daily_transactions = [t for t in transactions 
-                                if t.date.date() == date.date()]
-            
-            revenue = sum(t.amount for t in daily_transactions if t.type == 'income')
-            expenses = sum(t.amount for t in daily_transactions if t.type == 'expense')
-            orders = len([t for t in daily_transactions if t.type == 'income'])
-            
-            daily_trends.append({
-                'date': date.strftime('%Y-%m-%d'),
-                'revenue': revenue,
-                'expenses': expenses,
-                'orders': orders
-            })
-        
-        # Get top products (if product data exists)
-        products = Product.query.all()
-        top_products = []
-        for product in products[:5]:  # Top 5 products
-            # Calculate revenue from stock movements (simplified)
-            revenue = product.selling_price * max(0, product.current_stock)
-            top_products.append({
-                'name': product.name,
-                'revenue': revenue,
-                'units': product.current_stock
-            })
-        
-        # Sort by revenue
-        top_products.sort(key=lambda x: x['revenue'], reverse=True)
-        
-        return jsonify({
-            'channelPerformance': channel_performance,
-            'dailyTrends': daily_trends,
-            'topProducts': top_products[:5],
-            'forecast': {
-                'nextMonth': {
-                    'revenue': sum(t.amount for t in transactions if t.type == 'income') * 1.1,
-                    'orders': len([t for t in transactions if t.type == 'income']) + 10,
-                    'profit': (sum(t.amount for t in transactions if t.type == 'income') - 
-                             sum(t.amount for t in transactions if t.type == 'expense')) * 1.1
-                },
-                'confidence': 85.7
-            }
-        })
+        # Last 30 days from the daily rollup, one grouped scan
+        analytics = analytics_summary()
+        analytics['topProducts'] = top_products(5)
+        return jsonify(analytics)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1069,7 +999,7 @@ def api_export_user_data():
     try:
         # Gather all user data
         transactions = Transaction.query.all()
-        products = Product.query.all()
+        products = serialize_products()
         agents = Agent.query.all()
         agent_orders = AgentOrder.query.all()
         settings = BusinessSettings.query.first()
@@ -1078,7 +1008,7 @@ def api_export_user_data():
         # Convert to dictionaries
         data = {
             'transactions': [t.to_dict() for t in transactions],
-            'products': [p.to_dict() for p in products],
+            'products': products,
             'agents': [a.to_dict() for a in agents],
             'agent_orders': [ao.to_dict() for ao in agent_orders],
             'zakat_calculations': [zc.to_dict() for zc in zakat_calculations],
@@ -1117,17 +1047,32 @@ def api_export_user_data():
 def api_delete_user_data():
     """Delete all user data for PDPA compliance"""
     try:
+        # Generated report PDFs hold the same data; remove them once the rows are gone
+        artifacts = [job.artifact_path for job in ReportJob.query.filter(ReportJob.artifact_path.isnot(None))]
+        
         # Delete all data (in proper order to avoid foreign key constraints)
+        ReportJob.query.delete()
         StockMovement.query.delete()
         AgentOrder.query.delete()
+        AgentMonthlySales.query.delete()
         Agent.query.delete()
+        StockSnapshot.query.delete()
         Product.query.delete()
         ZakatCalculation.query.delete()
         Transaction.query.delete()
+        DailyLedgerRollup.query.delete()
         BusinessSettings.query.delete()
         
+        # Bulk deletes skip the rollup hooks: drop the cached breakdowns and forecasts too
+        notify_bulk_change(db.session.connection())
         db.session.commit()
         
+        for path in artifacts:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        
         return jsonify({'message': 'All user data has been permanently deleted'})
         
     except Exception as e:
@@ -1145,157 +1090,188 @@ def api_privacy_settings():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/generate-lhdn-report', methods=['POST'])
-def api_generate_lhdn_report():
-    """Generate LHDN compliant tax reports"""
-    try:
-        data = request.get_json()
-        report_type = data.get('type')
-        year = int(data.get('year', datetime.now().year))
-        tax_number = data.get('taxNumber', '')
-        sst_number = data.get('sstNumber', '')
-        
-        # Get transactions for the tax year
-        start_date = datetime(year, 1, 1)
-        end_date = datetime(year, 12, 31)
-        
-        transactions = Transaction.query.filter(
-            Transaction.date >= start_date,
-            Transaction.date <= end_date
-        ).all()
-        
-        # Calculate totals
-        total_income = sum(t.amount for t in transactions if t.type == 'income')
-        total_expenses = sum(t.amount for t in transactions if t.type == 'expense')
-        net_profit = total_income - total_expenses
-        
-        # Get business settings
-        settings = BusinessSettings.query.first()
-        
-        # Generate PDF report using ReportLab
-        from reportlab.lib.pagesizes import A4
-        from reportlab.pagesizes import letter
-        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib.units import inch
-        from reportlab.lib import colors
-        from io import BytesIO
-        
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4)
-        styles = getSampleStyleSheet()
-        
-        # Title style
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=16,
-            spaceAfter=30,
-            alignment=1  # Center
-        )
-        
-        # Report content
-        content = []
-        
-        if report_type == 'be':
-            title = f"BORANG BE - LAPORAN CUKAI PENDAPATAN INDIVIDU {year}"
-        elif report_type == 'c':
-            title = f"BORANG C - LAPORAN CUKAI SYARIKAT {year}"
-        else:
-            title = f"LAPORAN SST/GST {year}"
-        
-        content.append(Paragraph(title, title_style))
-        content.append(Spacer(1, 20))
-        
-        # Business info
-        if settings and settings.business_name:
-            content.append(Paragraph(f"<b>Nama Perniagaan:</b> {settings.business_name}", styles['Normal']))
-        
-        content.append(Paragraph(f"<b>No. Cukai Pendapatan:</b> {tax_number}", styles['Normal']))
-        if sst_number:
-            content.append(Paragraph(f"<b>No. SST:</b> {sst_number}", styles['Normal']))
-        
-        content.append(Spacer(1, 20))
-        
-        # Financial summary table
-        table_data = [
-            ['Keterangan', f'Jumlah (RM)'],
-            ['Jumlah Pendapatan', f'{total_income:,.2f}'],
-            ['Jumlah Perbelanjaan', f'{total_expenses:,.2f}'],
-            ['Keuntungan Bersih', f'{net_profit:,.2f}']
-        ]
-        
-        table = Table(table_data, colWidths=[3*inch, 2*inch])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+def generate_lhdn_report_pdf(report_type, year, tax_number='', sst_number=''):
+    """Generate LHDN compliant tax report PDF for a tax year"""
+    # Get totals for the tax year from the daily rollup
+    start_date = datetime(year, 1, 1)
+    end_date = datetime(year + 1, 1, 1)
+    
+    year_totals = totals_by_type(start_date, end_date)
+    total_income = year_totals['income']
+    total_expenses = year_totals['expense']
+    net_profit = total_income - total_expenses
+    
+    # Get business settings
+    settings = BusinessSettings.query.first()
+    
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    styles = getSampleStyleSheet()
+    
+    # Title style
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=16,
+        spaceAfter=30,
+        alignment=1  # Center
+    )
+    
+    # Report content
+    content = []
+    
+    if report_type == 'be':
+        title = f"BORANG BE - LAPORAN CUKAI PENDAPATAN INDIVIDU {year}"
+    elif report_type == 'c':
+        title = f"BORANG C - LAPORAN CUKAI SYARIKAT {year}"
+    else:
+        title = f"LAPORAN SST/GST {year}"
+    
+    content.append(Paragraph(title, title_style))
+    content.append(Spacer(1, 20))
+    
+    # Business info
+    if settings and settings.business_name:
+        content.append(Paragraph(f"<b>Nama Perniagaan:</b> {settings.business_name}", styles['Normal']))
+    
+    content.append(Paragraph(f"<b>No. Cukai Pendapatan:</b> {tax_number}", styles['Normal']))
+    if sst_number:
+        content.append(Paragraph(f"<b>No. SST:</b> {sst_number}", styles['Normal']))
+    
+    content.append(Spacer(1, 20))
+    
+    # Financial summary table
+    table_data = [
+        ['Keterangan', f'Jumlah (RM)'],
+        ['Jumlah Pendapatan', f'{total_income:,.2f}'],
+        ['Jumlah Perbelanjaan', f'{total_expenses:,.2f}'],
+        ['Keuntungan Bersih', f'{net_profit:,.2f}']
+    ]
+    
+    table = Table(table_data, colWidths=[3*inch, 2*inch])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    
+    content.append(table)
+    content.append(Spacer(1, 30))
+    
+    # Channel breakdown
+    channel_data = [['Saluran Jualan', 'Pendapatan (RM)']]
+    channels = totals_by_channel(start_date, end_date, 'income')
+    
+    for channel, amount in channels.items():
+        channel_names = {
+            'shopee': 'Shopee',
+            'tiktok': 'TikTok Shop',
+            'walkin': 'Jualan Tunai',
+            'agent': 'Ejen/Reseller',
+            'online': 'Online Lain'
+        }
+        channel_display = channel_names.get(channel, channel)
+        channel_data.append([channel_display, f'{amount:,.2f}'])
+    
+    if len(channel_data) > 1:
+        channel_table = Table(channel_data, colWidths=[3*inch, 2*inch])
+        channel_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
             ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
             ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
             ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
             ('GRID', (0, 0), (-1, -1), 1, colors.black)
         ]))
         
-        content.append(table)
-        content.append(Spacer(1, 30))
-        
-        # Channel breakdown
-        channel_data = [['Saluran Jualan', 'Pendapatan (RM)']]
-        channels = {}
-        for transaction in transactions:
-            if transaction.type == 'income':
-                channel = transaction.channel
-                if channel not in channels:
-                    channels[channel] = 0
-                channels[channel] += transaction.amount
-        
-        for channel, amount in channels.items():
-            channel_names = {
-                'shopee': 'Shopee',
-                'tiktok': 'TikTok Shop',
-                'walkin': 'Jualan Tunai',
-                'agent': 'Ejen/Reseller',
-                'online': 'Online Lain'
-            }
-            channel_display = channel_names.get(channel, channel)
-            channel_data.append([channel_display, f'{amount:,.2f}'])
-        
-        if len(channel_data) > 1:
-            channel_table = Table(channel_data, colWidths=[3*inch, 2*inch])
-            channel_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            
-            content.append(Paragraph("<b>Pecahan Pendapatan Mengikut Saluran:</b>", styles['Heading3']))
-            content.append(channel_table)
-        
-        content.append(Spacer(1, 30))
-        content.append(Paragraph(f"<b>Tarikh Jana Laporan:</b> {datetime.now().strftime('%d/%m/%Y')}", styles['Normal']))
-        content.append(Paragraph("<i>Laporan ini dijana secara automatik oleh PocketBizz dan mematuhi format LHDN Malaysia.</i>", styles['Italic']))
-        
-        # Build PDF
-        doc.build(content)
-        buffer.seek(0)
-        
-        # Return PDF
-        response = make_response(buffer.getvalue())
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = f'attachment; filename=LHDN-{report_type.upper()}-{year}.pdf'
+        content.append(Paragraph("<b>Pecahan Pendapatan Mengikut Saluran:</b>", styles['Heading3']))
+        content.append(channel_table)
+    
+    content.append(Spacer(1, 30))
+    content.append(Paragraph(f"<b>Tarikh Jana Laporan:</b> {datetime.now().strftime('%d/%m/%Y')}", styles['Normal']))
+    content.append(Paragraph("<i>Laporan ini dijana secara automatik oleh PocketBizz dan mematuhi format LHDN Malaysia.</i>", styles['Italic']))
+    
+    # Build PDF
+    doc.build(content)
+    buffer.seek(0)
+    return buffer
+
+@app.route('/api/generate-lhdn-report', methods=['POST'])
+def api_generate_lhdn_report():
+    """Queue LHDN compliant tax report generation"""
+    try:
+        data = request.get_json()
+        params = {
+            'report_type': data.get('type'),
+            'year': int(data.get('year', datetime.now().year)),
+            'tax_number': data.get('taxNumber', ''),
+            'sst_number': data.get('sstNumber', '')
+        }
         
-        buffer.close()
-        return response
+        job = submit_report_job('lhdn', params)
+        return jsonify(report_job_payload(job)), 200 if job.status == 'done' else 202
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# === BACKGROUND REPORT JOBS ===
+
+def month_report_period(params):
+    """Half-open date range covered by a monthly transaction report"""
+    start_date = datetime(params['year'], params['month'], 1)
+    if params['month'] == 12:
+        return start_date, datetime(params['year'] + 1, 1, 1)
+    return start_date, datetime(params['year'], params['month'] + 1, 1)
+
+def build_monthly_transaction_report(month, year):
+    """Report job builder for the monthly transaction PDF"""
+    start_date, next_month = month_report_period({'month': month, 'year': year})
+    return generate_transaction_report_pdf(start_date, next_month - timedelta(days=1))
+
+register_report(
+    'transactions',
+    builder=build_monthly_transaction_report,
+    period=month_report_period,
+    filename=lambda params: f"laporan-transaksi-{params['month']:02d}-{params['year']}.pdf"
+)
+
+register_report(
+    'lhdn',
+    builder=generate_lhdn_report_pdf,
+    period=lambda params: (datetime(params['year'], 1, 1), datetime(params['year'] + 1, 1, 1)),
+    filename=lambda params: f"LHDN-{(params['report_type'] or 'sst').upper()}-{params['year']}.pdf"
+)
+
+def report_job_payload(job):
+    """Job status plus the URLs the client polls and downloads from"""
+    payload = job.to_dict()
+    payload['status_url'] = url_for('api_report_job_status', job_id=job.id)
+    if job.status == 'done':
+        payload['download_url'] = url_for('download_report_job', job_id=job.id)
+    return payload
+
+@app.route('/api/report-jobs/<int:job_id>')
+def api_report_job_status(job_id):
+    """Poll the status of a background report job"""
+    job = ReportJob.query.get_or_404(job_id)
+    return jsonify(report_job_payload(job))
+
+@app.route('/report-jobs/<int:job_id>/download')
+def download_report_job(job_id):
+    """Download the PDF produced by a finished report job"""
+    job = ReportJob.query.get_or_404(job_id)
+    if job.status != 'done' or not job.artifact_path or not os.path.exists(job.artifact_path):
+        return jsonify({'error': 'Laporan belum siap'}), 409
+    
+    return send_file(job.artifact_path, mimetype='application/pdf', as_attachment=True, download_name=job.filename)
+
 @app.route('/api/smart-receipt-process', methods=['POST'])
 def api_smart_receipt_process():
     """Process receipt with smart categorization and organize files"""
@@ -1307,10 +1283,11 @@ def api_smart_receipt_process():
         image_data = data.get('imageData', '')  # Base64 image
         
         # Smart categorization logic
-        category = categorize_receipt_smart(ocr_text)
-        vendor = extract_vendor_from_text(ocr_text)
-        amount = extract_amount_from_text(ocr_text)
-        date_found = extract_date_from_text(ocr_text)
+        category = classify_receipt(ocr_text)
+        receipt = parse_receipt(ocr_text)
+        vendor = receipt['vendor']
+        amount = receipt['amount']
+        date_found = (receipt['date'] or datetime.now()).strftime('%d/%m/%Y')
         
         # Generate organized filename
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -1335,6 +1312,8 @@ def api_smart_receipt_process():
                 'amount': amount,
                 'date': date_found,
                 'category': category,
+                'sst': receipt['sst'],
+                'items': receipt['items'],
                 'filename': filename,
                 'file_path': file_path,
                 'view_url': f'/view-receipt/{category}/{filename}'
@@ -1344,6 +1323,25 @@ def api_smart_receipt_process():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Largest number of receipt texts classified in one request
+MAX_CLASSIFY_BATCH = 1000
+
+@app.route('/api/receipt-categories', methods=['POST'])
+def api_receipt_categories():
+    """Categorise many receipt OCR texts in one call (bulk re-categorisation)"""
+    data = request.get_json(silent=True) or {}
+    texts = data.get('texts')
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+        return jsonify({'error': 'texts must be a list of strings'}), 400
+    if len(texts) > MAX_CLASSIFY_BATCH:
+        return jsonify({'error': f'at most {MAX_CLASSIFY_BATCH} texts per request'}), 400
+    
+    with_scores = bool(data.get('scores'))
+    results = classify_receipts(texts, with_scores=with_scores)
+    if with_scores:
+        return jsonify({'results': [{'category': category, 'scores': scores} for category, scores in results]})
+    return jsonify({'results': [{'category': category} for category in results]})
+
 @app.route('/view-receipt/<category>/<filename>')
 def view_receipt(category, filename):
     """View organized receipt PDF"""
@@ -1394,90 +1392,6 @@ def api_receipt_folders():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def categorize_receipt_smart(ocr_text):
-    """Smart categorization based on OCR text"""
-    text = ocr_text.lower()
-    
-    # Category keywords mapping
-    categories = {
-        'makanan': ['restaurant', 'cafe', 'kedai makan', 'food', 'makan', 'restoran', 'mamak', 'mcd', 'kfc', 'pizza', 'burger', 'nasi', 'mee', 'kuih', 'minuman'],
-        'peralatan': ['hardware', 'tools', 'alat', 'peralatan', 'equipment', 'machinery', 'engine', 'motor', 'drill', 'hammer'],
-        'bekalan_pejabat': ['stationery', 'kertas', 'pen', 'paper', 'office', 'pejabat', 'supplies', 'printer', 'ink', 'stapler'],
-        'pengangkutan': ['petrol', 'minyak', 'transport', 'grab', 'taxi', 'toll', 'parking', 'bas', 'train', 'flight', 'fuel'],
-        'utiliti': ['electric', 'water', 'internet', 'phone', 'wifi', 'streamyx', 'celcom', 'maxis', 'digi', 'tnb', 'air', 'bill'],
-        'rawatan_kesihatan': ['hospital', 'clinic', 'doctor', 'ubat', 'medicine', 'pharmacy', 'dentist', 'medical', 'health'],
-        'pakaian': ['clothes', 'shirt', 'pants', 'shoes', 'fashion', 'baju', 'seluar', 'kasut', 'tudung', 'dress'],
-        'pemasaran': ['advertising', 'marketing', 'promotion', 'facebook', 'google', 'ads', 'banner', 'flyer', 'design'],
-        'sewa': ['rent', 'rental', 'sewa', 'office rent', 'shop rent', 'warehouse', 'premise'],
-        'insurans': ['insurance', 'insurans', 'takaful', 'coverage', 'policy', 'premium', 'protection']
-    }
-    
-    # Score each category
-    category_scores = {}
-    for category, keywords in categories.items():
-        score = sum(1 for keyword in keywords if keyword in text)
-        category_scores[category] = score
-    
-    # Return category with highest score, default to 'lain_lain'
-    best_category = max(category_scores.items(), key=lambda x: x[1])
-    return best_category[0] if best_category[1] > 0 else 'lain_lain'
-
-def extract_vendor_from_text(text):
-    """Extract vendor/business name from OCR text"""
-    lines = text.split('\n')
-    
-    # Look for vendor in first few lines
-    for line in lines[:5]:
-        line = line.strip()
-        if len(line) > 3 and len(line) < 50 and not line.isdigit():
-            # Skip lines that are mainly numbers/dates
-            if not any(char.isdigit() for char in line[:len(line)//2]):
-                return line.upper()
-    
-    return 'KEDAI TIDAK DIKENALI'
-
-def extract_amount_from_text(text):
-    """Extract amount from OCR text"""
-    import re
-    
-    # Look for RM patterns
-    patterns = [
-        r'rm\s*(\d+\.?\d*)',
-        r'(\d+\.?\d*)\s*rm',
-        r'total\s*:?\s*rm?\s*(\d+\.?\d*)',
-        r'jumlah\s*:?\s*rm?\s*(\d+\.?\d*)'
-    ]
-    
-    text_lower = text.lower()
-    
-    for pattern in patterns:
-        matches = re.findall(pattern, text_lower)
-        if matches:
-            try:
-                return float(matches[-1])  # Take the last (usually total) amount
-            except ValueError:
-                continue
-    
-    return 0.0
-
-def extract_date_from_text(text):
-    """Extract date from OCR text"""
-    import re
-    
-    # Date patterns
-    patterns = [
-        r'(\d{1,2}[\/\-]\d{1,2}[\/\-]\d{2,4})',
-        r'(\d{1,2}\s\w+\s\d{4})',
-        r'(\d{2,4}[\/\-]\d{1,2}[\/\-]\d{1,2})'
-    ]
-    
-    for pattern in patterns:
-        matches = re.findall(pattern, text)
-        if matches:
-            return matches[0]
-    
-    return datetime.now().strftime('%d/%m/%Y')
-
 def get_category_display_name(category):
     """Get display name for category"""
     display_names = {
@@ -1507,26 +1421,35 @@ def receipt_folders():
 @admin_required
 def admin_dashboard():
     """Admin dashboard with system overview and management tools"""
-    # Get system statistics
-    total_users = 1  # In real app, count from user table
-    total_transactions = Transaction.query.count()
-    
-    # Calculate revenue from all income transactions
-    income_transactions = Transaction.query.filter_by(type='income').all()
-    total_revenue = sum(t.amount for t in income_transactions)
-    
-    # Count active businesses (businesses with transactions in last 30 days)
-    thirty_days_ago = datetime.now() - timedelta(days=30)
-    recent_transactions = Transaction.query.filter(Transaction.date >= thirty_days_ago).all()
-    active_businesses = len(set(t.id for t in recent_transactions)) if recent_transactions else 1
+    # Get system statistics across every business
+    with all_tenants():
+        total_users = db.session.query(func.count(func.distinct(Transaction.tenant_id))).scalar() or 1
+        total_transactions = Transaction.query.count()
+        
+        # Calculate revenue from all income transactions
+        total_revenue = db.session.query(func.sum(Transaction.amount)).filter(
+            Transaction.type == 'income'
+        ).scalar() or 0
+        
+        # Count active businesses (businesses with transactions in last 30 days)
+        thirty_days_ago = datetime.now() - timedelta(days=30)
+        active_businesses = db.session.query(func.count(func.distinct(Transaction.tenant_id))).filter(
+            Transaction.date >= thirty_days_ago
+        ).scalar() or 1
     
     # User activity stats
     new_users_today = 0  # In real app, count users created today
     active_users_week = 1  # In real app, count users active in last 7 days
     premium_users = 0  # In real app, count premium subscriptions
     
-    # System metrics
-    api_calls_today = 150  # In real app, count from logs
+    # System metrics (request counters are per worker process, since its start)
+    route_metrics = metrics_snapshot()
+    api_calls_today = sum(row['requests'] for row in route_metrics)
+    api_errors = sum(row['errors'] for row in route_metrics)
+    avg_response_ms = round(
+        sum(row['total_seconds'] for row in route_metrics) * 1000 / api_calls_today, 1
+    ) if api_calls_today else 0
+    error_rate = round(api_errors * 100 / api_calls_today, 2) if api_calls_today else 0
     storage_used = round(total_transactions * 0.001, 2)  # Estimate storage usage
     
     return render_template('admin_dashboard.html',
@@ -1538,6 +1461,10 @@ def admin_dashboard():
                          active_users_week=active_users_week,
                          premium_users=premium_users,
                          api_calls_today=api_calls_today,
+                         avg_response_ms=avg_response_ms,
+                         error_rate=error_rate,
+                         route_metrics=route_metrics[:15],
+                         instrumentation_us=round(overhead_per_request() * 1e6, 1),
                          storage_used=storage_used,
                          current_date=datetime.now())
 
@@ -1562,9 +1489,16 @@ def admin_create_backup():
 def admin_export_users():
     """Export all user data for admin"""
     try:
-        # Get all business settings (representing users)
-        all_settings = BusinessSettings.query.all()
-        all_transactions = Transaction.query.all()
+        # Get all business settings (representing users) and per-business transaction counts
+        with all_tenants():
+            all_settings = BusinessSettings.query.all()
+            transaction_counts = dict(db.session.query(
+                Transaction.tenant_id, func.count(Transaction.id)
+            ).group_by(Transaction.tenant_id).all())
+            total_revenue = db.session.query(func.sum(Transaction.amount)).filter(
+                Transaction.type == 'income'
+            ).scalar() or 0
+        total_transactions = sum(transaction_counts.values())
         
         # Create comprehensive export
         admin_export = {
@@ -1572,20 +1506,21 @@ def admin_export_users():
             'export_date': datetime.now().isoformat(),
             'summary': {
                 'total_businesses': len(all_settings),
-                'total_transactions': len(all_transactions),
-                'total_revenue': sum(t.amount for t in all_transactions if t.type == 'income')
+                'total_transactions': total_transactions,
+                'total_revenue': total_revenue
             },
             'businesses': [
                 {
                     'id': settings.id,
+                    'tenant_id': settings.tenant_id,
                     'business_name': settings.business_name,
                     'welcome_name': settings.welcome_name,
                     'created_at': settings.created_at.isoformat() if settings.created_at else None,
-                    'transaction_count': len([t for t in all_transactions])
+                    'transaction_count': transaction_counts.get(settings.tenant_id, 0)
                 } for settings in all_settings
             ],
             'system_stats': {
-                'database_size': f"{len(all_transactions) * 0.001:.2f} GB",
+                'database_size': f"{total_transactions * 0.001:.2f} GB",
                 'last_backup': 'Manual export via admin panel',
                 'active_features': ['receipt_scanning', 'csv_import', 'agent_management', 'zakat_calculation']
             }
@@ -1691,7 +1626,8 @@ def product_variants():
     return render_template('product_variants.html',
                          products=products,
                          selected_product=selected_product,
-                         variants=variants)
+                         variants=variants,
+                         low_stock_threshold=stock_alert_settings()[1])
 
 @app.route('/add_product_variant', methods=['POST'])
 def add_product_variant():
@@ -1724,7 +1660,7 @@ def add_product_variant():
             cost_price=float(request.form['cost_price']),
             selling_price=float(request.form['selling_price']),
             current_stock=int(request.form.get('current_stock', 0)),
-            minimum_stock=int(request.form.get('minimum_stock', 5)),
+            minimum_stock=request.form.get('minimum_stock', type=int),  # blank: business threshold
             barcode=request.form.get('barcode')
         )
         
@@ -1740,6 +1676,7 @@ def add_product_variant():
         if variant.current_stock > 0:
             stock_movement = StockMovement(
                 product_id=product_id,
+                variant_id=variant.id,
                 movement_type='in',
                 quantity=variant.current_stock,
                 reference_type='initial_stock',
@@ -1876,16 +1813,13 @@ def api_check_notifications():
                     should_check_stock = True
             
             if should_check_stock:
-                low_stock_products = Product.query.filter(
-                    Product.current_stock <= Product.minimum_stock,
-                    Product.is_active == True
-                ).count()
+                low_stock_count = count_low_stock()
                 
-                if low_stock_products > 0:
+                if low_stock_count > 0:
                     notifications_to_show.append({
                         'type': 'low_stock_alert',
                         'title': '⚠️ Stok Rendah',
-                        'message': f'{low_stock_products} produk hampir habis stok!',
+                        'message': f'{low_stock_count} produk hampir habis stok!',
                         'action': 'view_inventory',
                         'url': '/inventory'
                     })